@@ -0,0 +1,350 @@
+import hashlib
+import json
+from datetime import date, datetime, timezone
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+
+from models import db, Member, FitnessClass, Payment, AttendanceRecord, FeeReminder
+from pagination import keyset_paginate
+from gym_time import parse_date_range, filter_date_range
+from table_versions import read_versions
+from member_search import search_members
+import attendance_archive
+
+# Read-only JSON API, /api/v1/<resource>.
+#
+#   GET /api/v1/payments?fields=id,amount,first_name&status=Completed
+#       &start=2024-05-01&end=2024-05-31&limit=100&after=<next_cursor>
+#
+# Lists use the same keyset cursors as the HTML pages. Every response carries
+# an ETag and Last-Modified derived from the TableVersion rows of the tables
+# it reads (table_versions.py) plus the query string, and those are checked
+# before the resource query runs: an unchanged poll costs one primary key
+# lookup and gets an empty 304.
+#
+#   GET /api/v1/members/search?q=ali 0300&limit=10
+#
+# is the typeahead behind the member pickers (member_search.py).
+#
+# Attendance includes the archived months (attendance_archive.py); a start/end
+# range keeps the query to the archive tables it covers.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# columns: name -> column (member names come from a join when selected);
+# filters: query argument -> column compared for equality;
+# flags: query argument -> condition applied when the argument is 1/true;
+# source: fn(connection, start, end) -> what to read instead of the model's
+# table, with the same columns (see Source)
+RESOURCES = {
+    'members': {
+        'model': Member,
+        'columns': {
+            'id': Member.id,
+            'first_name': Member.first_name,
+            'last_name': Member.last_name,
+            'email': Member.email,
+            'phone': Member.phone,
+            'date_of_birth': Member.date_of_birth,
+            'join_date': Member.join_date,
+            'membership_type': Member.membership_type,
+            'status': Member.status,
+        },
+        'filters': {'status': Member.status, 'membership_type': Member.membership_type},
+        'order_by': (Member.id,),
+        'descending': False,
+        'tables': ('member',),
+    },
+    'classes': {
+        'model': FitnessClass,
+        'columns': {
+            'id': FitnessClass.id,
+            'name': FitnessClass.name,
+            'description': FitnessClass.description,
+            'instructor': FitnessClass.instructor,
+            'room': FitnessClass.room,
+            'schedule': FitnessClass.schedule,
+            'duration': FitnessClass.duration,
+            'repeat_weekdays': FitnessClass.repeat_weekdays,
+            'repeat_interval': FitnessClass.repeat_interval,
+            'repeat_until': FitnessClass.repeat_until,
+            'capacity': FitnessClass.capacity,
+            'seats_taken': FitnessClass.seats_taken,
+        },
+        'filters': {'instructor': FitnessClass.instructor, 'room': FitnessClass.room},
+        'order_by': (FitnessClass.id,),
+        'descending': False,
+        'tables': ('fitness_class',),
+    },
+    'payments': {
+        'model': Payment,
+        'columns': {
+            'id': Payment.id,
+            'member_id': Payment.member_id,
+            'first_name': Member.first_name,
+            'last_name': Member.last_name,
+            'amount': Payment.amount,
+            'payment_date': Payment.payment_date,
+            'payment_method': Payment.payment_method,
+            'status': Payment.status,
+            'membership_type': Payment.membership_type,
+            'notes': Payment.notes,
+        },
+        'filters': {'member_id': Payment.member_id, 'status': Payment.status,
+                    'payment_method': Payment.payment_method},
+        'date_column': Payment.payment_date,
+        'utc': True,  # payment_date is stored in UTC
+        'order_by': (Payment.payment_date, Payment.id),
+        'descending': True,
+        'tables': ('payment', 'member'),
+    },
+    'attendance': {
+        'model': AttendanceRecord,
+        'columns': {
+            'id': AttendanceRecord.id,
+            'member_id': AttendanceRecord.member_id,
+            'first_name': Member.first_name,
+            'last_name': Member.last_name,
+            'check_in': AttendanceRecord.check_in,
+            'check_out': AttendanceRecord.check_out,
+            'attendance_type': AttendanceRecord.attendance_type,
+            'auto_checked_out': AttendanceRecord.auto_checked_out,
+            'device_id': AttendanceRecord.device_id,
+            'occurrence_id': AttendanceRecord.occurrence_id,
+            'notes': AttendanceRecord.notes,
+        },
+        'filters': {'member_id': AttendanceRecord.member_id, 'device_id': AttendanceRecord.device_id,
+                    'attendance_type': AttendanceRecord.attendance_type},
+        'flags': {'open': AttendanceRecord.check_out.is_(None)},
+        'date_column': AttendanceRecord.check_in,
+        'utc': False,
+        'order_by': (AttendanceRecord.check_in, AttendanceRecord.id),
+        'descending': True,
+        'tables': ('attendance_record', 'member'),
+        'source': attendance_archive.attendance_source,
+    },
+    'fee_reminders': {
+        'model': FeeReminder,
+        'columns': {
+            'id': FeeReminder.id,
+            'member_id': FeeReminder.member_id,
+            'first_name': Member.first_name,
+            'last_name': Member.last_name,
+            'reminder_date': FeeReminder.reminder_date,
+            'amount': FeeReminder.amount,
+            'status': FeeReminder.status,
+            'notes': FeeReminder.notes,
+        },
+        'filters': {'member_id': FeeReminder.member_id, 'status': FeeReminder.status},
+        'date_column': FeeReminder.reminder_date,
+        'utc': False,
+        'order_by': (FeeReminder.reminder_date, FeeReminder.id),
+        'descending': False,
+        'tables': ('fee_reminder', 'member'),
+    },
+}
+
+PAGING_ARGS = {'fields', 'limit', 'after', 'before', 'start', 'end'}
+MAX_SEARCH_RESULTS = 25
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return jsonify({'error': str(error)}), error.status
+
+
+@api.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'Authentication required'}), 401
+
+
+def get_resource(name):
+    if name not in RESOURCES:
+        raise ApiError(f'Unknown resource: {name}', 404)
+    return RESOURCES[name]
+
+
+def select_fields(spec, requested):
+    available = spec['columns']
+    if not requested:
+        return list(available)
+    fields = [field.strip() for field in requested.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown or not fields:
+        raise ApiError('Unknown fields: ' + ', '.join(unknown) if unknown else 'No fields selected')
+    return fields
+
+
+def parse_filter(column, value):
+    python_type = column.type.python_type
+    try:
+        if python_type is bool:
+            return value.lower() in ('1', 'true', 'yes')
+        return python_type(value)
+    except (ValueError, TypeError):
+        raise ApiError(f'Invalid value for {column.key}: {value}')
+
+
+def to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def validators(spec):
+    """(etag, last_modified) of ``spec``'s tables as of now and the request's
+    query string."""
+    versions = read_versions(spec['tables'])
+    key = json.dumps([request.path, sorted(request.args.items(multi=True)),
+                      sorted((name, version) for name, (version, _) in versions.items())])
+    etag = hashlib.sha1(key.encode()).hexdigest()[:32]
+    moments = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+    last_modified = max(moments).replace(tzinfo=timezone.utc, microsecond=0) if moments else None
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(spec, render):
+    """Answer 304 when the client's copy is current, otherwise call
+    ``render`` for the response body."""
+    etag, last_modified = validators(spec)
+    if is_not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep the response but must revalidate it every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class Source:
+    """The table a resource is read from: the model's own, or its ``source``
+    for the requested date range. column() rewrites the model's columns
+    and conditions to match."""
+
+    def __init__(self, spec, start=None, end=None):
+        self.selectable = None
+        if 'source' in spec:
+            self.selectable = spec['source'](db.session.connection(), start, end)
+
+    def column(self, expression):
+        if self.selectable is None:
+            return expression
+        return attendance_archive.adapt(self.selectable, expression)
+
+
+def build_query(spec, fields, source):
+    model = spec['model']
+    columns = dict((name, spec['columns'][name]) for name in fields)
+    # The sort columns are always fetched, under their own names, for the cursors
+    for column in spec['order_by']:
+        columns.setdefault(column.key, column)
+    query = db.session.query(*[source.column(column).label(name) for name, column in columns.items()])
+    query = query.select_from(model if source.selectable is None else source.selectable)
+    if model is not Member and any(column.class_ is Member for column in columns.values()):
+        # Outer, as archived check-ins can outlive their member
+        query = query.outerjoin(Member, Member.id == source.column(model.member_id))
+    return query
+
+
+@api.route('/<resource>')
+def list_resource(resource):
+    spec = get_resource(resource)
+    unknown = set(request.args) - PAGING_ARGS - set(spec['filters']) - set(spec.get('flags', ()))
+    if unknown:
+        raise ApiError('Unknown arguments: ' + ', '.join(sorted(unknown)))
+    fields = select_fields(spec, request.args.get('fields'))
+    try:
+        limit = int(request.args.get('limit', current_app.config['LIST_PAGE_SIZE']))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    if not 1 <= limit <= current_app.config['API_MAX_PAGE_SIZE']:
+        raise ApiError(f"limit must be between 1 and {current_app.config['API_MAX_PAGE_SIZE']}")
+
+    def render():
+        start = end = None
+        if 'date_column' in spec:
+            try:
+                start, end = parse_date_range(request.args)
+            except ValueError as e:
+                raise ApiError(str(e))
+        source = Source(spec, start, end)
+        query = build_query(spec, fields, source)
+        for name, column in spec['filters'].items():
+            if name in request.args:
+                query = query.filter(source.column(column) == parse_filter(column, request.args[name]))
+        for name, condition in spec.get('flags', {}).items():
+            if request.args.get(name, '').lower() in ('1', 'true', 'yes'):
+                query = query.filter(source.column(condition))
+        if start is not None or end is not None:
+            query = filter_date_range(query, source.column(spec['date_column']), start, end, utc=spec['utc'])
+
+        page = keyset_paginate(
+            query, [source.column(column) for column in spec['order_by']],
+            after=request.args.get('after'), before=request.args.get('before'),
+            per_page=limit, descending=spec['descending']
+        )
+        return {
+            'data': [{name: to_json(getattr(row, name)) for name in fields} for row in page],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        }
+
+    return conditional(spec, render)
+
+
+@api.route('/members/search')
+def search_members_route():
+    query = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        raise ApiError(f'limit must be between 1 and {MAX_SEARCH_RESULTS}')
+
+    def render():
+        return {'data': [
+            {'id': row.id, 'name': f'{row.first_name} {row.last_name}', 'email': row.email,
+             'phone': row.phone, 'membership_type': row.membership_type, 'status': row.status}
+            for row in search_members(query, limit)
+        ]}
+
+    return conditional(RESOURCES['members'], render)
+
+
+@api.route('/<resource>/<int:item_id>')
+def get_item(resource, item_id):
+    spec = get_resource(resource)
+    unknown = set(request.args) - {'fields'}
+    if unknown:
+        raise ApiError('Unknown arguments: ' + ', '.join(sorted(unknown)))
+    fields = select_fields(spec, request.args.get('fields'))
+
+    def render():
+        source = Source(spec)
+        row = build_query(spec, fields, source).filter(source.column(spec['model'].id) == item_id).first()
+        if row is None:
+            raise ApiError(f'{resource} {item_id} not found', 404)
+        return {'data': {name: to_json(getattr(row, name)) for name in fields}}
+
+    return conditional(spec, render)
@@ -0,0 +1,264 @@
+import logging
+import time
+from datetime import date, datetime
+
+from sqlalchemy import (Column, Index, MetaData, Table, cast, delete, insert, inspect, null, select, text, tuple_,
+                        union_all, update)
+from sqlalchemy.sql.util import ClauseAdapter
+
+from models import db, AttendanceRecord, AttendanceArchive, Member
+from pagination import KeysetPage, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Attendance retention.
+#
+# Check-ins older than the retention horizon are moved, whole months at a
+# time, out of attendance_record into one table per month,
+# attendance_archive_YYYY_MM, and the AttendanceArchive catalog records each
+# table with its row count and check-in range. The move runs in chunks, each
+# chunk an INSERT ... SELECT into the archive and a DELETE from the live table
+# in one transaction. Being Core statements they leave the daily counts and
+# occupancy buckets alone, so the reports keep the archived months.
+#
+# The history page pages by seek on (check_in, id) without counting rows. It
+# reads the live table first and only goes on to the archive tables (newest
+# first, skipped by their catalog range) when a page reaches back that far.
+#
+# The export and the JSON API read attendance_source(), attendance_record
+# plus, as a UNION ALL, the archive tables whose range meets the requested
+# dates.
+#
+# Deleted rows leave free pages in SQLite. New databases are created with
+# auto_vacuum=INCREMENTAL (see database.py) and the archive job gives a number
+# of pages back per run; `flask vacuum-db` converts older databases.
+
+HISTORY_COLUMNS = (AttendanceRecord.check_in, AttendanceRecord.id)
+
+_live = AttendanceRecord.__table__
+_catalog = AttendanceArchive.__table__
+_archive_metadata = MetaData()
+_archived_columns = {}  # archive table -> columns it has
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def archive_table(month):
+    """The Table for ``month``'s archive; same columns as attendance_record,
+    without foreign keys, so archived rows outlive their member."""
+    name = f"attendance_archive_{month:%Y_%m}"
+    table = _archive_metadata.tables.get(name)
+    if table is None:
+        table = Table(
+            name, _archive_metadata,
+            *[Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False,
+                     nullable=column.nullable)
+              for column in _live.columns],
+            Index(f'ix_{name}_check_in_id', 'check_in', 'id'),
+            Index(f'ix_{name}_member_id', 'member_id'),
+        )
+    return table
+
+
+def archived_months(connection, newest_first=True):
+    order = _catalog.c.month.desc() if newest_first else _catalog.c.month.asc()
+    return connection.execute(select(_catalog).order_by(order)).all()
+
+
+def attendance_tables(connection):
+    """attendance_record and every archive table, for code that needs all
+    the check-ins ever recorded (rebuilding the daily counts and buckets)."""
+    return [_live] + [archive_table(row.month) for row in archived_months(connection)]
+
+
+def archived_columns(connection, table):
+    """Names of the columns ``table`` has in the database; tables archived
+    before a column was added to attendance_record lack it."""
+    columns = _archived_columns.get(table.name)
+    if columns is None:
+        columns = {column['name'] for column in inspect(connection).get_columns(table.name)}
+        _archived_columns[table.name] = columns
+    return columns
+
+
+def attendance_source(connection, start=None, end=None):
+    """attendance_record, or, when archived months overlap [start, end), a
+    subquery of it and those archive tables with attendance_record's
+    columns. adapt() points AttendanceRecord expressions at it."""
+    archives = [
+        archive for archive in archived_months(connection)
+        if (end is None or archive.first_check_in < end) and (start is None or archive.last_check_in >= start)
+    ]
+    if not archives:
+        return _live
+    selects = [select(*_live.columns)]
+    for archive in archives:
+        table = archive_table(archive.month)
+        existing = archived_columns(connection, table)
+        selects.append(select(*[
+            table.c[column.name] if column.name in existing else cast(null(), column.type).label(column.name)
+            for column in _live.columns
+        ]))
+    return union_all(*selects).subquery('attendance')
+
+
+def adapt(source, expression):
+    """``expression`` (a column or condition on AttendanceRecord) rewritten
+    against ``source`` from attendance_source()."""
+    expression = expression.expression
+    if source is _live:
+        return expression
+    return ClauseAdapter(source).traverse(expression)
+
+
+def _record_archived(connection, month, table, count, first_check_in, last_check_in):
+    now = datetime.utcnow()
+    existing = connection.execute(select(_catalog).where(_catalog.c.month == month)).first()
+    if existing is None:
+        connection.execute(insert(_catalog).values(
+            month=month, table_name=table.name, records=count,
+            first_check_in=first_check_in, last_check_in=last_check_in, archived_at=now
+        ))
+        return
+    connection.execute(update(_catalog).where(_catalog.c.month == month).values(
+        records=_catalog.c.records + count,
+        first_check_in=min(existing.first_check_in or first_check_in, first_check_in),
+        last_check_in=max(existing.last_check_in or last_check_in, last_check_in),
+        archived_at=now
+    ))
+
+
+def archive_attendance(before, chunk_size=5000):
+    """Move every record that checked in before ``before`` (a date, rounded
+    down to the start of its month) into the monthly archive tables,
+    ``chunk_size`` records per transaction, oldest first."""
+    started = time.perf_counter()
+    cutoff = datetime.combine(month_start(before), datetime.min.time())
+    result = {'archived': 0, 'chunks': 0, 'months': []}
+    columns = {}  # archive table -> the live columns it has
+
+    while True:
+        with db.engine.begin() as connection:
+            chunk = connection.execute(
+                select(_live.c.id, _live.c.check_in)
+                .where(_live.c.check_in < cutoff)
+                .order_by(_live.c.check_in, _live.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not chunk:
+                break
+
+            by_month = {}
+            for row in chunk:
+                by_month.setdefault(month_start(row.check_in), []).append(row)
+            for month, rows in by_month.items():
+                table = archive_table(month)
+                if table.name not in columns:
+                    table.create(connection, checkfirst=True)
+                    existing = archived_columns(connection, table)
+                    columns[table.name] = [column.name for column in _live.columns if column.name in existing]
+                ids = [row.id for row in rows]
+                names = columns[table.name]
+                connection.execute(insert(table).from_select(
+                    names, select(*[_live.c[name] for name in names]).where(_live.c.id.in_(ids))
+                ))
+                connection.execute(delete(_live).where(_live.c.id.in_(ids)))
+                _record_archived(connection, month, table, len(rows), rows[0].check_in, rows[-1].check_in)
+                if month.isoformat() not in result['months']:
+                    result['months'].append(month.isoformat())
+
+        result['chunks'] += 1
+        result['archived'] += len(chunk)
+        if len(chunk) < chunk_size:
+            break
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info("Attendance archive: %(archived)d records in %(chunks)d chunks in %(seconds).3fs", result)
+    return result
+
+
+def incremental_vacuum(pages):
+    """Give up to ``pages`` free pages back to the file system. Only SQLite
+    databases in auto_vacuum=INCREMENTAL mode have any; returns the number of
+    pages freed."""
+    with db.engine.connect() as connection:
+        if connection.dialect.name != 'sqlite' or \
+                connection.scalar(text('PRAGMA auto_vacuum')) != 2:
+            return 0
+        free = connection.scalar(text('PRAGMA freelist_count'))
+        connection.commit()
+        # The pragma frees one page per step and sqlite3's execute() only
+        # steps once; executescript() runs it to the end
+        connection.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        return free - connection.scalar(text('PRAGMA freelist_count'))
+
+
+def vacuum_database():
+    """Rebuild the SQLite file with VACUUM, which also switches a database
+    created before auto_vacuum was configured to incremental mode."""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if connection.dialect.name != 'sqlite':
+            return None
+        connection.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+        connection.execute(text('VACUUM'))
+        return connection.scalar(text('PRAGMA auto_vacuum'))
+
+
+# History browsing
+def _history_query(table, seek, descending, limit):
+    statement = (
+        select(table.c.id, table.c.member_id, table.c.check_in, table.c.check_out,
+               table.c.attendance_type, table.c.auto_checked_out, Member.first_name, Member.last_name)
+        .select_from(table)
+        .outerjoin(Member, Member.id == table.c.member_id)
+    )
+    row_key = tuple_(table.c.check_in, table.c.id)
+    if seek is not None:
+        statement = statement.where(row_key < tuple_(*seek) if descending else row_key > tuple_(*seek))
+    order = [table.c.check_in.desc(), table.c.id.desc()] if descending else \
+        [table.c.check_in.asc(), table.c.id.asc()]
+    return db.session.execute(statement.order_by(*order).limit(limit)).all()
+
+
+def history_page(after=None, before=None, per_page=50):
+    """One KeysetPage of attendance, newest first, over attendance_record
+    and the archive tables. ``after``/``before`` are the page's
+    next_cursor/prev_cursor, as for pagination.keyset_paginate()."""
+    after_key = decode_cursor(after, HISTORY_COLUMNS)
+    before_key = decode_cursor(before, HISTORY_COLUMNS) if after_key is None else None
+    backwards = before_key is not None
+    seek = before_key if backwards else after_key
+    # Walking forwards the newest rows older than the cursor come first;
+    # backwards the oldest rows newer than it, put back in order below
+    descending = not backwards
+    limit = per_page + 1
+
+    def sort_key(row):
+        return (row.check_in, row.id)
+
+    rows = list(_history_query(_live, seek, descending, limit))
+    # Archives cover disjoint months, older than the live table's rows save
+    # for any not archived yet; each one is read only if the page may need it
+    for archive in archived_months(db.session.connection(), newest_first=descending):
+        if seek is not None:
+            if descending and archive.first_check_in > seek[0]:
+                continue
+            if not descending and archive.last_check_in < seek[0]:
+                continue
+        if len(rows) >= limit:
+            rows.sort(key=sort_key, reverse=descending)
+            boundary = rows[limit - 1].check_in
+            if (descending and archive.last_check_in < boundary) or \
+                    (not descending and archive.first_check_in > boundary):
+                break
+        rows.extend(_history_query(archive_table(archive.month), seek, descending, limit))
+
+    rows.sort(key=sort_key, reverse=descending)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        return KeysetPage(rows, list(HISTORY_COLUMNS), has_next=True, has_prev=has_more)
+    return KeysetPage(rows, list(HISTORY_COLUMNS), has_next=has_more, has_prev=after_key is not None)
@@ -0,0 +1,152 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import insert, select
+
+from models import db, AttendanceRecord
+from stats import count_check_ins
+from occupancy import record_movements
+
+logger = logging.getLogger(__name__)
+
+
+def insert_attendance(connection, rows):
+    """Bulk insert attendance rows and update the counters that the ORM
+    listeners would otherwise maintain."""
+    if not rows:
+        return
+    connection.execute(insert(AttendanceRecord.__table__), rows)
+    count_check_ins(connection, [row['check_in'] for row in rows])
+    record_movements(connection, [row['check_in'] for row in rows],
+                     [row.get('check_out') for row in rows])
+
+
+def skip_stored_sequences(connection, batches):
+    """``batches`` (lists of rows) without the rows whose (device_id,
+    device_sequence) is already stored or came earlier in ``batches``, so a
+    device's retried events are written once."""
+    table = AttendanceRecord.__table__
+    wanted = {}
+    for batch in batches:
+        for row in batch:
+            if row.get('device_sequence') is not None:
+                wanted.setdefault(row['device_id'], set()).add(row['device_sequence'])
+    seen = set()
+    for device_id, sequences in wanted.items():
+        sequences = sorted(sequences)
+        for start in range(0, len(sequences), 500):
+            seen.update((device_id, sequence) for sequence in connection.scalars(
+                select(table.c.device_sequence).where(
+                    table.c.device_id == device_id, table.c.device_sequence.in_(sequences[start:start + 500])
+                )
+            ))
+
+    fresh = []
+    for batch in batches:
+        kept = []
+        for row in batch:
+            if row.get('device_sequence') is not None:
+                key = (row['device_id'], row['device_sequence'])
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(row)
+        fresh.append(kept)
+    return fresh
+
+
+class AttendanceWriter:
+    """Write-behind buffer for check-ins.
+
+    Request threads hand rows to submit() and get a Future back. A single
+    background thread drains the queue and group-commits everything that
+    arrived within ``flush_interval`` seconds (or ``batch_size`` rows) in one
+    transaction, so eight turnstiles firing at once cost one SQLite write
+    lock instead of eight. Should that transaction fail, each submission is
+    retried in its own, so one bad row only fails its own request. Rows
+    with a device_sequence already stored are skipped; the Future gives the
+    number of rows written.
+    """
+
+    def __init__(self, app, batch_size=500, flush_interval=0.05):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, rows):
+        future = Future()
+        if not rows:
+            future.set_result(0)
+            return future
+        self._ensure_started()
+        self._queue.put((rows, future))
+        return future
+
+    def stop(self, timeout=5):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='attendance-writer', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            row_count = len(item[0])
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+
+            while row_count < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                pending.append(item)
+                row_count += len(item[0])
+
+            self._flush(pending)
+            if stopping:
+                return
+
+    def _flush(self, pending):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    batches = skip_stored_sequences(connection, [batch for batch, _ in pending])
+                    insert_attendance(connection, [row for batch in batches for row in batch])
+        except Exception as e:
+            if len(pending) > 1:
+                logger.warning("Attendance group commit of %d requests failed, retrying them one by one: %s",
+                               len(pending), e)
+                for item in pending:
+                    self._flush([item])
+                return
+            logger.exception("Attendance commit of %d rows failed", len(pending[0][0]))
+            pending[0][1].set_exception(e)
+            return
+        for batch, (_, future) in zip(batches, pending):
+            future.set_result(len(batch))
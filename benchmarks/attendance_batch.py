@@ -0,0 +1,96 @@
+"""Check-in ingestion benchmark.
+
+Compares one-request-per-swipe /check_in_code against the batched
+/api/attendance/batch endpoint with several simulated turnstiles posting at
+once, against a throwaway SQLite database:
+
+    python -m benchmarks.attendance_batch --threads 8 --batch 200 --seconds 5
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+
+def setup_database(member_count):
+    from app import create_app, create_admin_user
+    from models import db, Member
+    from sqlalchemy import insert
+
+    app = create_app({'SCHEDULER_ENABLED': False})
+    create_admin_user(app)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(insert(Member.__table__), [
+                {
+                    'first_name': 'Bench',
+                    'last_name': str(i),
+                    'email': f'bench{i}@example.com',
+                    'membership_type': 'Basic',
+                    'status': 'Active'
+                }
+                for i in range(member_count)
+            ])
+    return app
+
+
+def run_threads(app, threads, seconds, work):
+    counts = [0] * threads
+    stop_at = time.perf_counter() + seconds
+
+    def worker(slot):
+        client = app.test_client()
+        # Unkeyed batches need a login
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        while time.perf_counter() < stop_at:
+            counts[slot] += work(client)
+
+    pool = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(counts), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gym-bench-')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    app = setup_database(args.members)
+
+    def single(client):
+        code = str(random.randint(1, args.members))
+        response = client.post('/check_in_code', data={'code': code})
+        return 1 if response.get_json()['success'] else 0
+
+    def batched(client):
+        events = [
+            {'member_code': str(random.randint(1, args.members))}
+            for _ in range(args.batch)
+        ]
+        response = client.post('/api/attendance/batch', json={'events': events})
+        return response.get_json()['recorded']
+
+    for name, work in (('single', single), ('batch', batched)):
+        events, elapsed = run_threads(app, args.threads, args.seconds, work)
+        print(f"{name:>6}: {events} check-ins in {elapsed:.2f}s "
+              f"= {events / elapsed:,.0f}/s with {args.threads} threads")
+
+    from models import db, AttendanceRecord
+    with app.app_context():
+        print(f"rows stored: {db.session.query(AttendanceRecord).count()}")
+    app.extensions['attendance_writer'].stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Concurrent class registration benchmark.
+
+Fires hundreds of simultaneous registrations at one class through the
+registration engine and checks that it never overbooks, that everybody else
+lands on the waitlist, and that cancellations promote the waitlist in FIFO
+order:
+
+    python -m benchmarks.class_registration --threads 300 --capacity 40
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=300)
+    parser.add_argument('--capacity', type=int, default=40)
+    parser.add_argument('--cancellations', type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gym-bench-')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    from sqlalchemy import func, insert, select
+    from app import create_app, create_admin_user
+    from models import db, Member, FitnessClass, ClassRegistration, WaitlistEntry
+    import registrations
+
+    app = create_app({'SCHEDULER_ENABLED': False})
+    create_admin_user(app)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(insert(Member.__table__), [
+                {'first_name': 'Bench', 'last_name': str(i), 'email': f'bench{i}@example.com',
+                 'membership_type': 'Basic', 'status': 'Active'}
+                for i in range(args.threads)
+            ])
+            class_id = connection.execute(insert(FitnessClass.__table__).values(
+                name='Spin', instructor='Bench', schedule=datetime(2030, 1, 1, 7),
+                duration=45, capacity=args.capacity, seats_taken=0
+            )).inserted_primary_key[0]
+
+    barrier = threading.Barrier(args.threads)
+    outcomes = []
+    latencies = []
+    lock = threading.Lock()
+
+    def register(member_id):
+        with app.app_context():
+            barrier.wait()
+            started = time.perf_counter()
+            outcome = registrations.register_member(member_id, class_id)
+            elapsed = time.perf_counter() - started
+        with lock:
+            outcomes.append(outcome)
+            latencies.append(elapsed)
+
+    threads = [threading.Thread(target=register, args=(member_id,))
+               for member_id in range(1, args.threads + 1)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.threads} concurrent registrations in {elapsed:.2f}s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms")
+    print({outcome: outcomes.count(outcome) for outcome in set(outcomes)})
+
+    with app.app_context():
+        def counts():
+            with db.engine.connect() as connection:
+                return (
+                    connection.scalar(select(FitnessClass.seats_taken).where(FitnessClass.id == class_id)),
+                    connection.scalar(select(func.count()).select_from(ClassRegistration)),
+                    connection.scalar(select(func.count()).select_from(WaitlistEntry)),
+                )
+
+        seats, registered, waiting = counts()
+        assert seats == registered == args.capacity, (seats, registered)
+        assert waiting == args.threads - args.capacity, waiting
+        print(f"no overbooking: {registered} registered, seats_taken={seats}, {waiting} waitlisted")
+
+        with db.engine.connect() as connection:
+            queue = list(connection.scalars(
+                select(WaitlistEntry.member_id).order_by(WaitlistEntry.id).limit(args.cancellations)
+            ))
+            cancel = list(connection.scalars(
+                select(ClassRegistration.id).order_by(ClassRegistration.id).limit(args.cancellations)
+            ))
+        promoted = [registrations.cancel_registration(registration_id)[1] for registration_id in cancel]
+        assert promoted == queue, (promoted, queue)
+        seats, registered, waiting = counts()
+        assert seats == registered == args.capacity
+        print(f"{len(cancel)} cancellations promoted the waitlist in FIFO order")
+
+
+if __name__ == '__main__':
+    main()
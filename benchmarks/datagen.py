@@ -0,0 +1,256 @@
+"""Synthetic gym data generator.
+
+Fills a database with members and their history (monthly payments and fee
+reminders, check-ins, class registrations) at a chosen scale, with Core bulk
+inserts built from the tables in models.py. The history ends on the anchor
+date (--anchor-date, a fixed day rather than today), so the same scale and
+seed always give the same data. The counters, rollups and search index that the ORM listeners
+normally keep up to date are rebuilt at the end.
+
+    python -m benchmarks.datagen --database /tmp/gym-bench.db --members 5000 --years 2
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+FIRST_NAMES = ('Ali', 'Sara', 'Ahmed', 'Fatima', 'Usman', 'Ayesha', 'Bilal', 'Zainab', 'Hamza', 'Maryam',
+               'Omar', 'Hira', 'Danish', 'Sana', 'Imran', 'Nadia', 'John', 'Maria', 'David', 'Emma')
+LAST_NAMES = ('Khan', 'Ahmed', 'Malik', 'Hussain', 'Sheikh', 'Qureshi', 'Butt', 'Chaudhry', 'Raza', 'Iqbal',
+              'Smith', 'Jones', 'Brown', 'Garcia', 'Wilson')
+MEMBERSHIP_TYPES = (('Basic', 0.6), ('Premium', 0.3), ('VIP', 0.1))
+PAYMENT_METHODS = (('Cash', 0.5), ('Credit Card', 0.3), ('Bank Transfer', 0.2))
+CLASS_NAMES = ('Spin', 'Yoga', 'HIIT', 'Pilates', 'Boxing', 'Zumba', 'CrossFit', 'Stretch')
+DEFAULT_ANCHOR_DATE = date(2025, 6, 30)
+
+
+class Scale:
+    def __init__(self, members=1000, years=1, visits_per_week=3, classes=20, registrations_per_class=25,
+                 seed=42, anchor_date=DEFAULT_ANCHOR_DATE):
+        self.members = members
+        self.years = years
+        self.visits_per_week = visits_per_week
+        self.classes = classes
+        self.registrations_per_class = registrations_per_class
+        self.seed = seed
+        self.anchor_date = anchor_date  # the generated "today"
+
+    def as_dict(self):
+        return dict(vars(self), anchor_date=self.anchor_date.isoformat())
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def insert_chunked(connection, table, rows, chunk_size=10000):
+    """Bulk insert an iterable of row dicts in chunks; returns the row count."""
+    from sqlalchemy import insert
+
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            connection.execute(insert(table), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def member_rows(rng, scale, first_id, today):
+    history_days = scale.years * 365
+    for member_id in range(first_id, first_id + scale.members):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        yield {
+            'id': member_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f'{first_name.lower()}.{last_name.lower()}{member_id}@example.com',
+            'phone': f'0300{rng.randrange(10 ** 7):07d}',
+            'date_of_birth': today - timedelta(days=rng.randrange(18 * 365, 60 * 365)),
+            # Everybody joins within the history window, most of them early on
+            'join_date': today - timedelta(days=int(history_days * rng.random() ** 0.5)),
+            'membership_type': weighted(rng, MEMBERSHIP_TYPES),
+            'status': weighted(rng, (('Active', 0.85), ('Inactive', 0.1), ('Suspended', 0.05))),
+        }
+
+
+def billing_rows(rng, members, today):
+    """(payments, fee reminders): a reminder every 30 days from joining, paid
+    except for the latest one, which is still Pending."""
+    from models import MEMBERSHIP_FEES
+
+    payments = []
+    reminders = []
+    for member in members:
+        fee = MEMBERSHIP_FEES[member['membership_type']]
+        due = member['join_date'] + timedelta(days=30)
+        while True:
+            next_due = due + timedelta(days=30)
+            current = next_due > today
+            reminders.append({
+                'member_id': member['id'], 'reminder_date': due, 'amount': fee,
+                'status': 'Pending' if current else 'Paid',
+                'rolled_over_at': None if current else datetime.combine(due, datetime.min.time()),
+            })
+            if current:
+                break
+            paid_at = datetime.combine(due, datetime.min.time()) + timedelta(
+                days=rng.randrange(-3, 7), hours=rng.randrange(9, 21), minutes=rng.randrange(60))
+            payments.append({
+                'member_id': member['id'], 'amount': fee, 'payment_date': paid_at,
+                'payment_method': weighted(rng, PAYMENT_METHODS),
+                'status': weighted(rng, (('Completed', 0.97), ('Failed', 0.02), ('Pending', 0.01))),
+                'membership_type': member['membership_type'],
+            })
+            due = next_due
+    return payments, reminders
+
+
+def attendance_rows(rng, members, scale, today):
+    # Visits spread over the days since joining; yesterday and before are
+    # checked out, a few of today's are still open
+    visit_chance = scale.visits_per_week / 7.0
+    for member in members:
+        day = member['join_date']
+        while day <= today:
+            if rng.random() < visit_chance:
+                check_in = datetime.combine(day, datetime.min.time()) + timedelta(
+                    hours=rng.randrange(6, 22), minutes=rng.randrange(60))
+                check_out = check_in + timedelta(minutes=rng.randrange(30, 120))
+                yield {
+                    'member_id': member['id'], 'check_in': check_in,
+                    'check_out': None if day == today and rng.random() < 0.3 else check_out,
+                    'attendance_type': weighted(rng, (('biometric', 0.7), ('code', 0.25), ('manual', 0.05))),
+                    'auto_checked_out': False,
+                }
+            day += timedelta(days=1)
+
+
+def class_rows(rng, scale, today):
+    monday = today - timedelta(days=today.weekday())
+    for index in range(scale.classes):
+        start = datetime.combine(monday, datetime.min.time()) + timedelta(
+            days=rng.randrange(7), hours=rng.randrange(6, 21))
+        yield {
+            'name': f'{rng.choice(CLASS_NAMES)} {index + 1}',
+            'description': 'Generated for benchmarks',
+            'instructor': f'Instructor {rng.randrange(max(1, scale.classes // 3))}',
+            'room': f'Studio {rng.randrange(4) + 1}',
+            'schedule': start - timedelta(weeks=rng.randrange(52)),
+            'duration': rng.choice((45, 60, 90)),
+            'repeat_weekdays': str(start.weekday()),
+            'repeat_interval': 1,
+            'capacity': scale.registrations_per_class + rng.randrange(10),
+            'seats_taken': 0,
+        }
+
+
+def generate(connection, scale, today):
+    """Insert a dataset of ``scale`` into the (migrated) database on
+    ``connection``; returns {table: rows inserted}."""
+    from sqlalchemy import func, select, update
+    from models import Member, Payment, FeeReminder, AttendanceRecord, FitnessClass, ClassRegistration
+
+    rng = random.Random(scale.seed)
+    counts = {}
+    first_id = (connection.scalar(select(func.max(Member.id))) or 0) + 1
+    members = list(member_rows(rng, scale, first_id, today))
+    counts['member'] = insert_chunked(connection, Member.__table__, members)
+
+    payments, reminders = billing_rows(rng, members, today)
+    counts['payment'] = insert_chunked(connection, Payment.__table__, payments)
+    counts['fee_reminder'] = insert_chunked(connection, FeeReminder.__table__, reminders)
+    counts['attendance_record'] = insert_chunked(
+        connection, AttendanceRecord.__table__, attendance_rows(rng, members, scale, today))
+
+    classes = FitnessClass.__table__
+    counts['fitness_class'] = insert_chunked(connection, classes, class_rows(rng, scale, today))
+    active = [member['id'] for member in members if member['status'] == 'Active']
+    registrations = []
+    for class_id, capacity in connection.execute(select(classes.c.id, classes.c.capacity)).all():
+        taken = rng.sample(active, min(len(active), scale.registrations_per_class, capacity))
+        registrations.extend({'member_id': member_id, 'class_id': class_id,
+                              'registration_date': datetime.combine(today, datetime.min.time())}
+                             for member_id in taken)
+        connection.execute(update(classes).where(classes.c.id == class_id).values(seats_taken=len(taken)))
+    counts['class_registration'] = insert_chunked(connection, ClassRegistration.__table__, registrations)
+    return counts
+
+
+def refresh_derived(connection):
+    """Rebuild what the ORM listeners would have kept up to date."""
+    from stats import rebuild_dashboard_stats
+    from member_search import rebuild_member_search
+    import occupancy
+    import revenue
+
+    rebuild_dashboard_stats(connection)
+    revenue.rebuild_revenue(connection)
+    occupancy.rebuild_occupancy(connection)
+    rebuild_member_search(connection)
+
+
+def build_database(path, scale):
+    """Create a SQLite database at ``path`` filled to ``scale``; returns
+    {table: rows}. The scheduler is kept off."""
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(path)
+    from sqlalchemy import text
+    from app import create_app, create_admin_user
+    from models import db
+
+    app = create_app({'SCHEDULER_ENABLED': False})
+    create_admin_user(app)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            counts = generate(connection, scale, scale.anchor_date)
+            refresh_derived(connection)
+        with db.engine.connect() as connection:
+            # Fold the WAL into the file so the database can be copied as is
+            connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        db.engine.dispose()
+    return counts
+
+
+def add_scale_arguments(parser):
+    defaults = Scale()
+    parser.add_argument('--members', type=int, default=defaults.members)
+    parser.add_argument('--years', type=int, default=defaults.years, help='History length.')
+    parser.add_argument('--visits-per-week', type=float, default=defaults.visits_per_week)
+    parser.add_argument('--classes', type=int, default=defaults.classes)
+    parser.add_argument('--registrations-per-class', type=int, default=defaults.registrations_per_class)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--anchor-date', type=date.fromisoformat, default=defaults.anchor_date,
+                        help='Last day of the generated history (YYYY-MM-DD).')
+
+
+def scale_from_args(args):
+    return Scale(members=args.members, years=args.years, visits_per_week=args.visits_per_week,
+                 classes=args.classes, registrations_per_class=args.registrations_per_class, seed=args.seed,
+                 anchor_date=args.anchor_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='SQLite file to create.')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    if os.path.exists(args.database):
+        raise SystemExit(f"{args.database} already exists")
+
+    started = time.perf_counter()
+    counts = build_database(args.database, scale_from_args(args))
+    for table, count in counts.items():
+        print(f"{table:>20}: {count:,}")
+    print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
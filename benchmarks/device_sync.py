@@ -0,0 +1,277 @@
+"""Simulated attendance devices for the sync protocol.
+
+Runs a fleet of devices against /api/devices/<id>/sync on a generated
+dataset (see benchmarks/datagen.py). Every device admits members from its
+own copy of the allow-list, buffers the check-ins and uploads them in
+batches, while the network drops out (--offline) and responses get lost
+after the server applied the batch (--loss), so batches are sent again.
+Meanwhile members are suspended, reactivated, added and deleted. At the end
+every device syncs until its buffer is empty and the run checks that:
+
+- every buffered check-in was stored exactly once (or rejected for a member
+  that no longer exists),
+- the daily check-in counts grew by the number stored,
+- every device's allow-list matches the members table.
+
+    python -m benchmarks.device_sync --devices 16 --seconds 10 --members 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.datagen import add_scale_arguments, build_database, scale_from_args
+from benchmarks.routes import percentile
+
+
+class Device:
+    def __init__(self, device_id, key, batch_size):
+        self.device_id = device_id
+        self.headers = {'Authorization': f'Bearer {key}'}
+        self.batch_size = batch_size
+        self.allowed = {}  # member id -> status
+        self.token = None
+        self.buffer = []
+        self.sequence = 0
+        self.swipes = 0
+        self.refused = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.uploads = 0
+        self.lost = 0
+        self.latencies = []
+
+    def swipe(self, member_id):
+        self.swipes += 1
+        if self.allowed.get(member_id) != 'Active':
+            self.refused += 1
+            return
+        self.sequence += 1
+        self.buffer.append([self.sequence, member_id, time.time()])
+
+    def sync(self, client, lose_response=False):
+        """One upload of up to batch_size buffered events, then allow-list
+        pages until the device is up to date."""
+        events = self.buffer[:self.batch_size]
+        body = self.post(client, {'events': events, 'since': self.token})
+        if lose_response:
+            # The server applied the batch; the device never hears of it
+            self.lost += 1
+            return
+        del self.buffer[:len(events)]
+        self.duplicates += body['duplicates']
+        self.rejected += len(body['rejected'])
+        self.apply_delta(body)
+        while body['more']:
+            body = self.post(client, {'since': self.token})
+            self.apply_delta(body)
+
+    def post(self, client, payload):
+        started = time.perf_counter()
+        response = client.post(f'/api/devices/{self.device_id}/sync', json=payload, headers=self.headers)
+        self.latencies.append(time.perf_counter() - started)
+        self.uploads += 1
+        body = response.get_json()
+        if response.status_code != 200:
+            raise RuntimeError(f"device {self.device_id}: HTTP {response.status_code} {body}")
+        return body
+
+    def apply_delta(self, body):
+        if body['full'] and self.token is None:
+            self.allowed = {}
+        for member_id in body['removed']:
+            self.allowed.pop(member_id, None)
+        for member_id, _, status in body['members']:
+            self.allowed[member_id] = status
+        self.token = body['sync_token']
+
+
+def setup(args):
+    workdir = tempfile.mkdtemp(prefix='gym-bench-')
+    database = os.path.join(workdir, 'bench.db')
+    started = time.perf_counter()
+    build_database(database, scale_from_args(args))
+    print(f"Generated {args.members:,} members in {time.perf_counter() - started:.1f}s")
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database
+
+    from app import create_app
+    from device_sync import new_sync_key
+    from models import db, AttendanceDevice
+
+    # The lock waits of concurrent uploads would fill the slow query log
+    app = create_app({'SCHEDULER_ENABLED': False, 'INSTRUMENTATION_ENABLED': False})
+    devices = []
+    with app.app_context():
+        for index in range(args.devices):
+            key, key_hash = new_sync_key()
+            device = AttendanceDevice(name=f'Turnstile {index + 1}', location='Bench',
+                                      device_type='biometric' if index % 2 else 'keypad', sync_key_hash=key_hash)
+            db.session.add(device)
+            db.session.flush()
+            devices.append(Device(device.id, key, args.batch))
+        db.session.commit()
+    return app, devices
+
+
+def churn_members(app, rng, stop, counts):
+    """Suspend, reactivate, add and delete members until ``stop`` is set."""
+    from sqlalchemy import func, select
+    from sqlalchemy.exc import IntegrityError
+    from models import db, Member
+
+    added = []
+    with app.app_context():
+        highest = db.session.scalar(select(func.max(Member.id)))
+        while not stop.wait(0.02):
+            action = rng.random()
+            try:
+                if action < 0.6:
+                    member = db.session.get(Member, rng.randint(1, highest))
+                    if member is not None:
+                        member.status = 'Suspended' if member.status == 'Active' else 'Active'
+                        counts['updated'] += 1
+                elif action < 0.85 or not added:
+                    number = counts['added'] + 1
+                    member = Member(first_name='Walk', last_name=f'In {number}', membership_type='Basic',
+                                    email=f'walk.in{number}@example.com', status='Active')
+                    db.session.add(member)
+                    db.session.flush()
+                    added.append(member.id)
+                    counts['added'] += 1
+                else:
+                    member = db.session.get(Member, added.pop(rng.randrange(len(added))))
+                    db.session.delete(member)
+                    counts['deleted'] += 1
+                db.session.commit()
+            except IntegrityError:
+                # Already checked in somewhere; members with history stay
+                db.session.rollback()
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    parser.add_argument('--devices', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--batch', type=int, default=500, help='Events per upload.')
+    parser.add_argument('--swipes', type=int, default=50, help='Swipes per device between sync attempts.')
+    parser.add_argument('--offline', type=float, default=0.3, help='Chance a sync attempt finds no network.')
+    parser.add_argument('--loss', type=float, default=0.1, help='Chance a response is lost after the upload.')
+    parser.set_defaults(years=0)
+    args = parser.parse_args()
+
+    app, devices = setup(args)
+
+    from sqlalchemy import func, select
+    from models import db, AttendanceRecord, DailyAttendance, Member
+
+    with app.app_context():
+        daily_before = db.session.scalar(select(func.coalesce(func.sum(DailyAttendance.check_ins), 0)))
+        highest = db.session.scalar(select(func.max(Member.id)))
+
+    # First contact downloads the whole allow-list
+    client = app.test_client()
+    started = time.perf_counter()
+    for device in devices:
+        device.sync(client)
+    initial = (time.perf_counter() - started) / len(devices)
+    print(f"Full allow-list ({len(devices[0].allowed):,} members): {initial * 1000:.0f} ms per device")
+
+    stop = threading.Event()
+    churn = {'updated': 0, 'added': 0, 'deleted': 0}
+    churner = threading.Thread(target=churn_members, args=(app, random.Random(1), stop, churn))
+    errors = []
+
+    def run(device, seed):
+        rng = random.Random(seed)
+        device_client = app.test_client()
+        try:
+            while not stop.is_set():
+                for _ in range(args.swipes):
+                    # Some swipes are for members the device does not know
+                    device.swipe(rng.randint(1, highest + 200))
+                if rng.random() >= args.offline:
+                    device.sync(device_client, lose_response=rng.random() < args.loss)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=run, args=(device, index)) for index, device in enumerate(devices)]
+    started = time.perf_counter()
+    churner.start()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    churner.join()
+    if errors:
+        raise errors[0]
+
+    # Back online: drain every buffer, then one more round for the last
+    # member changes
+    for device in devices:
+        while device.buffer:
+            device.sync(client)
+    elapsed = time.perf_counter() - started
+    for device in devices:
+        device.sync(client)
+
+    problems = []
+    with app.app_context():
+        stored = dict(db.session.execute(
+            select(AttendanceRecord.device_id, func.count()).where(AttendanceRecord.device_id.isnot(None))
+            .group_by(AttendanceRecord.device_id)
+        ).all())
+        repeated = db.session.scalar(select(func.count()).select_from(
+            select(AttendanceRecord.device_id).where(AttendanceRecord.device_id.isnot(None))
+            .group_by(AttendanceRecord.device_id, AttendanceRecord.device_sequence)
+            .having(func.count() > 1).subquery()
+        ))
+        daily_after = db.session.scalar(select(func.sum(DailyAttendance.check_ins)))
+        members = dict(db.session.execute(select(Member.id, Member.status)).all())
+
+    # Responses that were lost are missing from the devices' own totals, so
+    # stored counts come from the database
+    recorded = sum(stored.values())
+    latencies = [seconds for device in devices for seconds in device.latencies]
+    print(f"{len(devices)} devices, {elapsed:.1f}s: {sum(d.swipes for d in devices):,} swipes, "
+          f"{sum(d.refused for d in devices):,} refused at the device, "
+          f"{sum(d.sequence for d in devices):,} buffered")
+    print(f"{sum(d.uploads for d in devices):,} sync requests, {sum(d.lost for d in devices):,} responses lost, "
+          f"{sum(d.duplicates for d in devices):,} duplicate events skipped")
+    print(f"{recorded:,} check-ins stored, {sum(d.rejected for d in devices):,} rejected (member deleted), "
+          f"{recorded / elapsed:,.0f} stored/s")
+    print(f"sync latency p50 {percentile(latencies, 50) * 1000:.1f} ms, p95 {percentile(latencies, 95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, mean {statistics.fmean(latencies) * 1000:.1f} ms")
+    print(f"member changes: {churn['updated']:,} status, {churn['added']:,} added, {churn['deleted']:,} deleted")
+
+    for device in devices:
+        if stored.get(device.device_id, 0) + device.rejected != device.sequence:
+            problems.append(f"device {device.device_id}: {device.sequence} buffered, "
+                            f"{stored.get(device.device_id, 0)} stored, {device.rejected} rejected")
+        if device.allowed != members:
+            missing = set(members) - set(device.allowed)
+            extra = set(device.allowed) - set(members)
+            stale = {m for m in set(members) & set(device.allowed) if members[m] != device.allowed[m]}
+            problems.append(f"device {device.device_id}: allow-list off by {len(missing)} missing, "
+                            f"{len(extra)} extra, {len(stale)} stale")
+    if repeated:
+        problems.append(f"{repeated} (device, sequence) pairs stored more than once")
+    if daily_after - daily_before != recorded:
+        problems.append(f"daily counts grew by {daily_after - daily_before}, {recorded} stored")
+
+    for problem in problems:
+        print('FAILED: ' + problem)
+    if problems:
+        raise SystemExit(1)
+    print('OK: no check-in lost or stored twice, all allow-lists up to date')
+
+
+if __name__ == '__main__':
+    main()
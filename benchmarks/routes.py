@@ -0,0 +1,270 @@
+"""Route latency benchmark.
+
+Generates a dataset (see benchmarks/datagen.py), or copies a cached one, and
+drives the real routes and jobs through the Flask test client as a logged in
+admin. For every scenario it reports p50/p95/p99 latency, SQL statements per
+request and peak memory allocated during one request (tracemalloc, measured
+in separate runs as tracing slows everything down). Results can be written to
+JSON and compared with an earlier run:
+
+    python -m benchmarks.routes --members 5000 --years 2 --output before.json
+    python -m benchmarks.routes --members 5000 --years 2 --baseline before.json
+
+The dataset depends only on the scale arguments, --seed and --anchor-date
+(the last day of its history, a fixed date by default rather than today), so
+two runs with the same arguments see the same data whatever day they run;
+scenarios that look at a period ask for the one ending on the anchor date.
+--dataset keeps the generated database between runs (it is rebuilt when the
+scale changes). Scenarios that write (check-ins, the fee reminder job) change
+the copy used by this run only.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.datagen import add_scale_arguments, build_database, scale_from_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Scenario:
+    def __init__(self, name, request=None, job=None):
+        self.name = name
+        self.request = request  # fn(rng, context) -> (method, path, data)
+        self.job = job          # fn() run in an app context instead of a request
+
+
+def get(path):
+    return lambda rng, context: ('GET', path, None)
+
+
+def fee_reminder_job():
+    from app import check_fee_reminders
+    return check_fee_reminders()
+
+
+SCENARIOS = [
+    Scenario('dashboard', get('/')),
+    Scenario('members', get('/members')),
+    Scenario('member_search', lambda rng, context: (
+        'GET', '/api/v1/members/search?q=' + rng.choice(('ali', 'sara k', 'khan', '0300', 'maria g')), None)),
+    Scenario('payments', get('/payments')),
+    Scenario('api_payments', get('/api/v1/payments?limit=100')),
+    Scenario('fee_reminders', get('/fee_reminders')),
+    Scenario('attendance', get('/attendance')),
+    Scenario('attendance_history', get('/attendance_history')),
+    Scenario('attendance_history_deep', lambda rng, context: (
+        'GET', f"/attendance_history?date={context['anchor'] - timedelta(days=rng.randrange(30, 300))}", None)),
+    Scenario('class_registrations', get('/class_registrations')),
+    Scenario('classes', get('/classes')),
+    Scenario('revenue_report', lambda rng, context: (
+        'GET', f"/reports/revenue?month={context['anchor']:%Y-%m}", None)),
+    Scenario('occupancy', lambda rng, context: (
+        'GET', f"/analytics/occupancy?start={context['anchor'] - timedelta(days=363)}&end={context['anchor']}", None)),
+    Scenario('add_payment_form', get('/add_payment')),
+    Scenario('check_in_code', lambda rng, context: (
+        'POST', '/check_in_code', {'code': str(rng.choice(context['active_members']))})),
+    Scenario('check_fee_reminders', job=fee_reminder_job),
+]
+
+
+def percentile(samples, percent):
+    # Nearest rank
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100.0 * len(ordered)) - 1)]
+
+
+def prepare_database(args, workdir):
+    scale = scale_from_args(args)
+    database = os.path.join(workdir, 'bench.db')
+    # The cached dataset is only reused for the scale it was built with
+    scale_file = args.dataset + '.json' if args.dataset else None
+    if args.dataset and os.path.exists(args.dataset) and os.path.exists(scale_file):
+        with open(scale_file) as f:
+            if json.load(f) == scale.as_dict():
+                shutil.copyfile(args.dataset, database)
+                return scale, None
+    started = time.perf_counter()
+    counts = build_database(database, scale)
+    generated = time.perf_counter() - started
+    if args.dataset:
+        shutil.copyfile(database, args.dataset)
+        with open(scale_file, 'w') as f:
+            json.dump(scale.as_dict(), f)
+    return scale, (counts, generated)
+
+
+def run_scenario(app, client, scenario, rng, context, iterations, memory_iterations, statements):
+    def once():
+        if scenario.job is not None:
+            with app.app_context():
+                scenario.job()
+            return 200
+        method, path, data = scenario.request(rng, context)
+        response = client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+
+    for _ in range(3):  # warm up caches and compiled templates
+        once()
+
+    latencies = []
+    queries = []
+    statuses = set()
+    for _ in range(iterations):
+        statements.clear()
+        started = time.perf_counter()
+        statuses.add(once())
+        latencies.append(time.perf_counter() - started)
+        queries.append(len(statements))
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            once()
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'statuses': sorted(statuses),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'queries': statistics.fmean(queries),
+        'max_queries': max(queries),
+        'peak_kib': max(peaks) / 1024 if peaks else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, tolerance):
+    """Print the change per scenario; returns the names of scenarios whose
+    p95 grew by more than ``tolerance`` percent or that run more queries."""
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'} "
+          f"({baseline['meta'].get('started_at', '?')}):")
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            print(f"{name:>22}: new")
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+        query_change = result['queries'] - before['queries']
+        regressed = change > tolerance or query_change > 0.5
+        if regressed:
+            regressions.append(name)
+        print(f"{name:>22}: p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms ({change:+6.1f}%)   "
+              f"queries {before['queries']:6.1f} -> {result['queries']:6.1f}"
+              + ('   REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--memory-iterations', type=int, default=5)
+    parser.add_argument('--only', help='Comma separated scenario names.')
+    parser.add_argument('--dataset', help='Keep the generated database here and reuse it on later runs.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare with the results in this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=20.0,
+                        help='Allowed p95 growth against the baseline, in percent.')
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.only:
+        names = set(args.only.split(','))
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+        unknown = names - {scenario.name for scenario in scenarios}
+        if unknown:
+            raise SystemExit('Unknown scenarios: ' + ', '.join(sorted(unknown)))
+
+    workdir = tempfile.mkdtemp(prefix='gym-bench-')
+    scale, generated = prepare_database(args, workdir)
+    if generated:
+        counts, seconds = generated
+        print(f"Generated {', '.join(f'{count:,} {table}' for table, count in counts.items())} "
+              f"in {seconds:.1f}s")
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    from sqlalchemy import event, select
+    from app import create_app, create_admin_user
+    from models import db, Member
+
+    app = create_app({'SCHEDULER_ENABLED': False})
+    # Brings a cached dataset up to the current schema
+    create_admin_user(app)
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    with app.app_context():
+        context = {'active_members': list(db.session.scalars(select(Member.id).where(Member.status == 'Active'))),
+                   'anchor': scale.anchor_date}
+        engine = db.engine
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *arguments: statements.append(arguments[2]))
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'scale': scale.as_dict(),
+            'iterations': args.iterations,
+        },
+        'scenarios': {},
+    }
+    rng = random.Random(scale.seed)
+    print(f"{'scenario':>22}  {'p50':>8} {'p95':>8} {'p99':>8} ms  {'queries':>7}  {'peak KiB':>9}")
+    for scenario in scenarios:
+        result = run_scenario(app, client, scenario, rng, context, args.iterations,
+                              args.memory_iterations, statements)
+        results['scenarios'][scenario.name] = result
+        failed = [status for status in result['statuses'] if status >= 400]
+        print(f"{scenario.name:>22}  {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} {result['p99_ms']:8.2f}     "
+              f"{result['queries']:7.1f}  {result['peak_kib'] or 0:9.0f}"
+              + (f"   HTTP {failed}" if failed else ''))
+
+    if 'attendance_writer' in app.extensions:
+        app.extensions['attendance_writer'].stop()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
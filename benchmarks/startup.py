@@ -0,0 +1,133 @@
+"""Startup time benchmark.
+
+Starts fresh interpreter processes against a throwaway SQLite database and
+reports how long the app takes to come up:
+
+  import    `import app` alone
+  web app   import + create_app() + the first request (served in-process)
+  cli       `flask --app app jobs list`, end to end
+  frozen    the PyInstaller build of app.spec, until it answers on
+            http://127.0.0.1:5000/login (skipped if it hasn't been built)
+
+The first run of each is reported separately as the cold start; the rest
+give the warm median:
+
+    python -m benchmarks.startup --runs 5 --importtime 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WEB_APP = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+flask_app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created}))
+'''
+
+SETUP = 'from app import create_app, create_admin_user; create_admin_user(create_app())'
+
+
+def timed(command, env):
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(f"{' '.join(command)} failed:\n{result.stderr}")
+    return elapsed, result.stdout
+
+
+def web_app_run(env):
+    elapsed, output = timed([sys.executable, '-c', WEB_APP], env)
+    stages = json.loads(output.strip().splitlines()[-1])
+    stages['process'] = elapsed
+    return stages
+
+
+def frozen_run(executable, env, timeout=60):
+    started = time.perf_counter()
+    process = subprocess.Popen([executable], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise SystemExit(f"{executable} exited with {process.returncode}")
+            try:
+                urllib.request.urlopen('http://127.0.0.1:5000/login', timeout=1).close()
+                return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise SystemExit(f"{executable} did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name, samples):
+    warm = samples[1:] or samples
+    print(f"{name:>22}: cold {samples[0] * 1000:7.1f} ms   warm median {statistics.median(warm) * 1000:7.1f} ms")
+
+
+def import_profile(env, top):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[0].startswith('import time:') and parts[1].strip().isdigit():
+            modules.append((int(parts[1]), int(parts[0].split(':')[1]), parts[2].rstrip()))
+    print("\nSlowest imports under `import app` (cumulative / self):")
+    for cumulative, own, name in sorted(modules, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:7.1f} ms {own / 1000:7.1f} ms {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--frozen', default=os.path.join(ROOT, 'dist', 'app.exe' if os.name == 'nt' else 'app'),
+                        help='Executable built with `pyinstaller app.spec`.')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='Also list the N slowest imports.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gym-bench-')
+    env = dict(os.environ, SCHEDULER_ENABLED='0', PYTHONPATH=ROOT,
+               SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(workdir, 'bench.db'))
+    timed([sys.executable, '-c', SETUP], env)
+
+    imports = [timed([sys.executable, '-c', 'import app'], env)[0] for _ in range(args.runs)]
+    web = [web_app_run(env) for _ in range(args.runs)]
+    cli = [timed([sys.executable, '-m', 'flask', '--app', 'app', 'jobs', 'list'], env)[0]
+           for _ in range(args.runs)]
+
+    report('import (process)', imports)
+    for stage in ('import', 'create_app', 'first_request', 'process'):
+        report(f'web app {stage}', [run[stage] for run in web])
+    report('cli jobs list', cli)
+    if os.path.exists(args.frozen):
+        report('frozen first response', [frozen_run(args.frozen, env) for _ in range(args.runs)])
+    else:
+        print(f"{'frozen':>22}: skipped, {args.frozen} not found (build it with `pyinstaller app.spec`)")
+
+    if args.importtime:
+        import_profile(env, args.importtime)
+
+
+if __name__ == '__main__':
+    main()
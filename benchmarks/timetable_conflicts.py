@@ -0,0 +1,97 @@
+"""Timetable conflict detection benchmark.
+
+Generates a synthetic timetable of sessions spread over instructors and
+rooms, then times the whole-timetable sweep, building the per instructor and
+per room interval indexes, and single-save lookups against them, next to the
+naive scan of every session:
+
+    python -m benchmarks.timetable_conflicts --sessions 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+
+def generate_sessions(count, instructors, rooms, days, seed):
+    from recurrence import Occurrence
+
+    rng = random.Random(seed)
+    start = datetime(2030, 1, 7)
+    sessions = []
+    for class_id in range(1, count + 1):
+        starts_at = start + timedelta(days=rng.randrange(days), minutes=rng.randrange(6 * 4, 22 * 4) * 15)
+        duration = timedelta(minutes=rng.choice((30, 45, 60, 90)))
+        sessions.append(Occurrence(
+            starts_at, starts_at + duration, class_id, f'Class {class_id}',
+            f'Instructor {rng.randrange(instructors)}', starts_at, f'Room {rng.randrange(rooms)}'
+        ))
+    return sessions
+
+
+def naive_conflicts(session, sessions):
+    return [
+        other for other in sessions
+        if other.class_id != session.class_id
+        and other.starts_at < session.ends_at and other.ends_at > session.starts_at
+        and (other.instructor == session.instructor or other.room == session.room)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--instructors', type=int, default=2000)
+    parser.add_argument('--rooms', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from conflicts import build_indexes, session_conflicts, sweep_conflicts
+
+    sessions = generate_sessions(args.sessions, args.instructors, args.rooms, args.days, args.seed)
+    print(f"{len(sessions):,} sessions over {args.days} days, "
+          f"{args.instructors} instructors, {args.rooms} rooms")
+
+    started = time.perf_counter()
+    conflicts = sweep_conflicts(sessions)
+    elapsed = time.perf_counter() - started
+    print(f"sweep: {len(conflicts):,} conflicting pairs in {elapsed * 1000:.0f}ms")
+
+    started = time.perf_counter()
+    indexes = build_indexes(sessions)
+    elapsed = time.perf_counter() - started
+    print(f"index build: {len(indexes):,} groups in {elapsed * 1000:.0f}ms")
+
+    probes = random.Random(args.seed + 1).sample(sessions, min(args.lookups, len(sessions)))
+    started = time.perf_counter()
+    indexed = [session_conflicts(session, indexes) for session in probes]
+    index_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive = [naive_conflicts(session, sessions) for session in probes]
+    naive_elapsed = time.perf_counter() - started
+
+    for session, found, expected in zip(probes, indexed, naive):
+        # A session sharing both instructor and room with another is one
+        # naive hit but two conflicts
+        assert {conflict.other for conflict in found} == set(expected), session
+    print(f"single save: {index_elapsed / len(probes) * 1e6:.1f}us per lookup indexed, "
+          f"{naive_elapsed / len(probes) * 1e3:.2f}ms naive "
+          f"({naive_elapsed / index_elapsed:.0f}x)")
+    print(f"naive whole timetable would take about "
+          f"{naive_elapsed / len(probes) * len(sessions):.0f}s")
+
+    # The sweep reports every pair once, the index from both sides
+    pairs = {frozenset((conflict.session, conflict.other)) for conflict in conflicts}
+    from_index = {
+        frozenset((conflict.session, conflict.other))
+        for session in sessions for conflict in session_conflicts(session, indexes)
+    }
+    assert pairs == from_index
+    print("sweep and index agree")
+
+
+if __name__ == '__main__':
+    main()
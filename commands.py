@@ -0,0 +1,228 @@
+import json
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from models import db, JobRun, AttendanceDevice
+from migrations import upgrade_database
+from member_import import import_members
+from stats import rebuild_dashboard_stats
+from member_search import rebuild_member_search
+from conflicts import check_timetable, describe_conflict
+from gym_time import gym_today, period_bounds
+import occupancy
+import attendance_archive
+import device_sync
+import revenue
+import jobs
+
+# Maintenance commands, added to `flask` by create_app()
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Upgrade the schema, run the data backfills and create the admin user."""
+    # What `python app.py` does before serving; run it after every upgrade
+    # when the app is started through `flask --app app` or a WSGI server
+    from app import create_admin_user
+    create_admin_user(current_app._get_current_object())
+    print("Database is ready")
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Add missing tables, columns and indexes to the existing database."""
+    added = upgrade_database()
+    for table, column in sorted(added):
+        print(f"Added column {table}.{column}")
+    print("Database schema is up to date")
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute the dashboard counters from the underlying tables."""
+    with db.engine.begin() as connection:
+        values = rebuild_dashboard_stats(connection)
+    for name, value in values.items():
+        print(f"{name}: {value}")
+
+@click.command('rebuild-revenue')
+@with_appcontext
+def rebuild_revenue_command():
+    """Recompute the revenue report rollups from the Completed payments."""
+    with db.engine.begin() as connection:
+        total = revenue.rebuild_revenue(connection)
+    print(f"Revenue rollups rebuilt, total revenue {total:.2f}")
+
+@click.command('rebuild-occupancy')
+@with_appcontext
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Only recount buckets from this day on.')
+def rebuild_occupancy_command(since):
+    """Recount the 15 minute occupancy buckets from the attendance records."""
+    with db.engine.begin() as connection:
+        buckets = occupancy.rebuild_occupancy(connection, since=since)
+    print(f"{buckets} occupancy buckets written")
+
+@click.command('rebuild-member-search')
+@with_appcontext
+def rebuild_member_search_command():
+    """Reindex every member for the member pickers' search."""
+    with db.engine.begin() as connection:
+        indexed = rebuild_member_search(connection)
+    if indexed is None:
+        print("Full text search is not available, member search uses LIKE queries")
+    else:
+        print(f"{indexed} members indexed")
+
+@click.command('import-members')
+@with_appcontext
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--report', type=click.File('w'), help='Write rejected rows to this CSV file.')
+@click.option('--chunk-size', default=1000, show_default=True)
+def import_members_command(csv_file, report, chunk_size):
+    """Bulk import members (and their first fee reminders) from a CSV file."""
+    try:
+        result = import_members(csv_file, report=report, chunk_size=chunk_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(f"{result.read} rows read, {result.imported} imported, {result.rejected} rejected "
+          f"in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/s)")
+
+@click.command('check-timetable')
+@with_appcontext
+@click.option('--week', 'week_of', type=click.DateTime(formats=['%Y-%m-%d']), help='Any day of the first week to check (default: this week).')
+@click.option('--weeks', default=1, show_default=True)
+def check_timetable_command(week_of, weeks):
+    """Report instructor and room double bookings in the timetable."""
+    day = week_of.date() if week_of else gym_today()
+    start = period_bounds(day, 'week')[0]
+    end = start + timedelta(weeks=weeks)
+    conflicts = check_timetable(start, end)
+    for conflict in conflicts:
+        session = conflict.session
+        print(f"{session.name} {session.starts_at.strftime('%Y-%m-%d %H:%M')}: {describe_conflict(conflict)}")
+    print(f"{len(conflicts)} conflicts between {start.strftime('%Y-%m-%d')} and {end.strftime('%Y-%m-%d')}")
+    if conflicts:
+        raise SystemExit(1)
+
+def print_job_run(run):
+    rows = '' if run.rows is None else f", {run.rows} rows"
+    print(f"#{run.id} {run.job} ({run.trigger}) started {run.started_at.strftime('%Y-%m-%d %H:%M:%S')} UTC: "
+          f"{run.status}{rows}" + (f" in {run.duration:.3f}s" if run.duration is not None else ''))
+
+def run_job_command(name):
+    run_id = jobs.run_job(name, trigger='cli', force=True)
+    if run_id is None:
+        raise click.ClickException(f'{name} is running in another process')
+    run = db.session.get(JobRun, run_id)
+    print_job_run(run)
+    if run.status == 'failed':
+        print(run.error)
+        raise SystemExit(1)
+    return json.loads(run.details)
+
+jobs_cli = AppGroup('jobs', help='Inspect and run the scheduled jobs.')
+
+@jobs_cli.command('list')
+def jobs_list_command():
+    """Show the registered jobs, their locks and last runs."""
+    for job, lock, last_run in jobs.job_status():
+        print(f"{job['name']}: {job['description']} [{job['schedule']}]")
+        if lock is not None and lock.locked_until is not None and lock.locked_until > datetime.utcnow():
+            print(f"  locked by {lock.owner} until {lock.locked_until.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+        if last_run is not None:
+            print('  last run ', end='')
+            print_job_run(last_run)
+
+@jobs_cli.command('run')
+@click.argument('name')
+def jobs_run_command(name):
+    """Run a job now in this process."""
+    # Jobs are registered by create_app(), after this module is imported
+    if name not in jobs.JOBS:
+        raise click.BadParameter(f"choose from {', '.join(sorted(jobs.JOBS))}", param_hint='NAME')
+    result = run_job_command(name)
+    for key, value in result.items():
+        print(f"  {key}: {value}")
+
+@jobs_cli.command('history')
+@click.argument('name', required=False)
+@click.option('--limit', default=20, show_default=True)
+def jobs_history_command(name, limit):
+    """Show the most recent job runs."""
+    query = JobRun.query
+    if name:
+        query = query.filter_by(job=name)
+    for run in query.order_by(JobRun.id.desc()).limit(limit):
+        print_job_run(run)
+
+@click.command('fee-reminders')
+@with_appcontext
+def fee_reminders_command():
+    """Run the daily fee reminder job now."""
+    result = run_job_command('fee_reminders')
+    print(f"{result['due']} due, {result['rolled_over']} rolled over, "
+          f"{result['skipped']} already rolled over in {result['seconds']}s, "
+          f"{result['queued']} notifications queued")
+
+@click.command('send-notifications')
+@with_appcontext
+def send_notifications_command():
+    """Send the queued notifications now."""
+    result = run_job_command('notifications')
+    for channel, counts in result['channels'].items():
+        print(f"{channel}: {counts['sent']} sent, {counts['retried']} to retry, {counts['failed']} failed, "
+              f"{counts['per_second']}/s, {counts['avg_send_ms']} ms per message")
+    print(f"{result['sent']} sent, {result['cancelled']} cancelled in {result['seconds']}s")
+
+@click.command('close-stale-check-ins')
+@with_appcontext
+def close_stale_check_ins_command():
+    """Run the stale check-in sweeper now."""
+    result = run_job_command('stale_check_ins')
+    print(f"{result['closed']} stale check-ins closed in {result['chunks']} chunks in {result['seconds']}s")
+
+@click.command('archive-attendance')
+@with_appcontext
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive the months before this day instead of using ATTENDANCE_RETENTION_DAYS.')
+def archive_attendance_command(before):
+    """Move old check-ins into the monthly archive tables now."""
+    if before is None:
+        result = run_job_command('attendance_archive')
+    else:
+        result = attendance_archive.archive_attendance(
+            before.date(), chunk_size=current_app.config['ATTENDANCE_ARCHIVE_CHUNK_SIZE'])
+    print(f"{result['archived']} check-ins archived into {len(result['months'])} monthly tables "
+          f"in {result['seconds']}s")
+
+@click.command('vacuum-db')
+@with_appcontext
+def vacuum_db_command():
+    """Rebuild the SQLite database file (switches it to incremental auto-vacuum)."""
+    mode = attendance_archive.vacuum_database()
+    if mode is None:
+        print("Not a SQLite database, nothing to do")
+    else:
+        print(f"Database vacuumed, auto_vacuum={mode}")
+
+@click.command('device-sync-key')
+@with_appcontext
+@click.argument('device_id', type=int)
+def device_sync_key_command(device_id):
+    """Issue a new sync key for an attendance device (the old one stops working)."""
+    device = db.session.get(AttendanceDevice, device_id)
+    if device is None:
+        raise click.ClickException(f"No device {device_id}")
+    key, device.sync_key_hash = device_sync.new_sync_key()
+    db.session.commit()
+    print(f"Sync key for {device.name}: {key}")
+
+COMMANDS = [
+    init_db_command, upgrade_db_command, rebuild_stats_command, rebuild_revenue_command, rebuild_occupancy_command,
+    rebuild_member_search_command, import_members_command, check_timetable_command, jobs_cli, fee_reminders_command,
+    send_notifications_command, close_stale_check_ins_command, archive_attendance_command, vacuum_db_command,
+    device_sync_key_command
+]
@@ -0,0 +1,137 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+import recurrence
+
+# Timetable conflict detection.
+#
+# Two sessions conflict when they overlap in time and share an instructor or
+# a room. Sessions are grouped by instructor and by room, and each group is
+# kept sorted by start time:
+#
+# * IntervalIndex answers "what overlaps [start, end)?" for a single save
+#   with two bisects, since anything overlapping must start after
+#   start - (longest session in the group) and before end.
+# * sweep_conflicts checks a whole timetable in one pass over the sessions
+#   in start order, keeping the still running sessions of each group in a
+#   heap keyed by end time: O(n log n) plus the conflicts found.
+#
+# Sessions are recurrence.Occurrence tuples, so recurring classes are checked
+# session by session, exceptions included.
+
+# How far ahead a recurring class without an end date is checked on save
+CONFLICT_HORIZON = timedelta(weeks=26)
+
+Conflict = namedtuple('Conflict', 'kind session other')
+
+
+def _keys(session):
+    # The (kind, normalized name) groups a session is booked in
+    keys = []
+    if session.instructor and session.instructor.strip():
+        keys.append(('instructor', session.instructor.strip().lower()))
+    if session.room and session.room.strip():
+        keys.append(('room', session.room.strip().lower()))
+    return keys
+
+
+class IntervalIndex:
+    """Sessions sorted by start time, for overlap queries."""
+
+    def __init__(self, sessions):
+        self.sessions = sorted(sessions)
+        self.starts = [session.starts_at for session in self.sessions]
+        self.max_length = max((session.ends_at - session.starts_at for session in self.sessions),
+                              default=timedelta(0))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def overlapping(self, start, end):
+        lo = bisect_right(self.starts, start - self.max_length)
+        hi = bisect_left(self.starts, end)
+        return [session for session in self.sessions[lo:hi] if session.ends_at > start]
+
+
+def build_indexes(sessions):
+    groups = defaultdict(list)
+    for session in sessions:
+        for key in _keys(session):
+            groups[key].append(session)
+    return {key: IntervalIndex(group) for key, group in groups.items()}
+
+
+def session_conflicts(session, indexes):
+    """Conflicts of one session against indexed sessions of other classes."""
+    conflicts = []
+    for key in _keys(session):
+        index = indexes.get(key)
+        if index is None:
+            continue
+        for other in index.overlapping(session.starts_at, session.ends_at):
+            if other.class_id is None or other.class_id != session.class_id:
+                conflicts.append(Conflict(key[0], session, other))
+    return conflicts
+
+
+def sweep_conflicts(sessions):
+    """All conflicting pairs among the sessions, (earlier, later) in start order."""
+    conflicts = []
+    running = defaultdict(list)  # group -> heap of (ends_at, seq, session)
+    for seq, session in enumerate(sorted(sessions)):
+        for key in _keys(session):
+            heap = running[key]
+            while heap and heap[0][0] <= session.starts_at:
+                heapq.heappop(heap)
+            for _, _, other in heap:
+                if other.class_id != session.class_id:
+                    conflicts.append(Conflict(key[0], other, session))
+            heapq.heappush(heap, (session.ends_at, seq, session))
+    return conflicts
+
+
+def save_window(fitness_class, today):
+    """The part of a class's schedule checked when it is saved: from today
+    (or its first session) to the end of the series, at most CONFLICT_HORIZON."""
+    start = max(fitness_class.schedule, datetime.combine(today, time.min))
+    end = start + CONFLICT_HORIZON
+    if fitness_class.repeat_weekdays and fitness_class.repeat_until:
+        end = min(end, datetime.combine(fitness_class.repeat_until + timedelta(days=1), time.min))
+    if not fitness_class.repeat_weekdays:
+        end = start + timedelta(minutes=fitness_class.duration)
+    return start, end
+
+
+def find_conflicts(fitness_class, window_start, window_end):
+    """Conflicts between the sessions of one, possibly unsaved, class and the
+    rest of the timetable in the window."""
+    sessions = list(recurrence.timetable(window_start, window_end, [fitness_class]))
+    keys = {key for session in sessions for key in _keys(session)}
+    if not keys:
+        return []
+
+    # Only expand the classes that share an instructor or room
+    others = [
+        other for other in recurrence.load_timetable_classes(window_start, window_end)
+        if other is not fitness_class and (fitness_class.id is None or other.id != fitness_class.id)
+        and keys.intersection(_keys(other))
+    ]
+    indexes = build_indexes(recurrence.timetable(window_start, window_end, others))
+    conflicts = []
+    for session in sessions:
+        conflicts.extend(session_conflicts(session, indexes))
+    return conflicts
+
+
+def check_timetable(window_start, window_end):
+    return sweep_conflicts(recurrence.timetable(window_start, window_end))
+
+
+def describe_conflict(conflict):
+    other = conflict.other
+    name = other.instructor if conflict.kind == 'instructor' else other.room
+    verb = 'teaching' if conflict.kind == 'instructor' else 'booked for'
+    return (f"{conflict.kind.capitalize()} {name} is already {verb} {other.name} on "
+            f"{other.starts_at.strftime('%Y-%m-%d %H:%M')}-{other.ends_at.strftime('%H:%M')}")
@@ -0,0 +1,106 @@
+import os
+from functools import partial
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+
+# Database configuration.
+#
+# Unless the app config sets SQLALCHEMY_DATABASE_URI itself (tests,
+# benchmarks), the URI comes from SQLALCHEMY_DATABASE_URI (or DATABASE_URL)
+# in the environment, so a deployment can point at PostgreSQL without code
+# changes.
+# SQLite connections get the pragmas below on connect: WAL lets the dashboard
+# and other readers run while a check-in is being written, and busy_timeout
+# makes a writer wait for the lock instead of failing with "database is
+# locked".
+
+DEFAULT_DATABASE_URI = 'sqlite:///gym.db'
+
+SQLITE_PRAGMAS = {
+    # Only takes effect for a new file (or on VACUUM): lets the attendance
+    # archive job return freed pages a few at a time, see attendance_archive.py
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,      # ms
+    'cache_size': -65536,      # negative = KiB, i.e. 64 MB
+    'mmap_size': 268435456,    # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+
+def database_uri_from_env(default=DEFAULT_DATABASE_URI):
+    return os.environ.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL') or default
+
+
+def normalize_database_uri(uri):
+    # Some hosts still hand out the pre-1.4 'postgres://' scheme
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri):
+    backend = make_url(uri).get_backend_name()
+    pool_size = int(os.environ.get('DB_POOL_SIZE', 10))
+    max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+
+    if backend == 'sqlite':
+        if uri in ('sqlite://', 'sqlite:///:memory:'):
+            # In-memory databases live in a single connection; keep the
+            # dialect's default StaticPool/SingletonThreadPool
+            return {}
+        return {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': 30,
+            # Pooled connections are handed between request threads
+            'connect_args': {'check_same_thread': False, 'timeout': 30},
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': 30,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+    }
+
+
+def _apply_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_database(app):
+    """Configure the engine for ``app`` and bind ``db`` to it."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_uri(
+        app.config.get('SQLALCHEMY_DATABASE_URI') or database_uri_from_env()
+    )
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    pragmas = dict(SQLITE_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {}))
+    app.config['SQLITE_PRAGMAS'] = pragmas
+
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', partial(_apply_sqlite_pragmas, pragmas))
+
+
+def insert_or_ignore(connection, table):
+    """INSERT into ``table`` that skips rows violating a unique constraint
+    instead of failing the statement (ON CONFLICT DO NOTHING)."""
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
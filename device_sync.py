@@ -0,0 +1,224 @@
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, select, tuple_, update
+
+from attendance_writer import insert_attendance
+from database import insert_or_ignore
+from gym_time import parse_device_timestamp
+from models import db, AttendanceDevice, AttendanceRecord, Member, MemberTombstone
+from pagination import decode_cursor, encode_cursor
+
+# Sync protocol for attendance devices (turnstiles, keypads).
+#
+# A device admits members on its own from a local copy of the allow-list and
+# buffers every check-in it records, numbered 1, 2, 3... When it can reach
+# the server it POSTs the buffer to /api/devices/<id>/sync:
+#
+#   {"events": [[101, 42, 1714546803], [102, 7, "2024-05-01T07:00:09Z"], ...],
+#    "since": "<sync_token from the last response>"}
+#
+# each event being [sequence, member id, epoch seconds or ISO 8601]. Events
+# are applied idempotently: a sequence already stored for the device (the
+# unique index on attendance_record (device_id, device_sequence)) is counted
+# as a duplicate, so a batch whose response got lost can simply be sent
+# again. Once a response arrives the device drops the events it sent (those
+# rejected, for an unknown member, included). The response also gives the
+# highest sequence received so far, last_sequence; a device that lost its
+# storage resumes numbering after it.
+#
+# The same response carries the allow-list changes since the token, oldest
+# first: members as [id, name, status] (only Active may enter) and the ids of
+# deleted members. Without a token the whole list is sent ("full": true) and
+# the device replaces its copy. Large lists come in pages; while "more" is
+# true the device calls again with the new token and no events. Tokens are
+# the (updated_at, id) of the last member sent, kept SYNC_OVERLAP behind the
+# clock so a member saved by a transaction that was still open is picked up
+# by the next sync; members sent twice are harmless.
+#
+# Devices authenticate with a key (Authorization: Bearer <key>) generated on
+# the devices page; only its SHA-256 is stored.
+
+SYNC_OVERLAP = timedelta(seconds=5)
+TOKEN_COLUMNS = (Member.updated_at, Member.id)
+
+
+class SyncError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def new_sync_key():
+    """(key, hash): the key is shown once, the hash goes on the device."""
+    key = secrets.token_urlsafe(24)
+    return key, hash_sync_key(key)
+
+
+def hash_sync_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def bearer_key(authorization):
+    if authorization and authorization.startswith('Bearer '):
+        return authorization[7:] or None
+    return None
+
+
+def authenticate_device(device_id, authorization):
+    """The active AttendanceDevice whose key is in ``authorization`` (the
+    Authorization header), or a SyncError."""
+    device = db.session.get(AttendanceDevice, device_id)
+    key = bearer_key(authorization)
+    if device is None or not device.sync_key_hash or not key or \
+            not hmac.compare_digest(device.sync_key_hash, hash_sync_key(key)):
+        raise SyncError('Unknown device or wrong key', 401)
+    if not device.is_active:
+        raise SyncError('Device is inactive', 403)
+    return device
+
+
+def device_for_key(authorization):
+    """The active AttendanceDevice whose key is in ``authorization``, for
+    endpoints that do not name the device in the URL, or a SyncError."""
+    key = bearer_key(authorization)
+    device = None
+    if key:
+        device = AttendanceDevice.query.filter_by(sync_key_hash=hash_sync_key(key)).first()
+    if device is None:
+        raise SyncError('Unknown device key', 401)
+    if not device.is_active:
+        raise SyncError('Device is inactive', 403)
+    return device
+
+
+def parse_events(events, max_events):
+    """[(sequence, member_id, check_in)] from the request body, or a
+    SyncError naming the first malformed event."""
+    if events is None:
+        return []
+    if not isinstance(events, list):
+        raise SyncError('events must be an array')
+    if len(events) > max_events:
+        raise SyncError('Too many events in one batch', 413)
+    parsed = []
+    for index, device_event in enumerate(events):
+        try:
+            sequence, member_id, timestamp = device_event
+            sequence = int(sequence)
+            member_id = int(member_id)
+            check_in = parse_device_timestamp(timestamp)
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise SyncError(f'Invalid event at index {index}')
+        if sequence < 1:
+            raise SyncError(f'Invalid sequence at index {index}')
+        parsed.append((sequence, member_id, check_in))
+    return parsed
+
+
+def apply_events(device_id, events):
+    """Store the device's events that are not stored yet, in one
+    transaction; returns {recorded, duplicates, rejected, last_sequence}."""
+    result = {'recorded': 0, 'duplicates': 0, 'rejected': [], 'last_sequence': 0}
+    records = AttendanceRecord.__table__
+    devices = AttendanceDevice.__table__
+    with db.engine.begin() as connection:
+        # Writing the device row first serializes syncs of the same device,
+        # so the duplicate check below cannot race another upload
+        connection.execute(update(devices).where(devices.c.id == device_id).values(last_sync=datetime.utcnow()))
+        device = connection.execute(
+            select(devices.c.device_type, devices.c.last_sequence).where(devices.c.id == device_id)
+        ).one()
+
+        unique = {}
+        for sequence, member_id, check_in in events:
+            unique.setdefault(sequence, (member_id, check_in))
+        result['duplicates'] = len(events) - len(unique)
+        stored = set()
+        sequences = sorted(unique)
+        for start in range(0, len(sequences), 500):
+            chunk = sequences[start:start + 500]
+            stored.update(connection.scalars(select(records.c.device_sequence).where(
+                records.c.device_id == device_id, records.c.device_sequence.in_(chunk)
+            )))
+        result['duplicates'] += len(stored)
+
+        member_ids = {member_id for sequence, (member_id, _) in unique.items() if sequence not in stored}
+        known = set()
+        member_list = sorted(member_ids)
+        for start in range(0, len(member_list), 500):
+            known.update(connection.scalars(select(Member.id).where(Member.id.in_(member_list[start:start + 500]))))
+
+        # The device already let these members in; the server only refuses
+        # events it cannot store
+        attendance_type = 'biometric' if device.device_type == 'biometric' else 'code'
+        rows = []
+        for sequence in sequences:
+            if sequence in stored:
+                continue
+            member_id, check_in = unique[sequence]
+            if member_id not in known:
+                result['rejected'].append([sequence, 'Unknown member'])
+                continue
+            rows.append({'member_id': member_id, 'device_id': device_id, 'device_sequence': sequence,
+                         'check_in': check_in, 'attendance_type': attendance_type})
+        insert_attendance(connection, rows)
+        result['recorded'] = len(rows)
+
+        last_sequence = max([device.last_sequence] + sequences)
+        if last_sequence != device.last_sequence:
+            connection.execute(update(devices).where(devices.c.id == device_id).values(last_sequence=last_sequence))
+        result['last_sequence'] = last_sequence
+    return result
+
+
+def member_delta(token, limit, now=None):
+    """Allow-list changes after ``token`` (None for the whole list); returns
+    {members, removed, full, more, sync_token}."""
+    now = now or datetime.utcnow()
+    since = decode_cursor(token, TOKEN_COLUMNS)
+    # Tokens are only ever issued with both values set and a naive UTC time
+    if since is not None and (None in since or since[0].tzinfo is not None):
+        raise SyncError('Invalid sync token')
+    statement = select(Member.id, Member.first_name, Member.last_name, Member.status, Member.updated_at)
+    if since is not None:
+        statement = statement.where(tuple_(Member.updated_at, Member.id) > tuple_(*since))
+    rows = db.session.execute(statement.order_by(Member.updated_at, Member.id).limit(limit + 1)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    removed = []
+    if since is not None:
+        # A tombstone whose id was taken by a new member no longer applies
+        removed = list(db.session.scalars(
+            select(MemberTombstone.member_id).where(
+                MemberTombstone.deleted_at > since[0],
+                MemberTombstone.member_id.not_in(select(Member.id))
+            ).order_by(MemberTombstone.deleted_at)
+        ))
+
+    horizon = [now - SYNC_OVERLAP, 0]
+    if rows:
+        position = [rows[-1].updated_at, rows[-1].id]
+        if not more and position > horizon:
+            position = horizon
+    else:
+        position = since if since is not None and since < horizon else horizon
+    return {
+        'members': [[row.id, f'{row.first_name} {row.last_name}', row.status] for row in rows],
+        'removed': removed,
+        'full': since is None,
+        'more': more,
+        'sync_token': encode_cursor(position),
+    }
+
+
+# A deleted member leaves a tombstone for the next delta
+@event.listens_for(Member, 'after_delete')
+def member_deleted(mapper, connection, target):
+    connection.execute(delete(MemberTombstone.__table__).where(MemberTombstone.member_id == target.id))
+    connection.execute(insert_or_ignore(connection, MemberTombstone.__table__).values(
+        member_id=target.id, deleted_at=datetime.utcnow()
+    ))
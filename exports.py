@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from models import db, Member, Payment, AttendanceRecord
+from gym_time import filter_date_range
+import attendance_archive
+
+# Streaming CSV/NDJSON exports.
+#
+# Each export is a single SELECT joined to Member for the names, read with
+# yield_per so rows arrive from the cursor one chunk at a time and are
+# written out before the next chunk is fetched. Memory use does not depend on
+# the size of the table. The attendance export also reads the archive tables
+# of the months it covers (attendance_archive.attendance_source()).
+
+EXPORTS = {
+    'payments': {
+        'columns': {
+            'id': Payment.id,
+            'member_id': Payment.member_id,
+            'first_name': Member.first_name,
+            'last_name': Member.last_name,
+            'amount': Payment.amount,
+            'payment_date': Payment.payment_date,
+            'payment_method': Payment.payment_method,
+            'status': Payment.status,
+            'notes': Payment.notes,
+        },
+        'model': Payment,
+        'date_column': Payment.payment_date,
+        'utc': True,  # payment_date is stored in UTC
+        'order_by': (Payment.payment_date, Payment.id),
+    },
+    'attendance': {
+        'columns': {
+            'id': AttendanceRecord.id,
+            'member_id': AttendanceRecord.member_id,
+            'first_name': Member.first_name,
+            'last_name': Member.last_name,
+            'check_in': AttendanceRecord.check_in,
+            'check_out': AttendanceRecord.check_out,
+            'attendance_type': AttendanceRecord.attendance_type,
+            'auto_checked_out': AttendanceRecord.auto_checked_out,
+            'device_id': AttendanceRecord.device_id,
+            'notes': AttendanceRecord.notes,
+        },
+        'model': AttendanceRecord,
+        'date_column': AttendanceRecord.check_in,
+        'utc': False,
+        'order_by': (AttendanceRecord.check_in, AttendanceRecord.id),
+        'source': attendance_archive.attendance_source,
+    },
+}
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def select_columns(name, requested):
+    """Validate a comma separated ``columns`` argument; None means all."""
+    available = EXPORTS[name]['columns']
+    if not requested:
+        return list(available)
+    columns = [column.strip() for column in requested.split(',') if column.strip()]
+    unknown = [column for column in columns if column not in available]
+    if unknown or not columns:
+        raise ValueError('Unknown columns: ' + ', '.join(unknown) if unknown else 'No columns selected')
+    return columns
+
+
+def export_statement(name, columns, start=None, end=None):
+    """SELECT of ``columns`` between the local datetimes start and end."""
+    spec = EXPORTS[name]
+    model = spec['model']
+    source = spec['source'](db.session.connection(), start, end) if 'source' in spec else None
+
+    def column(expression):
+        return attendance_archive.adapt(source, expression) if source is not None else expression
+
+    statement = (
+        select(*[column(spec['columns'][key]).label(key) for key in columns])
+        .select_from(model if source is None else source)
+        # Outer, as archived check-ins can outlive their member
+        .outerjoin(Member, Member.id == column(model.member_id))
+        .order_by(*[column(expression) for expression in spec['order_by']])
+    )
+    return filter_date_range(statement, column(spec['date_column']), start, end, utc=spec['utc'])
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_export(statement, columns, export_format='csv', chunk_size=1000):
+    result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in result.partitions():
+            writer.writerows([[_plain(value) for value in row] for row in rows])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # Header only when there are no rows
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for rows in result.partitions():
+            yield ''.join(
+                json.dumps({column: _plain(value) for column, value in zip(columns, row)}) + '\n'
+                for row in rows
+            )
@@ -0,0 +1,97 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+
+from models import db, FeeReminder
+from stats import adjust_stats
+
+logger = logging.getLogger(__name__)
+
+REMINDER_INTERVAL = timedelta(days=30)
+
+
+def process_fee_reminders(today, chunk_size=1000):
+    """Daily fee reminder run.
+
+    Counts the reminders that are due and rolls every Paid reminder over into
+    next month's Pending one. The rollover works in chunks of ``chunk_size``
+    rows, each in its own transaction: read the chunk, bulk insert the next
+    reminders that do not exist yet, and stamp ``rolled_over_at`` on the
+    chunk so it is never picked up again. Re-running on the same day does
+    nothing, and memory stays bounded by the chunk size.
+    """
+    started = time.perf_counter()
+    table = FeeReminder.__table__
+    result = {'due': 0, 'rolled_over': 0, 'skipped': 0, 'chunks': 0}
+
+    with db.engine.connect() as connection:
+        result['due'] = connection.scalar(
+            select(func.count()).select_from(table).where(
+                table.c.status == 'Pending',
+                table.c.reminder_date <= today
+            )
+        )
+
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            chunk = connection.execute(
+                select(table.c.id, table.c.member_id, table.c.reminder_date, table.c.amount)
+                .where(
+                    table.c.status == 'Paid',
+                    table.c.rolled_over_at.is_(None),
+                    table.c.reminder_date <= today,
+                    table.c.id > last_id
+                )
+                .order_by(table.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            wanted = {}
+            for row in chunk:
+                wanted.setdefault((row.member_id, row.reminder_date + REMINDER_INTERVAL), row)
+
+            # Next reminders that already exist, e.g. created by the
+            # pre-marker version of this job or added by hand
+            existing = set(connection.execute(
+                select(table.c.member_id, table.c.reminder_date).where(
+                    table.c.member_id.in_({member_id for member_id, _ in wanted}),
+                    table.c.reminder_date.in_({next_date for _, next_date in wanted})
+                )
+            ).all())
+
+            new_rows = [
+                {
+                    'member_id': member_id,
+                    'reminder_date': next_date,
+                    'amount': row.amount,
+                    'status': 'Pending'
+                }
+                for (member_id, next_date), row in wanted.items()
+                if (member_id, next_date) not in existing
+            ]
+            if new_rows:
+                connection.execute(insert(table), new_rows)
+                adjust_stats(connection, pending_reminders=len(new_rows))
+
+            connection.execute(
+                update(table)
+                .where(table.c.id.in_([row.id for row in chunk]))
+                .values(rolled_over_at=datetime.utcnow())
+            )
+
+        result['chunks'] += 1
+        result['rolled_over'] += len(new_rows)
+        result['skipped'] += len(chunk) - len(new_rows)
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(
+        "Fee reminders: %(due)d due, %(rolled_over)d rolled over, %(skipped)d already "
+        "rolled over, %(chunks)d chunks in %(seconds).3fs", result
+    )
+    return result
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta, timezone, time
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import Date, and_
+
+# Date range helpers.
+#
+# Attendance times are stored as the gym's local wall-clock time, payment
+# dates in UTC. Filters compare the raw column against a half-open
+# [start, end) range so SQLite can use the index instead of evaluating
+# date(column) for every row.
+
+
+def gym_timezone():
+    name = current_app.config.get('GYM_TIMEZONE')
+    return ZoneInfo(name) if name else None
+
+
+def gym_now():
+    tz = gym_timezone()
+    if tz is None:
+        return datetime.now()
+    return datetime.now(tz).replace(tzinfo=None)
+
+
+def gym_today():
+    return gym_now().date()
+
+
+def period_bounds(day, period='day'):
+    if period == 'day':
+        start = day
+        end = day + timedelta(days=1)
+    elif period == 'week':
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
+    elif period == 'month':
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+    else:
+        raise ValueError(f'Unknown period: {period}')
+    return datetime.combine(start, time.min), datetime.combine(end, time.min)
+
+
+def local_to_utc(local_dt):
+    tz = gym_timezone()
+    if tz is None:
+        # Naive datetimes are taken as server local time by astimezone()
+        return local_dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return local_dt.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_gym_time(dt):
+    # Aware datetimes (e.g. device timestamps) to naive gym local time
+    if dt.tzinfo is None:
+        return dt
+    tz = gym_timezone()
+    return (dt.astimezone(tz) if tz else dt.astimezone()).replace(tzinfo=None)
+
+
+def parse_device_timestamp(value):
+    # Epoch seconds or ISO 8601 from a device; missing means now
+    if value is None:
+        return gym_now()
+    if isinstance(value, (int, float)):
+        return to_gym_time(datetime.fromtimestamp(value, timezone.utc))
+    return to_gym_time(datetime.fromisoformat(str(value).replace('Z', '+00:00')))
+
+
+def device_timestamp_refusal(moment, now=None):
+    # Reason a device's check-in time is refused, or None. Devices may report
+    # check-ins DEVICE_TIMESTAMP_MAX_AGE_HOURS late, but not ahead of the
+    # server clock by more than DEVICE_TIMESTAMP_MAX_SKEW_SECONDS
+    now = now or gym_now()
+    config = current_app.config
+    if moment < now - timedelta(hours=config['DEVICE_TIMESTAMP_MAX_AGE_HOURS']):
+        return 'Timestamp too old'
+    if moment > now + timedelta(seconds=config['DEVICE_TIMESTAMP_MAX_SKEW_SECONDS']):
+        return 'Timestamp in the future'
+    return None
+
+
+def in_range(column, start, end, utc=False):
+    # start/end are local datetimes; utc=True for columns stored in UTC
+    if utc:
+        start, end = local_to_utc(start), local_to_utc(end)
+    return and_(column >= start, column < end)
+
+
+def in_period(column, day, period='day', utc=False):
+    start, end = period_bounds(day, period)
+    return in_range(column, start, end, utc=utc)
+
+
+def parse_date_range(args):
+    # Inclusive ?start=YYYY-MM-DD&end=YYYY-MM-DD filter; either may be blank.
+    # A date that does not parse raises ValueError instead of dropping the
+    # filter, which would match every row
+    start = end = None
+    for name in ('start', 'end'):
+        if not args.get(name):
+            continue
+        try:
+            day = datetime.strptime(args[name], '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f'Invalid {name} date (expected YYYY-MM-DD)')
+        if name == 'start':
+            start = day
+        else:
+            end = day + timedelta(days=1)
+    return start, end
+
+
+def filter_date_range(query, column, start, end, utc=False):
+    if isinstance(column.type, Date):
+        # Date columns compare as 'YYYY-MM-DD' text on SQLite, which sorts
+        # before the same day as a datetime
+        start = start.date() if start is not None else None
+        end = end.date() if end is not None else None
+        utc = False
+    if start is not None:
+        query = query.filter(column >= (local_to_utc(start) if utc else start))
+    if end is not None:
+        query = query.filter(column < (local_to_utc(end) if utc else end))
+    return query
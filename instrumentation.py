@@ -0,0 +1,297 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import (Blueprint, abort, before_render_template, current_app, g, has_app_context,
+                   has_request_context, request, template_rendered)
+from flask_login import current_user
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Per-request SQL instrumentation.
+#
+# Engine listeners time every statement. Inside a request the count, total
+# database time and the statements run are kept on flask.g; the template
+# signals add the render time and how many queries ran while rendering (lazy
+# loads from templates). After the request the totals go into per-endpoint
+# counters, served in the Prometheus text format at /metrics. Counters are
+# per process, so each worker reports its own and Prometheus adds them up.
+#
+# A statement slower than SLOW_QUERY_MS is logged with its call site, the
+# first frame in this repository's code (or template) that ran it. The same
+# statement run N_PLUS_ONE_THRESHOLD times in one request is flagged as a
+# likely N+1 and logged once per endpoint. With DEV_TOOLBAR set, HTML pages
+# get a summary bar and a Server-Timing header.
+#
+# Streamed responses (the exports) finish after the request hooks, so the
+# queries they run while streaming are not counted.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+bp = Blueprint('instrumentation', __name__)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_queries = 0
+        self.render_started = None
+        self.statements = Counter()
+        self.repeated = {}  # statement -> call site where it hit the threshold
+        self.slow = []      # (seconds, call site, statement)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.responses = Counter()  # (method, status) -> count
+        self.buckets = [0] * len(REQUEST_BUCKETS)
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_queries = 0
+        self.slow_queries = 0
+        self.repeated_statements = 0
+
+
+class Instrumentation:
+    def __init__(self, slow_query_seconds, repeat_threshold):
+        self.slow_query_seconds = slow_query_seconds
+        self.repeat_threshold = repeat_threshold
+        self.endpoints = defaultdict(EndpointStats)
+        self.reported = set()  # (endpoint, statement) N+1 warnings already logged
+        self._lock = threading.Lock()
+
+    def record_slow(self, endpoint):
+        with self._lock:
+            self.endpoints[endpoint].slow_queries += 1
+
+    def record_request(self, endpoint, method, status, profile):
+        elapsed = time.perf_counter() - profile.started
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats.responses[(method, status)] += 1
+            for i, bound in enumerate(REQUEST_BUCKETS):
+                if elapsed <= bound:
+                    stats.buckets[i] += 1
+            stats.seconds += elapsed
+            stats.queries += profile.queries
+            stats.db_seconds += profile.db_seconds
+            stats.render_seconds += profile.render_seconds
+            stats.render_queries += profile.render_queries
+            stats.repeated_statements += len(profile.repeated)
+            new_reports = [statement for statement in profile.repeated
+                           if (endpoint, statement) not in self.reported]
+            self.reported.update((endpoint, statement) for statement in new_reports)
+        for statement in new_reports:
+            logger.warning("Possible N+1 in %s: statement run %d times, repeated from %s: %s",
+                           endpoint, profile.statements[statement], profile.repeated[statement],
+                           one_line(statement))
+        return elapsed
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: (Counter(stats.responses), list(stats.buckets), dict(vars(stats)))
+                    for endpoint, stats in self.endpoints.items()}
+
+
+def init_instrumentation(app):
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return None
+    instrumentation = Instrumentation(app.config['SLOW_QUERY_MS'] / 1000.0, app.config['N_PLUS_ONE_THRESHOLD'])
+    app.extensions['instrumentation'] = instrumentation
+    app.register_blueprint(bp)
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    before_render_template.connect(render_started, app)
+    template_rendered.connect(render_finished, app)
+    return instrumentation
+
+
+def one_line(statement, limit=500):
+    text = ' '.join(statement.split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def call_site():
+    """'file:line in function' of the innermost frame in this repository's
+    code or templates that led to the current statement."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return f"{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}"
+        if (filename.startswith(ROOT) and filename != __file__
+                and 'site-packages' not in filename):
+            return f"{os.path.relpath(filename, ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def current_endpoint():
+    if not has_request_context():
+        return 'background'
+    return request.endpoint or 'unmatched'
+
+
+# Request hooks
+def start_profile():
+    g.sql_profile = RequestProfile()
+
+
+def finish_profile(response):
+    profile = g.pop('sql_profile', None)
+    instrumentation = current_app.extensions['instrumentation']
+    if profile is None:
+        return response
+    endpoint = current_endpoint()
+    elapsed = instrumentation.record_request(endpoint, request.method, response.status_code, profile)
+    if current_app.config['DEV_TOOLBAR'] and endpoint != 'instrumentation.metrics':
+        add_toolbar(response, endpoint, elapsed, profile)
+    return response
+
+
+def render_started(sender, template, context, **extra):
+    profile = g.get('sql_profile')
+    if profile is not None:
+        profile.render_started = time.perf_counter()
+
+
+def render_finished(sender, template, context, **extra):
+    profile = g.get('sql_profile')
+    if profile is not None and profile.render_started is not None:
+        profile.render_seconds += time.perf_counter() - profile.render_started
+        profile.render_started = None
+
+
+# Engine listeners
+@event.listens_for(Engine, 'before_cursor_execute')
+def query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instrumentation_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_instrumentation_started', None)
+    if started is None or not has_app_context():
+        return
+    instrumentation = current_app.extensions.get('instrumentation')
+    if instrumentation is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    profile = g.get('sql_profile') if has_request_context() else None
+    if profile is not None:
+        profile.queries += 1
+        profile.db_seconds += elapsed
+        if profile.render_started is not None:
+            profile.render_queries += 1
+        profile.statements[statement] += 1
+        if profile.statements[statement] == instrumentation.repeat_threshold:
+            profile.repeated[statement] = call_site()
+
+    if elapsed >= instrumentation.slow_query_seconds:
+        site = call_site()
+        if profile is not None:
+            profile.slow.append((elapsed, site, statement))
+        instrumentation.record_slow(current_endpoint())
+        logger.warning("Slow query (%.0f ms) at %s: %s", elapsed * 1000, site, one_line(statement))
+
+
+# Dev toolbar
+def add_toolbar(response, endpoint, elapsed, profile):
+    response.headers['Server-Timing'] = (
+        f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.queries} queries", '
+        f'render;dur={profile.render_seconds * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+    )
+    if response.mimetype != 'text/html' or response.is_streamed:
+        return
+    body = response.get_data(as_text=True)
+    if '</body>' not in body:
+        return
+    problems = [
+        f'<li>N+1: {profile.statements[statement]}&times; from {escape(site)}: '
+        f'<code>{escape(one_line(statement, 200))}</code></li>'
+        for statement, site in profile.repeated.items()
+    ] + [
+        f'<li>Slow ({seconds * 1000:.0f} ms) at {escape(site)}: <code>{escape(one_line(statement, 200))}</code></li>'
+        for seconds, site, statement in profile.slow
+    ]
+    toolbar = (
+        '<div id="dev-toolbar" class="fixed-bottom bg-dark text-light small px-3 py-1 opacity-75">'
+        f'{escape(endpoint)} &middot; {elapsed * 1000:.1f} ms &middot; '
+        f'{profile.queries} queries in {profile.db_seconds * 1000:.1f} ms &middot; '
+        f'render {profile.render_seconds * 1000:.1f} ms ({profile.render_queries} queries)'
+        + (f'<ul class="mb-0 text-warning">{"".join(problems)}</ul>' if problems else '')
+        + '</div>'
+    )
+    response.set_data(body.replace('</body>', toolbar + '</body>', 1))
+
+
+# /metrics
+def format_labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def render_metrics(snapshot):
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('gym_http_requests_total', 'counter', 'Requests handled, by endpoint, method and status.')
+    for endpoint, (responses, _, _) in sorted(snapshot.items()):
+        for (method, status), count in sorted(responses.items()):
+            lines.append(f'gym_http_requests_total{format_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    family('gym_http_request_duration_seconds', 'histogram', 'Time to handle a request.')
+    for endpoint, (responses, buckets, stats) in sorted(snapshot.items()):
+        for bound, count in zip(REQUEST_BUCKETS, buckets):
+            lines.append(f'gym_http_request_duration_seconds_bucket{format_labels(endpoint=endpoint, le=bound)} {count}')
+        total = sum(responses.values())
+        lines.append(f'gym_http_request_duration_seconds_bucket{format_labels(endpoint=endpoint, le="+Inf")} {total}')
+        lines.append(f'gym_http_request_duration_seconds_sum{format_labels(endpoint=endpoint)} {stats["seconds"]:.6f}')
+        lines.append(f'gym_http_request_duration_seconds_count{format_labels(endpoint=endpoint)} {total}')
+
+    for name, key, kind, help_text in (
+        ('gym_db_queries_total', 'queries', 'counter', 'SQL statements run by requests.'),
+        ('gym_db_query_seconds_total', 'db_seconds', 'counter', 'Time spent in SQL statements.'),
+        ('gym_template_render_seconds_total', 'render_seconds', 'counter', 'Time spent rendering templates.'),
+        ('gym_template_queries_total', 'render_queries', 'counter',
+         'SQL statements run while rendering templates (lazy loads).'),
+        ('gym_db_slow_queries_total', 'slow_queries', 'counter', 'Statements slower than SLOW_QUERY_MS.'),
+        ('gym_db_repeated_statements_total', 'repeated_statements', 'counter',
+         'Statements run N_PLUS_ONE_THRESHOLD or more times in one request (likely N+1).'),
+    ):
+        family(name, kind, help_text)
+        for endpoint, (_, _, stats) in sorted(snapshot.items()):
+            value = stats[key]
+            lines.append(f'{name}{format_labels(endpoint=endpoint)} '
+                         + (f'{value:.6f}' if isinstance(value, float) else str(value)))
+    return '\n'.join(lines) + '\n'
+
+
+@bp.route('/metrics')
+def metrics():
+    # A scraper sends METRICS_TOKEN as a bearer token; people log in as admin
+    token = current_app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if not (token and authorization == f'Bearer {token}'):
+        if not (current_user.is_authenticated and current_user.role == 'admin'):
+            abort(403 if current_user.is_authenticated else 401)
+    snapshot = current_app.extensions['instrumentation'].snapshot()
+    return current_app.response_class(render_metrics(snapshot), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from models import db, JobLock, JobRun
+
+logger = logging.getLogger(__name__)
+
+# Scheduled jobs.
+#
+# Every web worker process may start a scheduler, so a job firing at 9:00
+# fires once per process. run_job() only runs it in the process that wins the
+# job's JobLock row with a conditional UPDATE:
+#
+#   UPDATE job_lock SET owner = :me, locked_until = :now + lease, ...
+#   WHERE name = :job AND (locked_until IS NULL OR locked_until < :now)
+#     AND (last_started_at IS NULL OR last_started_at <= :now - min_gap)
+#
+# The lease keeps two runs from overlapping, and min_gap keeps the other
+# processes from running the job again once the winner has released the
+# lock. While the job runs, a heartbeat thread extends the lease every third
+# of it, so a run that takes longer than its lease keeps the lock; the lease
+# only runs out when the process holding it has died. Every run that got the
+# lock is recorded in JobRun.
+#
+# Triggers are given as (kind, options), e.g. ('cron', {'hour': 9}); cron
+# times are in GYM_TIMEZONE (server local time when unset). APScheduler is only imported when a scheduler is actually started, so the
+# CLI and anything else that imports the app doesn't pay for it.
+
+JOBS = {}  # name -> dict(name, func, trigger, schedule, description, lease, min_gap, rows_key)
+
+OWNER = f'{socket.gethostname()}:{os.getpid()}'
+
+_scheduler_lock = threading.Lock()
+
+
+def format_trigger(trigger):
+    kind, options = trigger
+    return f"{kind}[{', '.join(f'{key}={value}' for key, value in options.items())}]"
+
+
+def register_job(name, func, trigger, description, lease=timedelta(minutes=30),
+                 min_gap=timedelta(0), rows_key=None):
+    """Add a job to the registry. ``func`` is called inside an app context and
+    returns a dict; ``rows_key`` names its entry counting the rows touched.
+    ``trigger`` is a (kind, options) pair for an APScheduler trigger."""
+    JOBS[name] = dict(name=name, func=func, trigger=trigger, schedule=format_trigger(trigger),
+                      description=description, lease=lease, min_gap=min_gap, rows_key=rows_key)
+
+
+def acquire_lock(name, lease, min_gap=timedelta(0), owner=OWNER):
+    table = JobLock.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        acquired = connection.execute(
+            update(table)
+            .where(
+                table.c.name == name,
+                or_(table.c.locked_until.is_(None), table.c.locked_until < now),
+                or_(table.c.last_started_at.is_(None), table.c.last_started_at <= now - min_gap)
+            )
+            .values(owner=owner, locked_until=now + lease, last_started_at=now)
+        ).rowcount == 1
+    if acquired:
+        return True
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(insert(table).values(
+                name=name, owner=owner, locked_until=now + lease, last_started_at=now
+            ))
+        return True
+    except IntegrityError:
+        # Somebody else holds it
+        return False
+
+
+def release_lock(name, owner=OWNER):
+    table = JobLock.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table)
+            .where(table.c.name == name, table.c.owner == owner)
+            .values(locked_until=None)
+        )
+
+
+def renew_lock(name, lease, owner=OWNER):
+    table = JobLock.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            update(table)
+            .where(table.c.name == name, table.c.owner == owner, table.c.locked_until.isnot(None))
+            .values(locked_until=datetime.utcnow() + lease)
+        ).rowcount == 1
+
+
+def _keep_lock(app, name, lease, stop):
+    with app.app_context():
+        while not stop.wait(lease.total_seconds() / 3):
+            try:
+                renew_lock(name, lease)
+            except OperationalError:
+                # e.g. SQLite busy behind the job's own writes; try next beat
+                logger.warning("Could not renew the lock of job %s", name, exc_info=True)
+
+
+def run_job(name, trigger='schedule', force=False):
+    """Run a registered job if this process gets its lock.
+
+    ``force`` (manual and CLI runs) skips the min_gap check but still waits
+    for a running instance's lease. Returns the JobRun id, or None when the
+    job was skipped.
+    """
+    job = JOBS[name]
+    min_gap = timedelta(0) if force else job['min_gap']
+    if not acquire_lock(name, job['lease'], min_gap):
+        logger.debug("Job %s skipped, locked by another process", name)
+        return None
+
+    runs = JobRun.__table__
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_keep_lock, args=(current_app._get_current_object(), name, job['lease'], stop),
+        name=f'job-lock-{name}', daemon=True
+    )
+    heartbeat.start()
+    try:
+        with db.engine.begin() as connection:
+            run_id = connection.execute(insert(runs).values(
+                job=name, trigger=trigger, owner=OWNER, started_at=datetime.utcnow(), status='running'
+            )).inserted_primary_key[0]
+
+        started = time.perf_counter()
+        values = {'status': 'success'}
+        try:
+            result = job['func']() or {}
+            values['details'] = json.dumps(result, default=str)
+            if job['rows_key']:
+                values['rows'] = result.get(job['rows_key'])
+        except Exception:
+            logger.exception("Job %s failed", name)
+            db.session.rollback()
+            values.update(status='failed', error=traceback.format_exc())
+        values.update(finished_at=datetime.utcnow(), duration=round(time.perf_counter() - started, 3))
+
+        with db.engine.begin() as connection:
+            connection.execute(update(runs).where(runs.c.id == run_id).values(values))
+        logger.info("Job %s %s in %.3fs", name, values['status'], values['duration'])
+        return run_id
+    finally:
+        stop.set()
+        heartbeat.join()
+        release_lock(name)
+
+
+def run_job_in_background(app, name, trigger='manual'):
+    def target():
+        with app.app_context():
+            run_job(name, trigger=trigger, force=True)
+
+    thread = threading.Thread(target=target, name=f'job-{name}', daemon=True)
+    thread.start()
+    return thread
+
+
+def job_status():
+    """[(job, lock, last_run)] for every registered job."""
+    locks = {lock.name: lock for lock in JobLock.query.all()}
+    status = []
+    for name in JOBS:
+        last_run = JobRun.query.filter_by(job=name).order_by(JobRun.id.desc()).first()
+        status.append((JOBS[name], locks.get(name), last_run))
+    return status
+
+
+def init_scheduler(app):
+    """Start this process's scheduler with every registered job, once."""
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+    triggers = {'cron': CronTrigger, 'interval': IntervalTrigger}
+
+    def fire(name):
+        with app.app_context():
+            run_job(name)
+
+    with _scheduler_lock:
+        if 'scheduler' in app.extensions:
+            return app.extensions['scheduler']
+
+        scheduler = BackgroundScheduler()
+        for name, job in JOBS.items():
+            kind, options = job['trigger']
+            if kind == 'cron' and app.config.get('GYM_TIMEZONE'):
+                options = dict(options, timezone=app.config['GYM_TIMEZONE'])
+            scheduler.add_job(
+                func=fire,
+                args=(name,),
+                trigger=triggers[kind](**options),
+                id=name,
+                name=job['description'],
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        scheduler.start()
+        app.extensions['scheduler'] = scheduler
+        return scheduler
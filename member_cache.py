@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Member
+
+# Compact record kept per member; enough to validate a check-in and greet
+# the member without touching the database
+MemberCredential = namedtuple('MemberCredential', 'id display_name status membership_type')
+
+
+class MemberCache:
+    """Bounded LRU of MemberCredential keyed by member id (the check-in code).
+
+    Entries are dropped by the Member listeners below when a member changes
+    in this process. ``ttl`` bounds how long a change made by another worker
+    process can go unnoticed.
+    """
+
+    def __init__(self, max_size=50000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, member_id):
+        return self.get_many([member_id]).get(member_id)
+
+    def get_many(self, member_ids):
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for member_id in set(member_ids):
+                entry = self._entries.get(member_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(member_id)
+                    found[member_id] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(member_id)
+                    self.misses += 1
+            generation = self._generation
+
+        if missing:
+            rows = db.session.query(
+                Member.id, Member.first_name, Member.last_name, Member.status, Member.membership_type
+            ).filter(Member.id.in_(missing)).all()
+            loaded = {
+                row.id: MemberCredential(row.id, f'{row.first_name} {row.last_name}',
+                                         row.status, row.membership_type)
+                for row in rows
+            }
+            found.update(loaded)
+            with self._lock:
+                # Skip the insert if an invalidation ran while we were
+                # reading; what we loaded may already be stale
+                if generation == self._generation:
+                    for member_id, credential in loaded.items():
+                        self._put(member_id, credential, now)
+        return found
+
+    def _put(self, member_id, credential, now):
+        self._entries[member_id] = (credential, now + self.ttl)
+        self._entries.move_to_end(member_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *member_ids):
+        with self._lock:
+            self._generation += 1
+            for member_id in member_ids:
+                self._entries.pop(member_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+member_cache = MemberCache()
+
+
+# Drop entries as soon as a change is flushed, and once more after commit
+# in case a concurrent lookup re-read the old row in between
+@event.listens_for(Member, 'after_insert')
+@event.listens_for(Member, 'after_update')
+@event.listens_for(Member, 'after_delete')
+def invalidate_member(mapper, connection, target):
+    member_cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('member_cache_invalidate', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_members(session):
+    member_ids = session.info.pop('member_cache_invalidate', None)
+    if member_ids:
+        member_cache.invalidate(*member_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_member_invalidations(session):
+    session.info.pop('member_cache_invalidate', None)
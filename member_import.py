@@ -0,0 +1,191 @@
+import csv
+import logging
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Member, FeeReminder, MEMBERSHIP_FEES, calculate_membership_fee, first_reminder_date
+from stats import adjust_stats
+from member_search import phone_digits, index_members
+
+logger = logging.getLogger(__name__)
+
+# Bulk member import from CSV.
+#
+# Rows are validated as they are read and handled in chunks. Each chunk needs
+# one query to find emails that already exist (ignoring case), then one
+# transaction that bulk inserts the members and their first fee reminders.
+# This bypasses the per-row ORM listeners, so the dashboard counters and the
+# member search index are updated here. A member added between the check and
+# the insert (add_member, another import) fails the chunk on the unique email;
+# its rows are then inserted one at a time and the duplicate is rejected.
+
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'email', 'membership_type')
+OPTIONAL_COLUMNS = ('phone', 'date_of_birth', 'join_date', 'status')
+MEMBER_STATUSES = ('Active', 'Inactive', 'Suspended')
+REPORT_COLUMNS = ('line', 'reason') + REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class ImportResult:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'read': self.read,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+
+def _parse_date(value, field):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'Invalid {field} (expected YYYY-MM-DD)')
+
+
+def validate_row(row):
+    """Return the Member column values for a CSV row or raise ValueError."""
+    values = {name: (row.get(name) or '').strip() for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+    for name in REQUIRED_COLUMNS:
+        if not values[name]:
+            raise ValueError(f'Missing {name}')
+    if not EMAIL_RE.match(values['email']):
+        raise ValueError('Invalid email')
+    if values['membership_type'] not in MEMBERSHIP_FEES:
+        raise ValueError('Unknown membership_type')
+    status = values['status'] or 'Active'
+    if status not in MEMBER_STATUSES:
+        raise ValueError('Unknown status')
+    for name, limit in (('first_name', 50), ('last_name', 50), ('email', 100), ('phone', 20)):
+        if len(values[name]) > limit:
+            raise ValueError(f'{name} is longer than {limit} characters')
+
+    return {
+        'first_name': values['first_name'],
+        'last_name': values['last_name'],
+        'email': values['email'],
+        'phone': values['phone'] or None,
+        'phone_digits': phone_digits(values['phone']),
+        'date_of_birth': _parse_date(values['date_of_birth'], 'date_of_birth'),
+        'join_date': _parse_date(values['join_date'], 'join_date') or datetime.utcnow().date(),
+        'membership_type': values['membership_type'],
+        'status': status
+    }
+
+
+def _write_members(members):
+    table = Member.__table__
+    with db.engine.begin() as connection:
+        inserted = connection.execute(
+            insert(table).returning(table.c.id, table.c.email), members
+        ).all()
+        member_ids = {row.email: row.id for row in inserted}
+        connection.execute(insert(FeeReminder.__table__), [
+            {
+                'member_id': member_ids[values['email']],
+                'reminder_date': first_reminder_date(values['join_date']),
+                'amount': calculate_membership_fee(values['membership_type']),
+                'status': 'Pending'
+            }
+            for values in members
+        ])
+        adjust_stats(connection, total_members=len(members), pending_reminders=len(members))
+        index_members(connection, [dict(values, id=member_ids[values['email']]) for values in members])
+
+
+def _insert_chunk(chunk, result, reject):
+    emails = {values['email'].lower() for _, _, values in chunk}
+    with db.engine.connect() as connection:
+        taken = set(connection.scalars(
+            select(func.lower(Member.email)).where(func.lower(Member.email).in_(emails))
+        ))
+
+    accepted = []
+    for line, row, values in chunk:
+        email = values['email'].lower()
+        if email in taken:
+            reject(line, row, 'A member with this email already exists')
+            continue
+        # Also catches duplicates within the file
+        taken.add(email)
+        accepted.append((line, row, values))
+    if not accepted:
+        return
+
+    try:
+        _write_members([values for _, _, values in accepted])
+    except IntegrityError:
+        logger.warning("Member import: chunk of %d rows hit a duplicate email, retrying row by row", len(accepted))
+        for line, row, values in accepted:
+            try:
+                _write_members([values])
+            except IntegrityError:
+                reject(line, row, 'A member with this email already exists')
+                continue
+            result.imported += 1
+        return
+    result.imported += len(accepted)
+
+
+def import_members(stream, report=None, chunk_size=1000):
+    """Import members from a CSV text stream.
+
+    ``report`` is an optional text stream that receives one CSV line per
+    rejected row with its line number and reason.
+    """
+    started = time.perf_counter()
+    result = ImportResult()
+    reader = csv.DictReader(stream)
+    header = [name.strip() for name in (reader.fieldnames or [])]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ValueError('CSV is missing columns: ' + ', '.join(missing))
+    reader.fieldnames = header
+
+    report_writer = csv.writer(report) if report is not None else None
+    if report_writer:
+        report_writer.writerow(REPORT_COLUMNS)
+
+    def reject(line, row, reason):
+        result.rejected += 1
+        if report_writer:
+            report_writer.writerow([line, reason] + [row.get(name, '') for name in REPORT_COLUMNS[2:]])
+
+    chunk = []
+    for row in reader:
+        result.read += 1
+        line = reader.line_num
+        try:
+            values = validate_row(row)
+        except ValueError as e:
+            reject(line, row, str(e))
+            continue
+        chunk.append((line, row, values))
+        if len(chunk) >= chunk_size:
+            _insert_chunk(chunk, result, reject)
+            chunk = []
+    if chunk:
+        _insert_chunk(chunk, result, reject)
+
+    result.seconds = time.perf_counter() - started
+    logger.info("Member import: %(read)d rows read, %(imported)d imported, %(rejected)d rejected "
+                "in %(seconds).3fs (%(rows_per_second).0f rows/s)", result.as_dict())
+    return result
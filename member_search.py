@@ -0,0 +1,169 @@
+import re
+
+from sqlalchemy import and_, event, inspect, or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Member
+
+# Member search for the typeahead member pickers.
+#
+# On SQLite the name, email and phone number of every member are kept in an
+# FTS5 table, member_search, whose rowid is the member id. A query such as
+# "ali 0300" becomes the prefix match '"ali"* AND "0300"*', answered from the
+# FTS index (with prefix indexes for 1-3 characters) in a millisecond or two
+# whatever the number of members. Phone numbers are indexed as digits: whole,
+# the last 10 with and without a leading 0, and the last 7. So
+# "+92 300-1234567", "03001234567" and "1234567" all find the same member.
+#
+# The Member listeners below keep the index in sync on the flush connection;
+# the bulk import calls index_members() itself. Where FTS5 is not available
+# (PostgreSQL, SQLite builds without it) search falls back to prefix LIKE
+# over names and email plus a substring match on Member.phone_digits.
+
+MAX_TERMS = 6
+
+_fts_tables = {}  # engine URL -> whether member_search exists
+
+
+def phone_digits(phone):
+    return re.sub(r'\D', '', phone or '') or None
+
+
+def _phone_terms(phone):
+    digits = phone_digits(phone)
+    if not digits:
+        return ''
+    # Also the national number with its leading 0, as it is usually dialled
+    return ' '.join(sorted({digits, digits[-10:], '0' + digits[-10:], digits[-7:]}))
+
+
+def _terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def fts_enabled(connection):
+    key = str(connection.engine.url)
+    if key not in _fts_tables:
+        _fts_tables[key] = connection.dialect.name == 'sqlite' and connection.scalar(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'member_search'"
+        )) is not None
+    return _fts_tables[key]
+
+
+def index_members(connection, members):
+    """(Re)index members given as mappings with id, first_name, last_name,
+    email and phone."""
+    if not fts_enabled(connection):
+        return
+    rows = [
+        {'id': member['id'], 'name': f"{member['first_name']} {member['last_name']}",
+         'email': member['email'] or '', 'phone': _phone_terms(member['phone'])}
+        for member in members
+    ]
+    if not rows:
+        return
+    connection.execute(text('DELETE FROM member_search WHERE rowid = :id'), [{'id': row['id']} for row in rows])
+    connection.execute(
+        text('INSERT INTO member_search (rowid, name, email, phone) VALUES (:id, :name, :email, :phone)'), rows
+    )
+
+
+def rebuild_member_search(connection, chunk_size=10000):
+    """Create the FTS table if needed and reindex every member. Returns the
+    number of members indexed, or None without FTS5."""
+    try:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS member_search USING fts5("
+            "name, email, phone, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+        ))
+    except OperationalError:
+        # No FTS5 in this SQLite build
+        _fts_tables[str(connection.engine.url)] = False
+        return None
+    _fts_tables[str(connection.engine.url)] = True
+
+    connection.execute(text('DELETE FROM member_search'))
+    members = Member.__table__
+    result = connection.execution_options(yield_per=chunk_size).execute(
+        select(members.c.id, members.c.first_name, members.c.last_name, members.c.email, members.c.phone)
+    )
+    indexed = 0
+    for rows in result.partitions():
+        index_members(connection, [row._mapping for row in rows])
+        indexed += len(rows)
+    return indexed
+
+
+def ensure_member_search():
+    # Built once for SQLite databases created before the index existed
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite' and not fts_enabled(connection):
+            rebuild_member_search(connection)
+
+
+def search_members(query, limit=10):
+    """Members matching every word of ``query`` as a prefix of their name,
+    email or phone, best matches first. An all-digit query also matches the
+    member id (the check-in code) exactly."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    columns = (Member.id, Member.first_name, Member.last_name, Member.email, Member.phone,
+               Member.membership_type, Member.status)
+
+    connection = db.session.connection()
+    if fts_enabled(connection):
+        match = ' AND '.join(f'"{term}"*' for term in terms)
+        ids = list(connection.scalars(
+            text('SELECT rowid FROM member_search WHERE member_search MATCH :match ORDER BY rank LIMIT :limit'),
+            {'match': match, 'limit': limit}
+        ))
+    else:
+        conditions = []
+        for term in terms:
+            term_conditions = [Member.first_name.ilike(f'{term}%'), Member.last_name.ilike(f'{term}%'),
+                               Member.email.ilike(f'{term}%')]
+            if term.isdigit():
+                term_conditions.append(Member.phone_digits.like(f'%{term}%'))
+            conditions.append(or_(*term_conditions))
+        ids = list(db.session.scalars(
+            select(Member.id).where(and_(*conditions)).order_by(Member.last_name, Member.first_name, Member.id)
+            .limit(limit)
+        ))
+
+    if len(terms) == 1 and terms[0].isdigit() and len(terms[0]) <= 9 and int(terms[0]) not in ids:
+        ids = [int(terms[0])] + ids[:limit - 1]
+    if not ids:
+        return []
+    rows = {row.id: row for row in db.session.execute(select(*columns).where(Member.id.in_(ids)))}
+    return [rows[member_id] for member_id in ids if member_id in rows]
+
+
+# Member listeners
+@event.listens_for(Member, 'before_insert')
+@event.listens_for(Member, 'before_update')
+def member_phone_digits(mapper, connection, target):
+    target.phone_digits = phone_digits(target.phone)
+
+
+def _search_values(target):
+    return {'id': target.id, 'first_name': target.first_name, 'last_name': target.last_name,
+            'email': target.email, 'phone': target.phone}
+
+
+@event.listens_for(Member, 'after_insert')
+def member_inserted(mapper, connection, target):
+    index_members(connection, [_search_values(target)])
+
+
+@event.listens_for(Member, 'after_update')
+def member_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('first_name', 'last_name', 'email', 'phone')):
+        index_members(connection, [_search_values(target)])
+
+
+@event.listens_for(Member, 'after_delete')
+def member_deleted(mapper, connection, target):
+    if fts_enabled(connection):
+        connection.execute(text('DELETE FROM member_search WHERE rowid = :id'), {'id': target.id})
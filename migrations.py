@@ -0,0 +1,118 @@
+import warnings
+
+from sqlalchemy import exc, inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from models import db
+
+# In-place schema upgrades for an existing gym.db.
+#
+# db.create_all() only creates missing tables, so anything added to an
+# existing model afterwards (columns, indexes) has to be applied here. Every
+# step is idempotent and safe to run on each startup.
+
+# Data fixes to run right after a column is added to an existing table,
+# keyed by (table, column)
+COLUMN_BACKFILLS = {
+    ('fitness_class', 'seats_taken'): (
+        'UPDATE fitness_class SET seats_taken = ('
+        'SELECT COUNT(*) FROM class_registration WHERE class_registration.class_id = fitness_class.id)'
+    ),
+    ('payment', 'membership_type'): (
+        'UPDATE payment SET membership_type = ('
+        'SELECT membership_type FROM member WHERE member.id = payment.member_id)'
+    ),
+    ('member', 'phone_digits'): (
+        "UPDATE member SET phone_digits = NULLIF(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE("
+        "phone, ' ', ''), '-', ''), '+', ''), '(', ''), ')', ''), '.', ''), '')"
+    ),
+    ('member', 'updated_at'): 'UPDATE member SET updated_at = CURRENT_TIMESTAMP',
+}
+
+# Indexes that were removed from the models, keyed by table
+DROPPED_INDEXES = {
+    # Covered by ix_attendance_record_check_in_id (check_in, id)
+    'attendance_record': ['ix_attendance_record_check_in'],
+    # phone_digits is only searched with LIKE '%digits%', which cannot use it
+    'member': ['ix_member_phone_digits'],
+}
+
+
+def _add_missing_columns(connection):
+    inspector = inspect(connection)
+    added = set()
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            if column.server_default is not None:
+                default = column.server_default.arg
+                if not isinstance(default, str):
+                    default = str(default.compile(dialect=connection.dialect))
+                else:
+                    default = "'%s'" % default.replace("'", "''")
+                ddl += f' DEFAULT {default}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+            connection.execute(text(ddl))
+            added.add((table.name, column.name))
+    return added
+
+
+def _dedupe_class_registrations(connection):
+    # The unique index below cannot be built while duplicates exist; keep the
+    # oldest registration of each (member, class) pair
+    connection.execute(text(
+        'DELETE FROM class_registration WHERE id NOT IN ('
+        'SELECT MIN(id) FROM class_registration GROUP BY member_id, class_id)'
+    ))
+
+
+def _index_names(inspector, table):
+    # SQLite does not reflect expression indexes (lower(email)) and warns
+    # about each one; _create_missing_indexes() uses IF NOT EXISTS for them
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', exc.SAWarning)
+        return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def _create_missing_indexes(connection):
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        existing = _index_names(inspector, table.name)
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.name == 'uq_class_registration_member_class':
+                _dedupe_class_registrations(connection)
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _drop_removed_indexes(connection):
+    inspector = inspect(connection)
+    for table, names in DROPPED_INDEXES.items():
+        if not inspector.has_table(table):
+            continue
+        existing = _index_names(inspector, table)
+        for name in names:
+            if name in existing:
+                connection.execute(text(f'DROP INDEX {name}'))
+
+
+def upgrade_database():
+    """Create missing tables, columns and indexes on the bound database and
+    drop the indexes the models no longer have."""
+    db.create_all()
+    with db.engine.begin() as connection:
+        added = _add_missing_columns(connection)
+        _create_missing_indexes(connection)
+        _drop_removed_indexes(connection)
+        for key in sorted(added):
+            if key in COLUMN_BACKFILLS:
+                connection.execute(text(COLUMN_BACKFILLS[key]))
+    return added
@@ -24,49 +24,126 @@ class Member(db.Model):
     last_name = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     phone = db.Column(db.String(20))
+    # phone without punctuation, set by member_search.py for phone lookups
+    # (a substring match, so not indexed)
+    phone_digits = db.Column(db.String(20))
     date_of_birth = db.Column(db.Date)
     join_date = db.Column(db.Date, default=datetime.utcnow)
     membership_type = db.Column(db.String(50), nullable=False)  # Basic, Premium, VIP
     status = db.Column(db.String(20), default='Active')  # Active, Inactive, Suspended
+    # Last change, for the allow-list deltas sent to attendance devices (device_sync.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     payments = db.relationship('Payment', backref='member', lazy=True)
     registrations = db.relationship('ClassRegistration', backref='member', lazy=True)
     fee_reminders = db.relationship('FeeReminder', backref='member', lazy=True)
     attendance_records = db.relationship('AttendanceRecord', backref='member', lazy=True)
 
+# Case-insensitive email lookups, see member_import.py
+db.Index('ix_member_email_lower', db.func.lower(Member.email))
+
 class FitnessClass(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     instructor = db.Column(db.String(100), nullable=False)
-    schedule = db.Column(db.DateTime, nullable=False)
+    room = db.Column(db.String(50))
+    schedule = db.Column(db.DateTime, nullable=False, index=True)  # first (or only) session
     duration = db.Column(db.Integer, nullable=False)  # in minutes
+    # Weekly recurrence, expanded on demand by recurrence.py: comma separated
+    # weekdays (0 = Monday), every repeat_interval weeks until repeat_until.
+    # NULL repeat_weekdays means a one-off session.
+    repeat_weekdays = db.Column(db.String(20))
+    repeat_interval = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    repeat_until = db.Column(db.Date)
     capacity = db.Column(db.Integer, nullable=False)
+    # Denormalized count of registrations, only changed through registrations.py
+    seats_taken = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     registrations = db.relationship('ClassRegistration', backref='fitness_class', lazy=True)
+    waitlist = db.relationship('WaitlistEntry', backref='fitness_class', lazy=True,
+                               order_by='WaitlistEntry.id')
+
+# Cancelled or moved sessions of a recurring class
+class ClassException(db.Model):
+    __table_args__ = (
+        db.Index('uq_class_exception_class_start', 'class_id', 'original_start', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('fitness_class.id'), nullable=False)
+    original_start = db.Column(db.DateTime, nullable=False)
+    new_start = db.Column(db.DateTime)  # NULL when the session is cancelled
+    cancelled = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+# A single session of a class, only stored once something refers to it
+class ClassOccurrence(db.Model):
+    __table_args__ = (
+        db.Index('uq_class_occurrence_class_start', 'class_id', 'starts_at', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('fitness_class.id'), nullable=False)
+    starts_at = db.Column(db.DateTime, nullable=False)
+
+    fitness_class = db.relationship('FitnessClass', backref=db.backref('occurrences', lazy=True))
 
 class ClassRegistration(db.Model):
+    __table_args__ = (
+        # One registration per member and class; also turns the duplicate
+        # check in register_member_class into an index probe
+        db.Index('uq_class_registration_member_class', 'member_id', 'class_id', unique=True),
+        db.Index('ix_class_registration_class_id', 'class_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('fitness_class.id'), nullable=False)
     registration_date = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Members waiting for a seat in a full class, promoted in id (FIFO) order
+class WaitlistEntry(db.Model):
+    __table_args__ = (
+        db.Index('uq_waitlist_entry_class_member', 'class_id', 'member_id', unique=True),
+        db.Index('ix_waitlist_entry_class_id_id', 'class_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False, index=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('fitness_class.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    member = db.relationship('Member', backref=db.backref('waitlist_entries', lazy=True))
+
 class Payment(db.Model):
+    __table_args__ = (
+        db.Index('ix_payment_payment_date_id', 'payment_date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
+    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
     payment_method = db.Column(db.String(50))  # Credit Card, Cash, Bank Transfer
     status = db.Column(db.String(20), default='Completed')  # Completed, Pending, Failed
     notes = db.Column(db.Text)
+    # The member's membership type when the payment was recorded, for revenue reports
+    membership_type = db.Column(db.String(50))
 
 class FeeReminder(db.Model):
+    __table_args__ = (
+        db.Index('ix_fee_reminder_status_reminder_date', 'status', 'reminder_date'),
+        db.Index('ix_fee_reminder_reminder_date_id', 'reminder_date', 'id'),
+        db.Index('ix_fee_reminder_rollover', 'status', 'rolled_over_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
+    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False, index=True)
     reminder_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default='Pending')  # Pending, Sent, Paid
     amount = db.Column(db.Float, nullable=False)
     notes = db.Column(db.Text)
+    rolled_over_at = db.Column(db.DateTime)  # set once the next month's reminder exists
 
 # Attendance tracking models
 class AttendanceDevice(db.Model):
@@ -76,40 +153,175 @@ class AttendanceDevice(db.Model):
     location = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
     last_sync = db.Column(db.DateTime)
+    # SHA-256 of the key the device sends to /api/devices/<id>/sync
+    sync_key_hash = db.Column(db.String(64))
+    # Highest event sequence number received from the device
+    last_sequence = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class AttendanceRecord(db.Model):
+    __table_args__ = (
+        # Only records still waiting for a check-out, for the stale check-in sweeper
+        db.Index('ix_attendance_record_open', 'check_in',
+                 sqlite_where=db.text('check_out IS NULL'),
+                 postgresql_where=db.text('check_out IS NULL')),
+        # Seek pagination of the attendance history
+        db.Index('ix_attendance_record_check_in_id', 'check_in', 'id'),
+        # A device's buffered events are applied once, see device_sync.py
+        db.Index('uq_attendance_record_device_sequence', 'device_id', 'device_sequence', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
+    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False, index=True)
     device_id = db.Column(db.Integer, db.ForeignKey('attendance_device.id'))
+    device_sequence = db.Column(db.Integer)  # the device's event number, for synced check-ins
     check_in = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     check_out = db.Column(db.DateTime)
     attendance_type = db.Column(db.String(20), default='biometric')  # biometric, code, manual
+    # Set when the stale check-in sweeper closed the record instead of the member
+    auto_checked_out = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     notes = db.Column(db.Text)
+    occurrence_id = db.Column(db.Integer, db.ForeignKey('class_occurrence.id'), index=True)
     
     device = db.relationship('AttendanceDevice', backref=db.backref('attendance_records', lazy=True))
+    occurrence = db.relationship('ClassOccurrence', backref=db.backref('attendance_records', lazy=True))
+
+# One row per monthly archive table of old attendance records, see
+# attendance_archive.py
+class AttendanceArchive(db.Model):
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    table_name = db.Column(db.String(50), nullable=False, unique=True)
+    records = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    first_check_in = db.Column(db.DateTime)
+    last_check_in = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime)
+
+# Deleted members, so attendance devices drop them from their allow-list
+class MemberTombstone(db.Model):
+    member_id = db.Column(db.Integer, primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Running totals for the dashboard, kept up to date by the listeners in stats.py
+class DashboardStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    total_members = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_classes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_payments = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_revenue = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    pending_reminders = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rebuilt_at = db.Column(db.DateTime)
+
+class DailyAttendance(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    check_ins = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# Completed payments per day and per month (gym local time), membership type
+# and payment method, kept up to date by revenue.py. Missing membership types
+# and payment methods are stored as ''.
+class RevenueRollup(db.Model):
+    period = db.Column(db.String(5), primary_key=True)  # day, month
+    period_start = db.Column(db.Date, primary_key=True)
+    membership_type = db.Column(db.String(50), primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    payments = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    revenue = db.Column(db.Float, nullable=False, default=0, server_default='0')
+
+# Check-ins and check-outs per 15 minute bucket of gym local time, kept up to
+# date by occupancy.py, with the occupancy at the end of the bucket (the
+# running sum of check_ins - check_outs up to it).
+class OccupancyBucket(db.Model):
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    check_ins = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    check_outs = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # NULL only in buckets written before these columns existed; recounted
+    # on startup
+    occupancy = db.Column(db.Integer)
+    weekday_hour = db.Column(db.SmallInteger)  # weekday * 24 + hour, Monday = 0, for the heatmap
+
+# Scheduled jobs (see jobs.py). A job runs in whichever process first takes
+# its lock row; locked_until is a lease so a crashed run does not block it
+# forever, and last_started_at stops other processes from running it again
+# right after it finished.
+class JobLock(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    last_started_at = db.Column(db.DateTime)
+
+class JobRun(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_run_job_id', 'job', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    trigger = db.Column(db.String(20), nullable=False)  # schedule, manual, cli
+    owner = db.Column(db.String(100))
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)  # seconds
+    rows = db.Column(db.Integer)  # rows touched, as reported by the job
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, success, failed
+    error = db.Column(db.Text)
+    details = db.Column(db.Text)  # the job's result as JSON
+
+# Change counter per table, bumped by table_versions.py in the same
+# transaction as every INSERT/UPDATE/DELETE on it; the API's ETags and
+# Last-Modified headers are derived from these rows.
+class TableVersion(db.Model):
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime)
+
+# Outbox of messages to members, sent by notifications.py. dedupe_key makes
+# queueing the same message twice a no-op; a worker owns a row while status
+# is 'sending' and its claim_token matches, until locked_until.
+class Notification(db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_due', 'status', 'next_attempt_at'),
+        db.Index('ix_notification_claim_token', 'claim_token'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dedupe_key = db.Column(db.String(100), unique=True, nullable=False)
+    channel = db.Column(db.String(20), nullable=False)  # email, sms
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200))
+    body = db.Column(db.Text, nullable=False)
+    fee_reminder_id = db.Column(db.Integer, db.ForeignKey('fee_reminder.id'), index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sending, sent, failed, cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(40))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+# Define your membership fees here
+MEMBERSHIP_FEES = {
+    'Basic': 1000.00,
+    'Premium': 2000.00,
+    'VIP': 3000.00
+}
 
 # Function to calculate membership fee based on type
 def calculate_membership_fee(membership_type):
-    # Define your membership fees here
-    fees = {
-        'Basic': 1000.00,
-        'Premium': 2000.00,
-        'VIP': 3000.00
-    }
-    return fees.get(membership_type, 50.00)  # Default to Rs 50 if not found
+    return MEMBERSHIP_FEES.get(membership_type, 50.00)  # Default to Rs 50 if not found
+
+# First fee reminder falls due one month from the join date
+def first_reminder_date(join_date=None):
+    if not join_date:
+        join_date = datetime.utcnow().date()
+    elif isinstance(join_date, datetime):
+        join_date = join_date.date()
+    return join_date + timedelta(days=30)
 
 # Function to create fee reminders when a new member is added
 @event.listens_for(Member, 'after_insert')
 def create_initial_fee_reminder(mapper, connection, target):
-    # Create first fee reminder for one month from join date
-    if target.join_date:
-        first_reminder_date = target.join_date + timedelta(days=30)
-    else:
-        first_reminder_date = datetime.utcnow().date() + timedelta(days=30)
-    
     fee_reminder = FeeReminder(
         member_id=target.id,
-        reminder_date=first_reminder_date,
+        reminder_date=first_reminder_date(target.join_date),
         amount=calculate_membership_fee(target.membership_type),
         status='Pending'
     )
@@ -0,0 +1,411 @@
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import make_msgid
+
+from sqlalchemy import and_, func, or_, select, update
+
+from models import db, FeeReminder, Member, Notification
+from database import insert_or_ignore
+
+logger = logging.getLogger(__name__)
+
+# Member notifications through an outbox.
+#
+# Producers such as the daily fee reminder job only insert Notification rows,
+# so they never wait on a mail server. dispatch() sends the rows from a small
+# worker pool: it claims a batch of due rows by stamping them with its own
+# claim_token, sends each one through its channel's transport at no more than
+# the channel's rate limit, and records every outcome as soon as it is known.
+# A failed send is retried with exponential backoff up to max_attempts; rows
+# whose claim lease ran out (the sending process died) become claimable again.
+# Sending a fee reminder's notification moves the reminder from Pending to Sent.
+#
+# Transports are looked up by name in TRANSPORTS: 'file' writes every message
+# to a directory, for development and tests, and 'smtp' hands email to an
+# SMTP server, e.g. a local sink started with
+# `python -m smtpd -n -c DebuggingServer localhost:1025`.
+
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+# Member column each channel sends to
+RECIPIENT_COLUMNS = {'email': 'email', 'sms': 'phone'}
+
+_outbox = Notification.__table__
+
+
+class TransportError(Exception):
+    """A send that failed but may succeed when retried."""
+
+
+class PermanentTransportError(TransportError):
+    """A send that will never succeed, e.g. the server refused the recipient."""
+
+
+def build_message(notification, sender):
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = notification.recipient
+    message['Subject'] = notification.subject or ''
+    message['Message-ID'] = make_msgid(f'notification-{notification.id}')
+    message['X-Notification-Channel'] = notification.channel
+    message.set_content(notification.body)
+    return message
+
+
+class FileTransport:
+    """Writes each message to ``directory`` as <id>.<channel>.eml. A message
+    sent again after a crash overwrites its own file."""
+
+    def __init__(self, directory, sender='gym@localhost'):
+        self.directory = directory
+        self.sender = sender
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, notification):
+        path = os.path.join(self.directory, f'{notification.id}.{notification.channel}.eml')
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(build_message(notification, self.sender).as_bytes())
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            raise TransportError(str(e))
+
+    def close(self):
+        pass
+
+
+class SmtpTransport:
+    """Sends email through an SMTP server over one connection per worker
+    thread, reconnecting after errors. 5xx replies are permanent failures."""
+
+    def __init__(self, host='localhost', port=25, sender='gym@localhost', username=None,
+                 password=None, starttls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                connection.starttls()
+            if self.username:
+                connection.login(self.username, self.password)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.add(connection)
+        return connection
+
+    def _disconnect(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def send(self, notification):
+        message = build_message(notification, self.sender)
+        try:
+            self._connection().send_message(message)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentTransportError(f'Recipient refused: {e.recipients}')
+        except (smtplib.SMTPException, OSError) as e:
+            connection = getattr(self._local, 'connection', None)
+            self._local.connection = None
+            if connection is not None:
+                self._disconnect(connection)
+            if isinstance(e, smtplib.SMTPResponseException) and 500 <= e.smtp_code < 600:
+                raise PermanentTransportError(f'{e.smtp_code} {e.smtp_error!r}')
+            raise TransportError(str(e) or type(e).__name__)
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            self._disconnect(connection)
+
+
+def _file_transport(app):
+    directory = app.config.get('NOTIFICATION_FILE_DIR') or os.path.join(app.instance_path, 'outbox')
+    return FileTransport(directory, sender=app.config['NOTIFICATION_SENDER'])
+
+
+def _smtp_transport(app):
+    return SmtpTransport(
+        host=app.config['SMTP_HOST'], port=app.config['SMTP_PORT'],
+        sender=app.config['NOTIFICATION_SENDER'], username=app.config.get('SMTP_USERNAME'),
+        password=app.config.get('SMTP_PASSWORD'), starttls=app.config.get('SMTP_STARTTLS', False)
+    )
+
+
+# name -> factory(app) returning an object with send(notification) and close()
+TRANSPORTS = {'file': _file_transport, 'smtp': _smtp_transport}
+
+
+def register_transport(name, factory):
+    TRANSPORTS[name] = factory
+
+
+def build_transports(app):
+    """{channel: transport} for every channel in NOTIFICATION_CHANNELS."""
+    return {channel: TRANSPORTS[name](app) for channel, name in app.config['NOTIFICATION_CHANNELS'].items()}
+
+
+class RateLimiter:
+    """Token bucket shared by all workers sending on one channel: ``rate``
+    messages per second on average, in bursts of up to ``burst``. No rate
+    means no limit."""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate or 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_delay_for(attempts, base):
+    # base, 2 x base, 4 x base, ... plus up to 25% jitter so a batch that
+    # failed together does not come back all at once
+    delay = min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return delay * random.uniform(1, 1.25)
+
+
+def _reminder_message(channel, row):
+    if channel == 'sms':
+        return None, (f"Reminder: your {row.membership_type} membership fee of Rs {row.amount:.2f} "
+                      f"is due on {row.reminder_date:%d %b %Y}.")
+    return 'Membership fee reminder', (
+        f"Dear {row.first_name},\n\n"
+        f"Your {row.membership_type} membership fee of Rs {row.amount:.2f} is due on "
+        f"{row.reminder_date:%d %B %Y}.\n\n"
+        f"If you have already paid, please ignore this message.\n"
+    )
+
+
+def queue_fee_reminders(today, channels, chunk_size=1000):
+    """Queue a notification on each channel for every Pending reminder due
+    by ``today``. A reminder is queued once per channel however often this
+    runs (dedupe_key); members without an address for a channel are skipped.
+    Returns the number of notifications queued."""
+    reminders = FeeReminder.__table__
+    members = Member.__table__
+    queued = 0
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            chunk = connection.execute(
+                select(reminders.c.id, reminders.c.reminder_date, reminders.c.amount,
+                       members.c.first_name, members.c.membership_type, members.c.email, members.c.phone)
+                .join(members, members.c.id == reminders.c.member_id)
+                .where(reminders.c.status == 'Pending', reminders.c.reminder_date <= today,
+                       reminders.c.id > last_id)
+                .order_by(reminders.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            now = datetime.utcnow()
+            rows = []
+            for row in chunk:
+                for channel in channels:
+                    recipient = getattr(row, RECIPIENT_COLUMNS[channel])
+                    if not recipient:
+                        continue
+                    subject, body = _reminder_message(channel, row)
+                    rows.append({
+                        'dedupe_key': f'fee_reminder:{row.id}:{channel}',
+                        'channel': channel,
+                        'recipient': recipient,
+                        'subject': subject,
+                        'body': body,
+                        'fee_reminder_id': row.id,
+                        'status': 'queued',
+                        'attempts': 0,
+                        'next_attempt_at': now,
+                        'created_at': now
+                    })
+            if rows:
+                queued += connection.execute(insert_or_ignore(connection, _outbox), rows).rowcount
+        if len(chunk) < chunk_size:
+            break
+    return queued
+
+
+def _claimable(now):
+    return or_(
+        and_(_outbox.c.status == 'queued', _outbox.c.next_attempt_at <= now),
+        and_(_outbox.c.status == 'sending', _outbox.c.locked_until < now)
+    )
+
+
+def _claim(engine, channels, batch_size, lease):
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        ids = connection.scalars(
+            select(_outbox.c.id)
+            .where(_claimable(now), _outbox.c.channel.in_(channels))
+            .order_by(_outbox.c.next_attempt_at, _outbox.c.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            return token, []
+        # Rows another dispatcher claimed in the meantime no longer match
+        connection.execute(
+            update(_outbox)
+            .where(_outbox.c.id.in_(ids), _claimable(now))
+            .values(status='sending', claim_token=token, locked_until=now + lease)
+        )
+        batch = connection.execute(select(_outbox).where(_outbox.c.claim_token == token)).all()
+    return token, batch
+
+
+def _record(engine, notification, token, outcome, error, retry_delay):
+    now = datetime.utcnow()
+    attempts = notification.attempts + 1
+    values = {'attempts': attempts, 'claim_token': None, 'locked_until': None, 'last_error': error}
+    if outcome == 'sent':
+        values.update(status='sent', sent_at=now)
+    elif outcome == 'failed':
+        values['status'] = 'failed'
+    else:
+        values.update(status='queued', next_attempt_at=now + retry_delay_for(attempts, retry_delay))
+
+    reminders = FeeReminder.__table__
+    with engine.begin() as connection:
+        connection.execute(
+            update(_outbox)
+            .where(_outbox.c.id == notification.id, _outbox.c.claim_token == token)
+            .values(values)
+        )
+        if outcome == 'sent' and notification.fee_reminder_id is not None:
+            # Both are unpaid, so the dashboard's counter does not change
+            connection.execute(
+                update(reminders)
+                .where(reminders.c.id == notification.fee_reminder_id, reminders.c.status == 'Pending')
+                .values(status='Sent')
+            )
+
+
+def cancel_paid(connection):
+    """Cancel queued notifications of reminders that have been paid since."""
+    reminders = FeeReminder.__table__
+    return connection.execute(
+        update(_outbox)
+        .where(_outbox.c.status == 'queued',
+               _outbox.c.fee_reminder_id.in_(select(reminders.c.id).where(reminders.c.status == 'Paid')))
+        .values(status='cancelled')
+    ).rowcount
+
+
+def dispatch(transports, rate_limits=None, workers=4, batch_size=100, max_attempts=5,
+             retry_delay=timedelta(minutes=1), lease=timedelta(minutes=5), max_seconds=None):
+    """Send due notifications until there are none left or ``max_seconds``
+    have passed. ``transports`` maps channel -> transport and ``rate_limits``
+    channel -> messages per second.
+
+    Returns the totals and, per channel, the messages sent, retried and
+    failed, the average send time and the throughput.
+    """
+    started = time.perf_counter()
+    engine = db.engine
+    limiters = {channel: RateLimiter((rate_limits or {}).get(channel)) for channel in transports}
+    channels = {channel: {'sent': 0, 'retried': 0, 'failed': 0, 'send_seconds': 0.0} for channel in transports}
+    lock = threading.Lock()
+
+    with engine.begin() as connection:
+        cancelled = cancel_paid(connection)
+
+    def deliver(notification, token):
+        limiters[notification.channel].acquire()
+        send_started = time.perf_counter()
+        outcome, error = 'sent', None
+        try:
+            transports[notification.channel].send(notification)
+        except PermanentTransportError as e:
+            outcome, error = 'failed', str(e)
+        except Exception as e:
+            if not isinstance(e, TransportError):
+                logger.exception("Notification %s: transport error", notification.id)
+            outcome = 'failed' if notification.attempts + 1 >= max_attempts else 'retried'
+            error = str(e) or type(e).__name__
+        elapsed = time.perf_counter() - send_started
+        _record(engine, notification, token, outcome, error, retry_delay)
+        with lock:
+            counts = channels[notification.channel]
+            counts[outcome] += 1
+            counts['send_seconds'] += elapsed
+
+    batches = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notify') as pool:
+        while max_seconds is None or time.perf_counter() - started < max_seconds:
+            token, batch = _claim(engine, list(transports), batch_size, lease)
+            if not batch:
+                break
+            batches += 1
+            list(pool.map(lambda notification: deliver(notification, token), batch))
+
+    seconds = time.perf_counter() - started
+    result = {'sent': 0, 'retried': 0, 'failed': 0, 'cancelled': cancelled, 'batches': batches,
+              'seconds': round(seconds, 3), 'channels': {}}
+    for channel, counts in channels.items():
+        attempted = counts['sent'] + counts['retried'] + counts['failed']
+        if not attempted:
+            continue
+        for key in ('sent', 'retried', 'failed'):
+            result[key] += counts[key]
+        result['channels'][channel] = {
+            'sent': counts['sent'],
+            'retried': counts['retried'],
+            'failed': counts['failed'],
+            'avg_send_ms': round(counts['send_seconds'] / attempted * 1000, 1),
+            'per_second': round(counts['sent'] / seconds, 1) if seconds else None
+        }
+    logger.info("Notifications: %(sent)d sent, %(retried)d to retry, %(failed)d failed, "
+                "%(cancelled)d cancelled in %(seconds).3fs", result)
+    return result
+
+
+def outbox_summary():
+    """{channel: {status: count}} over the whole outbox."""
+    summary = {}
+    for channel, status, count in db.session.execute(
+        select(_outbox.c.channel, _outbox.c.status, func.count())
+        .group_by(_outbox.c.channel, _outbox.c.status)
+    ):
+        summary.setdefault(channel, {})[status] = count
+    return summary
@@ -0,0 +1,258 @@
+from datetime import timedelta
+
+from sqlalchemy import case, event, func, insert, or_, select, update
+
+from models import db, AttendanceRecord, OccupancyBucket
+from stats import _history
+from attendance_archive import attendance_tables
+
+# Occupancy analytics from pre-aggregated 15 minute buckets.
+#
+# Every check-in adds one to its bucket's check_ins and every check-out one to
+# its bucket's check_outs. Like the dashboard counters, the ORM listeners
+# below do this on the flush connection and Core bulk writers call
+# record_movements() themselves. Each bucket also stores the occupancy at its
+# end, so readers take it as is: the heatmap is one GROUP BY weekday_hour over
+# the range and current_occupancy() a single row. Buckets are contiguous from the first
+# movement to the last (the empty ones carry the occupancy of the bucket
+# before), so a check-in only updates its own bucket; a movement in a past
+# bucket also shifts the occupancy of every bucket after it, which is the
+# price of cheap reads.
+
+BUCKET = timedelta(minutes=15)
+
+_buckets = OccupancyBucket.__table__
+
+
+def bucket_start(moment):
+    return moment.replace(minute=moment.minute - moment.minute % 15, second=0, microsecond=0)
+
+
+def _bucket_row(moment, check_ins, check_outs, occupancy):
+    return {'bucket_start': moment, 'check_ins': check_ins, 'check_outs': check_outs, 'occupancy': occupancy,
+            'weekday_hour': moment.weekday() * 24 + moment.hour}
+
+
+def _slots(start, end):
+    moment = start
+    while moment < end:
+        yield moment
+        moment += BUCKET
+
+
+def _add_bucket(connection, key):
+    # Creates ``key`` and the empty buckets between it and its neighbour,
+    # carrying the occupancy of the bucket before
+    previous = connection.execute(
+        select(_buckets.c.bucket_start, _buckets.c.occupancy)
+        .where(_buckets.c.bucket_start < key)
+        .order_by(_buckets.c.bucket_start.desc())
+        .limit(1)
+    ).first()
+    if previous is not None:
+        start, end, occupancy = previous.bucket_start + BUCKET, key + BUCKET, previous.occupancy
+    else:
+        following = connection.scalar(select(func.min(_buckets.c.bucket_start)).where(_buckets.c.bucket_start > key))
+        start, end, occupancy = key, following or key + BUCKET, 0
+    connection.execute(insert(_buckets), [_bucket_row(moment, 0, 0, occupancy) for moment in _slots(start, end)])
+
+
+def record_movements(connection, check_ins=(), check_outs=(), sign=1):
+    deltas = {}
+    for moment in check_ins:
+        key = bucket_start(moment)
+        ins, outs = deltas.get(key, (0, 0))
+        deltas[key] = (ins + sign, outs)
+    for moment in check_outs:
+        if moment is None:
+            continue
+        key = bucket_start(moment)
+        ins, outs = deltas.get(key, (0, 0))
+        deltas[key] = (ins, outs + sign)
+
+    for key, (ins, outs) in sorted(deltas.items()):
+        counts = update(_buckets).where(_buckets.c.bucket_start == key) \
+            .values(check_ins=_buckets.c.check_ins + ins, check_outs=_buckets.c.check_outs + outs)
+        if connection.execute(counts).rowcount == 0:
+            if ins < 0 or outs < 0:
+                continue
+            _add_bucket(connection, key)
+            connection.execute(counts)
+        if ins != outs:
+            connection.execute(
+                update(_buckets)
+                .where(_buckets.c.bucket_start >= key)
+                .values(occupancy=_buckets.c.occupancy + (ins - outs))
+            )
+
+
+def rebuild_occupancy(connection, since=None, chunk_size=10000):
+    """Recount the buckets from the attendance records, all of them or those
+    from ``since`` on. Returns the number of buckets written."""
+    delete = _buckets.delete()
+    if since is not None:
+        since = bucket_start(since)
+        delete = delete.where(_buckets.c.bucket_start >= since)
+    connection.execute(delete)
+
+    deltas = {}
+    # Archived months still count, see attendance_archive.py
+    for attendance in attendance_tables(connection):
+        for column, position in ((attendance.c.check_in, 0), (attendance.c.check_out, 1)):
+            statement = select(column).where(column.isnot(None))
+            if since is not None:
+                statement = statement.where(column >= since)
+            result = connection.execution_options(yield_per=chunk_size).execute(statement)
+            for rows in result.partitions():
+                for (moment,) in rows:
+                    counts = deltas.setdefault(bucket_start(moment), [0, 0])
+                    counts[position] += 1
+    if not deltas:
+        return 0
+
+    previous = connection.execute(
+        select(_buckets.c.bucket_start, _buckets.c.occupancy)
+        .order_by(_buckets.c.bucket_start.desc())
+        .limit(1)
+    ).first()
+    if previous is not None:
+        start, occupancy = previous.bucket_start + BUCKET, previous.occupancy
+    else:
+        start, occupancy = min(deltas), 0
+    rows = []
+    written = 0
+    for moment in _slots(start, max(deltas) + BUCKET):
+        ins, outs = deltas.get(moment, (0, 0))
+        occupancy += ins - outs
+        rows.append(_bucket_row(moment, ins, outs, occupancy))
+        if len(rows) == chunk_size:
+            connection.execute(insert(_buckets), rows)
+            written += len(rows)
+            rows = []
+    if rows:
+        connection.execute(insert(_buckets), rows)
+    return written + len(rows)
+
+
+def ensure_occupancy():
+    # Backfill once for databases that had attendance before the buckets, or
+    # their occupancy column, existed
+    with db.engine.begin() as connection:
+        if connection.scalar(select(AttendanceRecord.id).limit(1)) is None:
+            return
+        bucket = connection.execute(select(_buckets.c.occupancy).limit(1)).first()
+        if bucket is None or connection.scalar(select(_buckets.c.bucket_start).where(
+                or_(_buckets.c.occupancy.is_(None), _buckets.c.weekday_hour.is_(None))).limit(1)) is not None:
+            rebuild_occupancy(connection)
+
+
+def _occupancy_before(moment):
+    return db.session.scalar(
+        select(_buckets.c.occupancy)
+        .where(_buckets.c.bucket_start < moment)
+        .order_by(_buckets.c.bucket_start.desc())
+        .limit(1)
+    ) or 0
+
+
+def current_occupancy(now):
+    """People checked in and not yet checked out at ``now``."""
+    return max(_occupancy_before(bucket_start(now) + BUCKET), 0)
+
+
+def _range(start, end):
+    return bucket_start(start), bucket_start(end - timedelta(microseconds=1)) + BUCKET
+
+
+def occupancy_series(start, end):
+    """(bucket_start, check_ins, check_outs, occupancy) for every bucket in
+    [start, end), empty ones included; occupancy is at the end of the bucket."""
+    start, end = _range(start, end)
+    stored = {
+        row.bucket_start: row
+        for row in db.session.execute(
+            select(_buckets.c.bucket_start, _buckets.c.check_ins, _buckets.c.check_outs, _buckets.c.occupancy)
+            .where(_buckets.c.bucket_start >= start, _buckets.c.bucket_start < end)
+        )
+    }
+    occupancy = _occupancy_before(start)
+    series = []
+    for moment in _slots(start, end):
+        row = stored.get(moment)
+        ins = outs = 0
+        if row is not None:
+            ins, outs, occupancy = row.check_ins, row.check_outs, row.occupancy
+        series.append((moment, ins, outs, max(occupancy, 0)))
+    return series
+
+
+def heatmap(start, end):
+    """Average and peak occupancy and total check-ins per weekday and hour.
+
+    Returns a dict of 7 x 24 grids (index [weekday][hour], Monday = 0).
+    """
+    start, end = _range(start, end)
+    totals = [[0] * 24 for _ in range(7)]
+    samples = [[0] * 24 for _ in range(7)]
+    peak = [[0] * 24 for _ in range(7)]
+    check_ins = [[0] * 24 for _ in range(7)]
+
+    present = case((_buckets.c.occupancy < 0, 0), else_=_buckets.c.occupancy)
+    in_range = (_buckets.c.bucket_start >= start, _buckets.c.bucket_start < end)
+    for slot, count, total, highest, arrivals in db.session.execute(
+        select(_buckets.c.weekday_hour, func.count(), func.sum(present), func.max(present),
+               func.sum(_buckets.c.check_ins))
+        .where(*in_range)
+        .group_by(_buckets.c.weekday_hour)
+    ):
+        day, hour = divmod(slot, 24)
+        samples[day][hour] = count
+        totals[day][hour] = total
+        peak[day][hour] = highest
+        check_ins[day][hour] = arrivals
+
+    # Buckets exist from the first movement to the last; the range may start
+    # before (occupancy 0) or end after (occupancy of the last bucket) them
+    first, last = db.session.execute(
+        select(func.min(_buckets.c.bucket_start), func.max(_buckets.c.bucket_start)).where(*in_range)
+    ).one()
+    if first is None:
+        edges = [(start, end)]
+    else:
+        edges = [(start, first), (last + BUCKET, end)]
+    for edge_start, edge_end in edges:
+        if edge_start >= edge_end:
+            continue
+        occupancy = max(_occupancy_before(edge_start), 0)
+        for moment in _slots(edge_start, edge_end):
+            day, hour = moment.weekday(), moment.hour
+            totals[day][hour] += occupancy
+            samples[day][hour] += 1
+            peak[day][hour] = max(peak[day][hour], occupancy)
+
+    average = [
+        [round(totals[day][hour] / samples[day][hour], 1) if samples[day][hour] else 0 for hour in range(24)]
+        for day in range(7)
+    ]
+    return {'average': average, 'peak': peak, 'check_ins': check_ins}
+
+
+# Attendance listeners
+@event.listens_for(AttendanceRecord, 'after_insert')
+def attendance_inserted(mapper, connection, target):
+    record_movements(connection, [target.check_in], [target.check_out])
+
+
+@event.listens_for(AttendanceRecord, 'after_update')
+def attendance_updated(mapper, connection, target):
+    old_check_in, new_check_in = _history(target, 'check_in')
+    old_check_out, new_check_out = _history(target, 'check_out')
+    if old_check_in == new_check_in and old_check_out == new_check_out:
+        return
+    record_movements(connection, [old_check_in], [old_check_out], sign=-1)
+    record_movements(connection, [new_check_in], [new_check_out])
+
+
+@event.listens_for(AttendanceRecord, 'after_delete')
+def attendance_deleted(mapper, connection, target):
+    record_movements(connection, [target.check_in], [target.check_out], sign=-1)
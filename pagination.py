@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+# Keyset (seek) pagination shared by the list views.
+#
+# Instead of OFFSET/COUNT, every page remembers the sort key of its first and
+# last row and the next query seeks past it with a row-value comparison, e.g.
+#   WHERE (payment_date, id) < (:last_date, :last_id) ORDER BY ... LIMIT n + 1
+# so a page costs the same number of queries on page 1 and on page 10,000.
+
+
+def encode_cursor(values):
+    payload = []
+    for value in values:
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    # Returns None for a missing or tampered token so the view just falls
+    # back to the first page
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        return None
+
+    values = []
+    for column, value in zip(columns, payload):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = None
+        try:
+            if value is None:
+                values.append(None)
+            elif python_type is datetime:
+                values.append(datetime.fromisoformat(value))
+            elif python_type is date:
+                values.append(date.fromisoformat(value))
+            elif python_type is not None:
+                values.append(python_type(value))
+            else:
+                values.append(value)
+        except (ValueError, TypeError):
+            return None
+    return values
+
+
+class KeysetPage:
+    def __init__(self, items, columns, has_next, has_prev):
+        self.items = items
+        self.columns = columns
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _key(self, item):
+        return [getattr(item, column.key) for column in self.columns]
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return encode_cursor(self._key(self.items[-1]))
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return encode_cursor(self._key(self.items[0]))
+
+
+def keyset_paginate(query, columns, after=None, before=None, per_page=50, descending=False):
+    """Return one KeysetPage of ``query`` ordered by ``columns``.
+
+    ``columns`` must end in a unique column (normally the primary key) so the
+    ordering is total. ``after``/``before`` are cursor tokens taken from a
+    previous page's ``next_cursor``/``prev_cursor``.
+    """
+    after_key = decode_cursor(after, columns)
+    before_key = decode_cursor(before, columns) if after_key is None else None
+    backwards = before_key is not None
+
+    key = tuple_(*columns)
+    if after_key is not None:
+        seek = tuple_(*after_key)
+        query = query.filter(key < seek if descending else key > seek)
+    elif backwards:
+        seek = tuple_(*before_key)
+        query = query.filter(key > seek if descending else key < seek)
+
+    # Walking backwards flips the sort so LIMIT picks the rows right before
+    # the cursor; they are put back in display order below
+    reverse_sort = descending != backwards
+    order = [column.desc() if reverse_sort else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        return KeysetPage(rows, columns, has_next=True, has_prev=has_more)
+    return KeysetPage(rows, columns, has_next=has_more, has_prev=after_key is not None)
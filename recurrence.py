@@ -0,0 +1,179 @@
+import heapq
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, FitnessClass, ClassException, ClassOccurrence
+
+# Recurring class schedules.
+#
+# A FitnessClass row describes a whole series: its first session
+# (``schedule``) plus a weekly rule (``repeat_weekdays`` every
+# ``repeat_interval`` weeks until ``repeat_until``). Sessions are generated
+# lazily for the window being looked at. ClassException rows cancel or move
+# single sessions, and a ClassOccurrence row is only written once something
+# (an attendance record) needs to point at a specific session.
+
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# A one-off class cannot reasonably run longer than this; bounds the window query
+MAX_SESSION_LENGTH = timedelta(days=1)
+
+Occurrence = namedtuple('Occurrence', 'starts_at ends_at class_id name instructor original_start room')
+
+
+def parse_weekdays(value):
+    if not value:
+        return []
+    return sorted({int(day) for day in str(value).split(',') if day.strip() != ''})
+
+
+def format_weekdays(days):
+    days = sorted({int(day) for day in days if 0 <= int(day) <= 6})
+    return ','.join(str(day) for day in days) or None
+
+
+def describe_recurrence(fitness_class):
+    days = parse_weekdays(fitness_class.repeat_weekdays)
+    if not days:
+        return 'One-off'
+    interval = fitness_class.repeat_interval or 1
+    text = ', '.join(WEEKDAY_NAMES[day] for day in days)
+    text = f'Every {interval} weeks on {text}' if interval > 1 else f'Weekly on {text}'
+    if fitness_class.repeat_until:
+        text += f" until {fitness_class.repeat_until.strftime('%Y-%m-%d')}"
+    return text
+
+
+def _rule_starts(fitness_class, window_start, window_end):
+    # Session start times from the rule alone, in order, that can overlap
+    # [window_start, window_end)
+    duration = timedelta(minutes=fitness_class.duration)
+    first = fitness_class.schedule
+    days = parse_weekdays(fitness_class.repeat_weekdays)
+    if not days:
+        if first < window_end and first + duration > window_start:
+            yield first
+        return
+
+    interval = max(fitness_class.repeat_interval or 1, 1)
+    anchor = first.date() - timedelta(days=first.weekday())  # Monday of the first week
+    until = fitness_class.repeat_until
+
+    # Jump straight to the first week that can reach into the window
+    skip_days = (window_start - duration).date() - anchor
+    week = max(skip_days.days // 7, 0)
+    week -= week % interval
+
+    while True:
+        week_start = anchor + timedelta(weeks=week)
+        for day in days:
+            date = week_start + timedelta(days=day)
+            start = datetime.combine(date, first.time())
+            if start < first:
+                continue
+            if (until is not None and date > until) or start >= window_end:
+                return
+            if start + duration > window_start:
+                yield start
+        week += interval
+
+
+def iter_occurrences(fitness_class, window_start, window_end, exceptions=None):
+    """Yield the Occurrences of one class overlapping the window, in order.
+
+    ``exceptions`` maps original start -> ClassException for this class.
+    """
+    exceptions = exceptions or {}
+    duration = timedelta(minutes=fitness_class.duration)
+
+    def occurrence(start, original):
+        return Occurrence(start, start + duration, fitness_class.id, fitness_class.name,
+                          fitness_class.instructor, original, fitness_class.room)
+
+    moved = sorted(
+        (exception.new_start, exception.original_start)
+        for exception in exceptions.values()
+        if not exception.cancelled and exception.new_start is not None
+        and exception.new_start < window_end and exception.new_start + duration > window_start
+    )
+    regular = (
+        (start, start) for start in _rule_starts(fitness_class, window_start, window_end)
+        if start not in exceptions
+    )
+    for start, original in heapq.merge(regular, moved):
+        yield occurrence(start, original)
+
+
+def load_timetable_classes(window_start, window_end):
+    """Classes with at least one session that may fall in the window."""
+    return FitnessClass.query.filter(
+        FitnessClass.schedule < window_end,
+        or_(
+            and_(FitnessClass.repeat_weekdays.isnot(None),
+                 or_(FitnessClass.repeat_until.is_(None),
+                     FitnessClass.repeat_until >= (window_start - MAX_SESSION_LENGTH).date())),
+            and_(FitnessClass.repeat_weekdays.is_(None),
+                 FitnessClass.schedule > window_start - MAX_SESSION_LENGTH)
+        )
+    ).all()
+
+
+def load_exceptions(class_ids, window_start, window_end):
+    exceptions = {}
+    if not class_ids:
+        return exceptions
+    lower = window_start - MAX_SESSION_LENGTH
+    rows = ClassException.query.filter(
+        ClassException.class_id.in_(class_ids),
+        or_(and_(ClassException.original_start >= lower, ClassException.original_start < window_end),
+            and_(ClassException.new_start >= lower, ClassException.new_start < window_end))
+    ).all()
+    for row in rows:
+        exceptions.setdefault(row.class_id, {})[row.original_start] = row
+    return exceptions
+
+
+def timetable(window_start, window_end, classes=None):
+    """Lazily merged, time ordered Occurrences of all classes in the window."""
+    if classes is None:
+        classes = load_timetable_classes(window_start, window_end)
+    exceptions = load_exceptions([fitness_class.id for fitness_class in classes], window_start, window_end)
+    return heapq.merge(*[
+        iter_occurrences(fitness_class, window_start, window_end, exceptions.get(fitness_class.id))
+        for fitness_class in classes
+    ])
+
+
+def is_occurrence(fitness_class, starts_at):
+    for occurrence in timetable(starts_at, starts_at + timedelta(minutes=1), [fitness_class]):
+        if occurrence.starts_at == starts_at:
+            return True
+    return False
+
+
+def materialize_occurrence(class_id, starts_at):
+    """Get or create the ClassOccurrence row for one session (in the session's
+    current transaction)."""
+    occurrence = ClassOccurrence.query.filter_by(class_id=class_id, starts_at=starts_at).first()
+    if occurrence is not None:
+        return occurrence
+    try:
+        with db.session.begin_nested():
+            occurrence = ClassOccurrence(class_id=class_id, starts_at=starts_at)
+            db.session.add(occurrence)
+    except IntegrityError:
+        occurrence = ClassOccurrence.query.filter_by(class_id=class_id, starts_at=starts_at).one()
+    return occurrence
+
+
+def cancel_occurrence(class_id, original_start):
+    exception = ClassException.query.filter_by(class_id=class_id, original_start=original_start).first()
+    if exception is None:
+        exception = ClassException(class_id=class_id, original_start=original_start)
+        db.session.add(exception)
+    exception.cancelled = True
+    exception.new_start = None
+    return exception
@@ -0,0 +1,144 @@
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Member, FitnessClass, ClassRegistration, WaitlistEntry
+
+# Capacity-aware class registration.
+#
+# A seat is claimed with a conditional
+#   UPDATE fitness_class SET seats_taken = seats_taken + 1
+#   WHERE id = :class_id AND seats_taken < capacity
+# and only a claimed seat gets a ClassRegistration, so concurrent requests
+# cannot overbook. Requests that find the class full join the waitlist, and
+# cancellations hand the seat to the oldest waitlist entry.
+#
+# Every transaction writes before it reads. On SQLite that takes the write
+# lock up front, so busy_timeout serializes the writers instead of failing
+# them with a stale snapshot.
+
+REGISTERED = 'registered'
+WAITLISTED = 'waitlisted'
+ALREADY_REGISTERED = 'already_registered'
+ALREADY_WAITLISTED = 'already_waitlisted'
+NOT_FOUND = 'not_found'
+
+_classes = FitnessClass.__table__
+_registrations = ClassRegistration.__table__
+_waitlist = WaitlistEntry.__table__
+
+
+def _claim_seat(connection, class_id):
+    return connection.execute(
+        update(_classes)
+        .where(_classes.c.id == class_id, _classes.c.seats_taken < _classes.c.capacity)
+        .values(seats_taken=_classes.c.seats_taken + 1)
+    ).rowcount == 1
+
+
+def _release_seat(connection, class_id):
+    connection.execute(
+        update(_classes)
+        .where(_classes.c.id == class_id, _classes.c.seats_taken > 0)
+        .values(seats_taken=_classes.c.seats_taken - 1)
+    )
+
+
+def register_member(member_id, class_id):
+    """Register a member for a class, or waitlist them if it is full."""
+    with db.engine.connect() as connection:
+        if connection.scalar(select(Member.id).where(Member.id == member_id)) is None:
+            return NOT_FOUND
+        if connection.scalar(select(_classes.c.id).where(_classes.c.id == class_id)) is None:
+            return NOT_FOUND
+        if connection.scalar(select(_registrations.c.id).where(
+            _registrations.c.member_id == member_id, _registrations.c.class_id == class_id
+        )) is not None:
+            return ALREADY_REGISTERED
+
+    try:
+        with db.engine.begin() as connection:
+            if _claim_seat(connection, class_id):
+                connection.execute(insert(_registrations).values(
+                    member_id=member_id, class_id=class_id, registration_date=datetime.utcnow()
+                ))
+                return REGISTERED
+    except IntegrityError:
+        # Lost a race against the same member registering twice; the seat
+        # claim was rolled back with it
+        return ALREADY_REGISTERED
+
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(insert(_waitlist).values(
+                member_id=member_id, class_id=class_id, created_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        return ALREADY_WAITLISTED
+    return WAITLISTED
+
+
+def _promote_next(connection, class_id):
+    # Give the seat held by the caller to the oldest waitlist entry. Returns
+    # the promoted member id, or None if nobody is waiting.
+    while True:
+        entry = connection.execute(
+            select(_waitlist.c.id, _waitlist.c.member_id)
+            .where(_waitlist.c.class_id == class_id)
+            .order_by(_waitlist.c.id)
+            .limit(1)
+        ).first()
+        if entry is None:
+            return None
+        # Only the transaction that deletes the entry gets to promote it
+        if connection.execute(delete(_waitlist).where(_waitlist.c.id == entry.id)).rowcount != 1:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(_registrations).values(
+                    member_id=entry.member_id, class_id=class_id, registration_date=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Registered through some other path meanwhile; try the next one
+            continue
+        return entry.member_id
+
+
+def cancel_registration(registration_id):
+    """Delete a registration and promote the next waitlisted member.
+
+    Returns (deleted, promoted_member_id).
+    """
+    with db.engine.begin() as connection:
+        class_id = connection.execute(
+            delete(_registrations)
+            .where(_registrations.c.id == registration_id)
+            .returning(_registrations.c.class_id)
+        ).scalar()
+        if class_id is None:
+            return False, None
+        promoted = _promote_next(connection, class_id)
+        if promoted is None:
+            _release_seat(connection, class_id)
+        return True, promoted
+
+
+def fill_from_waitlist(class_id):
+    """Promote waitlisted members into free seats, e.g. after the capacity
+    was raised. Returns the promoted member ids in order."""
+    promoted = []
+    while True:
+        with db.engine.begin() as connection:
+            if not _claim_seat(connection, class_id):
+                return promoted
+            member_id = _promote_next(connection, class_id)
+            if member_id is None:
+                _release_seat(connection, class_id)
+                return promoted
+        promoted.append(member_id)
+
+
+def remove_from_waitlist(entry_id):
+    with db.engine.begin() as connection:
+        return connection.execute(delete(_waitlist).where(_waitlist.c.id == entry_id)).rowcount == 1
@@ -0,0 +1,199 @@
+from datetime import date, timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import event, func, insert, select, update
+
+from models import db, Member, Payment, RevenueRollup, DashboardStats
+from stats import STATS_ID, _history
+
+# Revenue reporting rollups.
+#
+# Every Completed payment counts once in its day row and once in its month
+# row, split by the member's membership type (snapshotted on the payment) and
+# the payment method. The listeners below keep the rows up to date on the
+# flush connection; an update takes the payment's old contribution out and
+# puts the new one in, so edit_payment moving a payment to another day,
+# method, member or status moves its amount between rows. Reports only read
+# these rows, so their cost depends on the number of months shown, not on the
+# number of payments.
+
+PERIODS = ('day', 'month')
+DIMENSIONS = ('membership_type', 'payment_method')
+
+_rollups = RevenueRollup.__table__
+
+
+def local_date(utc_moment):
+    # payment_date is stored in UTC; reports use the gym's calendar
+    name = current_app.config.get('GYM_TIMEZONE')
+    moment = utc_moment.replace(tzinfo=timezone.utc)
+    return (moment.astimezone(ZoneInfo(name)) if name else moment.astimezone()).date()
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _contribution(deltas, sign, status, amount, payment_date, membership_type, payment_method):
+    if status != 'Completed' or not amount or payment_date is None:
+        return
+    day = local_date(payment_date)
+    for period, start in (('day', day), ('month', month_start(day))):
+        key = (period, start, membership_type or '', payment_method or '')
+        counts = deltas.setdefault(key, [0, 0.0])
+        counts[0] += sign
+        counts[1] += sign * amount
+
+
+def _apply(connection, deltas):
+    for (period, start, membership_type, payment_method), (payments, revenue) in deltas.items():
+        if not payments and not revenue:
+            continue
+        result = connection.execute(
+            update(_rollups)
+            .where(_rollups.c.period == period, _rollups.c.period_start == start,
+                   _rollups.c.membership_type == membership_type,
+                   _rollups.c.payment_method == payment_method)
+            .values(payments=_rollups.c.payments + payments, revenue=_rollups.c.revenue + revenue)
+        )
+        if result.rowcount == 0 and payments > 0:
+            connection.execute(insert(_rollups).values(
+                period=period, period_start=start, membership_type=membership_type,
+                payment_method=payment_method, payments=payments, revenue=revenue
+            ))
+
+
+def rebuild_revenue(connection, chunk_size=10000):
+    """Recount all rollups from the Completed payments, and the dashboard's
+    total revenue with them. Returns the total revenue."""
+    connection.execute(_rollups.delete())
+    payments = Payment.__table__
+    deltas = {}
+    result = connection.execution_options(yield_per=chunk_size).execute(
+        select(payments.c.amount, payments.c.payment_date, payments.c.membership_type,
+               payments.c.payment_method)
+        .where(payments.c.status == 'Completed')
+    )
+    for rows in result.partitions():
+        for row in rows:
+            _contribution(deltas, 1, 'Completed', row.amount, row.payment_date,
+                          row.membership_type, row.payment_method)
+
+    rows = [
+        {'period': period, 'period_start': start, 'membership_type': membership_type,
+         'payment_method': payment_method, 'payments': count, 'revenue': revenue}
+        for (period, start, membership_type, payment_method), (count, revenue) in deltas.items()
+    ]
+    for offset in range(0, len(rows), chunk_size):
+        connection.execute(insert(_rollups), rows[offset:offset + chunk_size])
+
+    total = sum(revenue for (period, _, _, _), (_, revenue) in deltas.items() if period == 'month')
+    stats = DashboardStats.__table__
+    connection.execute(update(stats).where(stats.c.id == STATS_ID).values(total_revenue=total))
+    return total
+
+
+def ensure_revenue_rollups():
+    # Built once for databases that had payments before the rollups existed
+    with db.engine.begin() as connection:
+        if connection.scalar(select(_rollups.c.period).limit(1)) is None and \
+                connection.scalar(select(Payment.id).where(Payment.status == 'Completed').limit(1)) is not None:
+            rebuild_revenue(connection)
+
+
+# Report queries
+def monthly_totals(first_month, last_month):
+    """[(month, payments, revenue)] for every month in the range, empty ones included."""
+    rows = db.session.execute(
+        select(_rollups.c.period_start, func.sum(_rollups.c.payments), func.sum(_rollups.c.revenue))
+        .where(_rollups.c.period == 'month',
+               _rollups.c.period_start >= first_month, _rollups.c.period_start <= last_month)
+        .group_by(_rollups.c.period_start)
+    ).all()
+    totals = {row[0]: (row[1], row[2]) for row in rows}
+    months = []
+    month = first_month
+    while month <= last_month:
+        payments, revenue = totals.get(month, (0, 0.0))
+        months.append((month, payments, revenue))
+        month = add_months(month, 1)
+    return months
+
+
+def daily_totals(month):
+    """[(day, payments, revenue)] for the days of the month that had payments."""
+    return [tuple(row) for row in db.session.execute(
+        select(_rollups.c.period_start, func.sum(_rollups.c.payments), func.sum(_rollups.c.revenue))
+        .where(_rollups.c.period == 'day',
+               _rollups.c.period_start >= month, _rollups.c.period_start < add_months(month, 1))
+        .group_by(_rollups.c.period_start)
+        .order_by(_rollups.c.period_start)
+    )]
+
+
+def breakdown(month, dimension):
+    """{value: (payments, revenue)} of one month split by a dimension."""
+    column = _rollups.c[dimension]
+    return {
+        row[0]: (row[1], row[2])
+        for row in db.session.execute(
+            select(column, func.sum(_rollups.c.payments), func.sum(_rollups.c.revenue))
+            .where(_rollups.c.period == 'month', _rollups.c.period_start == month)
+            .group_by(column)
+        )
+    }
+
+
+# Payment listeners
+def _member_type(connection, member_id):
+    return connection.scalar(select(Member.membership_type).where(Member.id == member_id))
+
+
+@event.listens_for(Payment, 'before_insert')
+def payment_snapshot_type(mapper, connection, target):
+    if target.membership_type is None:
+        target.membership_type = _member_type(connection, target.member_id)
+
+
+@event.listens_for(Payment, 'before_update')
+def payment_resnapshot_type(mapper, connection, target):
+    old_member_id, new_member_id = _history(target, 'member_id')
+    if str(old_member_id) != str(new_member_id):
+        target.membership_type = _member_type(connection, new_member_id)
+
+
+def _values(target, index):
+    # Old (index 0) or new (index 1) values of the columns rollups depend on
+    return [_history(target, name)[index]
+            for name in ('status', 'amount', 'payment_date', 'membership_type', 'payment_method')]
+
+
+@event.listens_for(Payment, 'after_insert')
+def payment_inserted(mapper, connection, target):
+    deltas = {}
+    _contribution(deltas, 1, *_values(target, 1))
+    _apply(connection, deltas)
+
+
+@event.listens_for(Payment, 'after_update')
+def payment_updated(mapper, connection, target):
+    old, new = _values(target, 0), _values(target, 1)
+    if old == new:
+        return
+    deltas = {}
+    _contribution(deltas, -1, *old)
+    _contribution(deltas, 1, *new)
+    _apply(connection, deltas)
+
+
+@event.listens_for(Payment, 'after_delete')
+def payment_deleted(mapper, connection, target):
+    deltas = {}
+    _contribution(deltas, -1, *_values(target, 1))
+    _apply(connection, deltas)
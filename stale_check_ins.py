@@ -0,0 +1,63 @@
+import logging
+import time
+
+from sqlalchemy import bindparam, select, update
+
+from models import db, AttendanceRecord
+from occupancy import record_movements
+
+logger = logging.getLogger(__name__)
+
+
+def close_stale_check_ins(now, session_limit, chunk_size=1000):
+    """Check out every record that has been open for longer than
+    ``session_limit`` (a timedelta), as of ``now`` in gym local time.
+
+    The open records are found through the partial index on check_in WHERE
+    check_out IS NULL, oldest first, and closed ``chunk_size`` at a time with
+    one executemany UPDATE per chunk, each chunk in its own transaction. The
+    check-out is set to check_in + session_limit, i.e. the latest time the
+    member can still be assumed to have been in the gym, and the record is
+    flagged auto_checked_out.
+    """
+    started = time.perf_counter()
+    table = AttendanceRecord.__table__
+    cutoff = now - session_limit
+    result = {'closed': 0, 'chunks': 0}
+
+    close = (
+        update(table)
+        .where(table.c.id == bindparam('record_id'), table.c.check_out.is_(None))
+        .values(check_out=bindparam('closed_at'), auto_checked_out=True)
+    )
+    while True:
+        with db.engine.begin() as connection:
+            chunk = connection.execute(
+                select(table.c.id, table.c.check_in)
+                .where(table.c.check_out.is_(None), table.c.check_in < cutoff)
+                .order_by(table.c.check_in)
+                .limit(chunk_size)
+            ).all()
+            if not chunk:
+                break
+
+            params = [{'record_id': row.id, 'closed_at': row.check_in + session_limit} for row in chunk]
+            closed = connection.execute(close, params).rowcount
+            check_outs = [values['closed_at'] for values in params]
+            if closed != len(chunk):
+                # Some were checked out normally in the meantime
+                check_outs = list(connection.scalars(
+                    select(table.c.check_out).where(
+                        table.c.id.in_([row.id for row in chunk]), table.c.auto_checked_out.is_(True)
+                    )
+                ))
+            record_movements(connection, check_outs=check_outs)
+
+        result['chunks'] += 1
+        result['closed'] += len(check_outs)
+        if len(chunk) < chunk_size:
+            break
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info("Stale check-ins: %(closed)d closed in %(chunks)d chunks in %(seconds).3fs", result)
+    return result
@@ -5,7 +5,7 @@ document.addEventListener('DOMContentLoaded', function() {
     var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
         return new bootstrap.Tooltip(tooltipTriggerEl)
     });
-    
+
     // Auto-close alerts after 5 seconds
     setTimeout(function() {
         var alerts = document.querySelectorAll('.alert');
@@ -14,7 +14,7 @@ document.addEventListener('DOMContentLoaded', function() {
             bsAlert.close();
         });
     }, 5000);
-    
+
     // Confirm before deleting
     const deleteButtons = document.querySelectorAll('.btn-delete');
     deleteButtons.forEach(button => {
@@ -24,14 +24,14 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
-    
+
     // Form validation
     const forms = document.querySelectorAll('form');
     forms.forEach(form => {
         form.addEventListener('submit', function(e) {
             let isValid = true;
             const requiredFields = form.querySelectorAll('[required]');
-            
+
             requiredFields.forEach(field => {
                 if (!field.value.trim()) {
                     isValid = false;
@@ -40,7 +40,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     field.classList.remove('is-invalid');
                 }
             });
-            
+
             if (!isValid) {
                 e.preventDefault();
                 // Scroll to first invalid field
@@ -52,4 +52,116 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
-});
\ No newline at end of file
+
+
+    // Member pickers: type to search, pick with the mouse or arrow keys + Enter
+    document.querySelectorAll('.member-picker').forEach(initMemberPicker);
+});
+
+function initMemberPicker(picker) {
+    const hidden = picker.querySelector('input[name="member_id"]');
+    const input = picker.querySelector('input[type="text"]');
+    const list = picker.querySelector('.list-group');
+    let results = [];
+    let active = -1;
+    let timer = null;
+    let controller = null;
+
+    function hide() {
+        list.classList.add('d-none');
+        active = -1;
+    }
+
+    function render() {
+        list.innerHTML = '';
+        results.forEach((member, index) => {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'list-group-item list-group-item-action' + (index === active ? ' active' : '');
+            item.textContent = `${member.name} (#${member.id})`;
+            const detail = document.createElement('small');
+            detail.className = 'd-block ' + (index === active ? '' : 'text-muted');
+            detail.textContent = [member.email, member.phone, member.membership_type, member.status]
+                .filter(Boolean).join(' \u00b7 ');
+            item.appendChild(detail);
+            // mousedown so the choice lands before the input loses focus
+            item.addEventListener('mousedown', function(e) {
+                e.preventDefault();
+                choose(index);
+            });
+            list.appendChild(item);
+        });
+        list.classList.toggle('d-none', results.length === 0);
+    }
+
+    function choose(index) {
+        const member = results[index];
+        if (!member) {
+            return;
+        }
+        hidden.value = member.id;
+        input.value = member.name;
+        input.classList.remove('is-invalid');
+        hide();
+    }
+
+    function search() {
+        const query = input.value.trim();
+        if (!query) {
+            results = [];
+            render();
+            return;
+        }
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        const url = picker.dataset.searchUrl + '?q=' + encodeURIComponent(query);
+        fetch(url, { signal: controller.signal, headers: { 'Accept': 'application/json' } })
+            .then(response => response.ok ? response.json() : { data: [] })
+            .then(body => {
+                results = body.data;
+                active = results.length ? 0 : -1;
+                render();
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Member search failed', error);
+                }
+            });
+    }
+
+    input.addEventListener('input', function() {
+        // Typing invalidates the previous choice
+        hidden.value = '';
+        clearTimeout(timer);
+        timer = setTimeout(search, 200);
+    });
+
+    input.addEventListener('keydown', function(e) {
+        if (list.classList.contains('d-none')) {
+            return;
+        }
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            const step = e.key === 'ArrowDown' ? 1 : -1;
+            active = (active + step + results.length) % results.length;
+            render();
+        } else if (e.key === 'Enter') {
+            e.preventDefault();
+            choose(active);
+        } else if (e.key === 'Escape') {
+            hide();
+        }
+    });
+
+    input.addEventListener('blur', hide);
+
+    input.form.addEventListener('submit', function(e) {
+        if (!hidden.value) {
+            e.preventDefault();
+            input.classList.add('is-invalid');
+            input.focus();
+        }
+    });
+}
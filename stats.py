@@ -0,0 +1,173 @@
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, insert, select, update
+
+from models import (db, Member, FitnessClass, Payment, FeeReminder, AttendanceRecord,
+                    DashboardStats, DailyAttendance)
+from attendance_archive import attendance_tables
+
+# Materialized dashboard counters.
+#
+# The listeners below apply +/- deltas to the single DashboardStats row (and
+# the DailyAttendance row for the check-in day) on the flush connection, so
+# the counters commit or roll back together with the change that caused them.
+# Code that writes with Core bulk statements bypasses these listeners and must
+# call adjust_stats()/count_check_ins() itself. rebuild_dashboard_stats()
+# recomputes everything from scratch if the counters ever drift.
+
+STATS_ID = 1
+
+UNPAID_REMINDER_STATUSES = ('Pending', 'Sent')
+
+def _history(target, name):
+    # (old, new) values of an attribute inside an after_update listener
+    history = inspect(target).attrs[name].history
+    old = history.deleted[0] if history.deleted else getattr(target, name)
+    return old, getattr(target, name)
+
+def adjust_stats(connection, **deltas):
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = DashboardStats.__table__
+    result = connection.execute(
+        update(table)
+        .where(table.c.id == STATS_ID)
+        .values({name: table.c[name] + delta for name, delta in deltas.items()})
+    )
+    if result.rowcount == 0:
+        # No counters yet; counting now already includes the current change
+        rebuild_dashboard_stats(connection)
+
+def count_check_ins(connection, check_in_times, sign=1):
+    per_day = {}
+    for check_in in check_in_times:
+        day = check_in.date()
+        per_day[day] = per_day.get(day, 0) + sign
+
+    table = DailyAttendance.__table__
+    for day, delta in per_day.items():
+        result = connection.execute(
+            update(table)
+            .where(table.c.day == day)
+            .values(check_ins=table.c.check_ins + delta)
+        )
+        if result.rowcount == 0 and delta > 0:
+            connection.execute(insert(table).values(day=day, check_ins=delta))
+
+def rebuild_dashboard_stats(connection):
+    values = {
+        'total_members': connection.scalar(select(func.count()).select_from(Member.__table__)),
+        'total_classes': connection.scalar(select(func.count()).select_from(FitnessClass.__table__)),
+        'total_payments': connection.scalar(select(func.count()).select_from(Payment.__table__)),
+        'total_revenue': connection.scalar(
+            select(func.coalesce(func.sum(Payment.__table__.c.amount), 0))
+            .where(Payment.__table__.c.status == 'Completed')
+        ),
+        'pending_reminders': connection.scalar(
+            select(func.count()).select_from(FeeReminder.__table__)
+            .where(FeeReminder.__table__.c.status.in_(UNPAID_REMINDER_STATUSES))
+        ),
+        'rebuilt_at': datetime.utcnow(),
+    }
+    table = DashboardStats.__table__
+    if connection.execute(update(table).where(table.c.id == STATS_ID).values(values)).rowcount == 0:
+        connection.execute(insert(table).values(id=STATS_ID, **values))
+
+    # Per-day check-in counts, archived months included; this is the only
+    # full scan and only runs here
+    daily = {}
+    for attendance in attendance_tables(connection):
+        check_in_day = func.date(attendance.c.check_in)
+        for row in connection.execute(select(check_in_day, func.count()).group_by(check_in_day)):
+            key = datetime.strptime(str(row[0]), '%Y-%m-%d').date()
+            daily[key] = daily.get(key, 0) + row[1]
+    connection.execute(DailyAttendance.__table__.delete())
+    if daily:
+        connection.execute(insert(DailyAttendance.__table__), [
+            {'day': day, 'check_ins': check_ins} for day, check_ins in sorted(daily.items())
+        ])
+    return values
+
+def ensure_dashboard_stats():
+    with db.engine.begin() as connection:
+        table = DashboardStats.__table__
+        if connection.scalar(select(table.c.id).where(table.c.id == STATS_ID)) is None:
+            rebuild_dashboard_stats(connection)
+
+def read_dashboard_stats(today):
+    stats = db.session.get(DashboardStats, STATS_ID)
+    if stats is None:
+        ensure_dashboard_stats()
+        stats = db.session.get(DashboardStats, STATS_ID)
+    daily = db.session.get(DailyAttendance, today)
+    return stats, daily.check_ins if daily else 0
+
+# Members
+@event.listens_for(Member, 'after_insert')
+def member_inserted(mapper, connection, target):
+    adjust_stats(connection, total_members=1)
+
+@event.listens_for(Member, 'after_delete')
+def member_deleted(mapper, connection, target):
+    adjust_stats(connection, total_members=-1)
+
+# Classes
+@event.listens_for(FitnessClass, 'after_insert')
+def class_inserted(mapper, connection, target):
+    adjust_stats(connection, total_classes=1)
+
+@event.listens_for(FitnessClass, 'after_delete')
+def class_deleted(mapper, connection, target):
+    adjust_stats(connection, total_classes=-1)
+
+# Payments; only Completed payments count as revenue
+def _revenue(status, amount):
+    return (amount or 0) if status == 'Completed' else 0
+
+@event.listens_for(Payment, 'after_insert')
+def payment_inserted(mapper, connection, target):
+    adjust_stats(connection, total_payments=1, total_revenue=_revenue(target.status, target.amount))
+
+@event.listens_for(Payment, 'after_update')
+def payment_updated(mapper, connection, target):
+    old_status, new_status = _history(target, 'status')
+    old_amount, new_amount = _history(target, 'amount')
+    adjust_stats(connection, total_revenue=_revenue(new_status, new_amount) - _revenue(old_status, old_amount))
+
+@event.listens_for(Payment, 'after_delete')
+def payment_deleted(mapper, connection, target):
+    adjust_stats(connection, total_payments=-1, total_revenue=-_revenue(target.status, target.amount))
+
+# Fee reminders; pending_reminders counts the unpaid ones, sent or not
+@event.listens_for(FeeReminder, 'after_insert')
+def reminder_inserted(mapper, connection, target):
+    if target.status in UNPAID_REMINDER_STATUSES:
+        adjust_stats(connection, pending_reminders=1)
+
+@event.listens_for(FeeReminder, 'after_update')
+def reminder_updated(mapper, connection, target):
+    old_status, new_status = _history(target, 'status')
+    adjust_stats(connection, pending_reminders=(new_status in UNPAID_REMINDER_STATUSES) -
+                 (old_status in UNPAID_REMINDER_STATUSES))
+
+@event.listens_for(FeeReminder, 'after_delete')
+def reminder_deleted(mapper, connection, target):
+    if target.status in UNPAID_REMINDER_STATUSES:
+        adjust_stats(connection, pending_reminders=-1)
+
+# Attendance
+@event.listens_for(AttendanceRecord, 'after_insert')
+def attendance_inserted(mapper, connection, target):
+    count_check_ins(connection, [target.check_in])
+
+@event.listens_for(AttendanceRecord, 'after_update')
+def attendance_updated(mapper, connection, target):
+    old_check_in, new_check_in = _history(target, 'check_in')
+    if old_check_in != new_check_in:
+        count_check_ins(connection, [old_check_in], sign=-1)
+        count_check_ins(connection, [new_check_in])
+
+@event.listens_for(AttendanceRecord, 'after_delete')
+def attendance_deleted(mapper, connection, target):
+    count_check_ins(connection, [target.check_in], sign=-1)
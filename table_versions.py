@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+
+from models import db, TableVersion
+
+# Per-table change counters.
+#
+# Every INSERT, UPDATE or DELETE statement that changes rows of a versioned
+# table bumps that table's TableVersion row on the same connection, so the
+# bump commits or rolls back with the change. This is an engine-level
+# after_execute listener, which sees ORM flushes and Core bulk statements
+# alike (the attendance writer, sweepers, imports, jobs); only raw text() SQL
+# goes unnoticed. The first write to a table in a transaction bumps it, later
+# ones in the same transaction don't need to.
+#
+# A reader that has the versions of the tables behind a response knows the
+# response is unchanged without running its query, see api.py.
+
+VERSIONED_TABLES = {'member', 'fitness_class', 'payment', 'attendance_record', 'fee_reminder'}
+
+_versions = TableVersion.__table__
+
+
+def bump_version(connection, name):
+    now = datetime.utcnow()
+    result = connection.execute(
+        update(_versions)
+        .where(_versions.c.table_name == name)
+        .values(version=_versions.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(_versions).values(table_name=name, version=1, updated_at=now))
+
+
+def ensure_table_versions():
+    # One row per table up front, so bumps are always a plain UPDATE
+    with db.engine.begin() as connection:
+        existing = set(connection.scalars(select(_versions.c.table_name)))
+        missing = VERSIONED_TABLES - existing
+        if missing:
+            now = datetime.utcnow()
+            connection.execute(insert(_versions), [
+                {'table_name': name, 'version': 0, 'updated_at': now} for name in sorted(missing)
+            ])
+
+
+def read_versions(names):
+    """{table: (version, updated_at)}; tables never written to are (0, None)."""
+    rows = db.session.execute(
+        select(_versions.c.table_name, _versions.c.version, _versions.c.updated_at)
+        .where(_versions.c.table_name.in_(names))
+    ).all()
+    versions = {name: (0, None) for name in names}
+    versions.update({row.table_name: (row.version, row.updated_at) for row in rows})
+    return versions
+
+
+@event.listens_for(Engine, 'after_execute')
+def statement_executed(connection, clauseelement, multiparams, params, execution_options, result):
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    name = getattr(clauseelement.table, 'name', None)
+    if name not in VERSIONED_TABLES or result.rowcount == 0:
+        return
+    bumped = connection.info.setdefault('bumped_tables', set())
+    if name not in bumped:
+        bumped.add(name)
+        bump_version(connection, name)
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def transaction_ended(connection):
+    connection.info.pop('bumped_tables', None)
+
+
+@event.listens_for(Engine, 'rollback_savepoint')
+def savepoint_rolled_back(connection, name, context):
+    # The bumps made inside the savepoint are gone too
+    connection.info.pop('bumped_tables', None)
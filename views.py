@@ -0,0 +1,1268 @@
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, send_from_directory, abort
+from flask_login import login_user, login_required, logout_user, current_user
+from models import db, User, Member, FitnessClass, ClassRegistration, Payment, FeeReminder, calculate_membership_fee, AttendanceDevice, AttendanceRecord, WaitlistEntry, ClassException, ClassOccurrence, JobRun, Notification
+import registrations as registration_engine
+import recurrence
+from conflicts import save_window, find_conflicts, sweep_conflicts, describe_conflict
+from pagination import keyset_paginate, encode_cursor
+from attendance_writer import AttendanceWriter
+from member_cache import member_cache
+from member_import import import_members
+from exports import FORMATS, select_columns, export_statement, stream_export
+from stats import read_dashboard_stats
+from gym_time import (gym_now, gym_today, period_bounds, in_period, parse_date_range, filter_date_range,
+                      parse_device_timestamp, device_timestamp_refusal)
+import occupancy
+import attendance_archive
+import device_sync
+import revenue
+import jobs
+import notifications
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta, time
+import io
+import os
+
+# All pages and API endpoints, registered on the app by create_app()
+bp = Blueprint('main', __name__)
+
+# Authentication routes
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    # If user is already logged in, redirect to dashboard
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+        
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        user = User.query.filter_by(username=username).first()
+        
+        if user and user.check_password(password):
+            login_user(user)
+            next_page = request.args.get('next')
+            return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
+        else:
+            flash('Invalid username or password', 'danger')
+    
+    return render_template('login.html')
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    flash('You have been logged out successfully', 'info')
+    return redirect(url_for('main.login'))
+
+# Main routes
+@bp.route('/')
+@login_required
+def dashboard():
+    # Counters are maintained incrementally by the listeners in stats.py
+    stats, today_attendance = read_dashboard_stats(gym_today())
+    recent_payments = Payment.query.options(joinedload(Payment.member)).order_by(
+        Payment.payment_date.desc(), Payment.id.desc()
+    ).limit(5).all()
+    
+    return render_template('dashboard.html', 
+                         total_members=stats.total_members,
+                         total_classes=stats.total_classes,
+                         total_payments=stats.total_payments,
+                         total_revenue=stats.total_revenue,
+                         pending_reminders=stats.pending_reminders,
+                         today_attendance=today_attendance,
+                         recent_payments=recent_payments)
+
+# Member management routes
+@bp.route('/members')
+@login_required
+def members():
+    page = keyset_paginate(
+        Member.query, [Member.id],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=current_app.config['LIST_PAGE_SIZE']
+    )
+    return render_template('members.html', members=page, page=page)
+
+@bp.route('/add_member', methods=['GET', 'POST'])
+@login_required
+def add_member():
+    if request.method == 'POST':
+        first_name = request.form['first_name']
+        last_name = request.form['last_name']
+        email = request.form['email']
+        phone = request.form['phone']
+        dob_str = request.form['dob']
+        membership_type = request.form['membership_type']
+        
+        # Handle date conversion
+        dob = None
+        if dob_str:
+            try:
+                dob = datetime.strptime(dob_str, '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid date format', 'danger')
+                return render_template('add_member.html')
+        
+        # Check if email already exists
+        if Member.query.filter_by(email=email).first():
+            flash('A member with this email already exists', 'danger')
+            return render_template('add_member.html')
+        
+        new_member = Member(
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            phone=phone,
+            date_of_birth=dob,
+            membership_type=membership_type
+        )
+        
+        try:
+            db.session.add(new_member)
+            db.session.commit()
+            flash('Member added successfully!', 'success')
+            return redirect(url_for('main.members'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error adding member: ' + str(e), 'danger')
+    
+    return render_template('add_member.html')
+
+@bp.route('/import_members', methods=['GET', 'POST'])
+@login_required
+def import_members_upload():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file', 'danger')
+            return render_template('import_members.html')
+        
+        # Rejected rows go to a report file the user can download afterwards
+        report_dir = os.path.join(current_app.instance_path, 'import_reports')
+        os.makedirs(report_dir, exist_ok=True)
+        report_name = f"rejected-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv"
+        
+        try:
+            with open(os.path.join(report_dir, report_name), 'w', newline='', encoding='utf-8') as report:
+                result = import_members(
+                    io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''),
+                    report=report,
+                    chunk_size=current_app.config['IMPORT_CHUNK_SIZE']
+                )
+        except (ValueError, UnicodeDecodeError) as e:
+            flash('Error importing members: ' + str(e), 'danger')
+            return render_template('import_members.html')
+        
+        flash(f'Imported {result.imported} of {result.read} members '
+              f'({result.rows_per_second:,.0f} rows/s)', 'success' if not result.rejected else 'warning')
+        return render_template('import_members.html', result=result,
+                               report_name=report_name if result.rejected else None)
+    
+    return render_template('import_members.html')
+
+@bp.route('/import_members/report/<path:name>')
+@login_required
+def import_members_report(name):
+    return send_from_directory(os.path.join(current_app.instance_path, 'import_reports'), name, as_attachment=True)
+
+@bp.route('/edit_member/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_member(id):
+    member = Member.query.get_or_404(id)
+    
+    if request.method == 'POST':
+        member.first_name = request.form['first_name']
+        member.last_name = request.form['last_name']
+        member.email = request.form['email']
+        member.phone = request.form['phone']
+        
+        # Handle date conversion
+        dob_str = request.form['dob']
+        if dob_str:
+            try:
+                member.date_of_birth = datetime.strptime(dob_str, '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid date format', 'danger')
+                return render_template('edit_member.html', member=member)
+        
+        member.membership_type = request.form['membership_type']
+        member.status = request.form['status']
+        
+        try:
+            db.session.commit()
+            flash('Member updated successfully!', 'success')
+            return redirect(url_for('main.members'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error updating member: ' + str(e), 'danger')
+    
+    return render_template('edit_member.html', member=member)
+
+@bp.route('/delete_member/<int:id>')
+@login_required
+def delete_member(id):
+    member = Member.query.get_or_404(id)
+    
+    # Check if member has payments or registrations
+    if member.payments or member.registrations or member.fee_reminders or member.attendance_records:
+        flash('Cannot delete member with associated payments, class registrations, fee reminders, or attendance records', 'danger')
+        return redirect(url_for('main.members'))
+    
+    try:
+        WaitlistEntry.query.filter_by(member_id=member.id).delete()
+        db.session.delete(member)
+        db.session.commit()
+        flash('Member deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error deleting member: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.members'))
+
+# Class management routes
+@bp.route('/classes')
+@login_required
+def classes():
+    page = keyset_paginate(
+        FitnessClass.query, [FitnessClass.id],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=current_app.config['LIST_PAGE_SIZE']
+    )
+    
+    # Sessions of the selected week (?week=YYYY-MM-DD, any day of it)
+    week_day = gym_today()
+    if request.args.get('week'):
+        try:
+            week_day = datetime.strptime(request.args['week'], '%Y-%m-%d').date()
+        except ValueError:
+            flash('Invalid week, showing the current week', 'warning')
+    week_start, week_end = period_bounds(week_day, 'week')
+    sessions = list(recurrence.timetable(week_start, week_end))
+    conflicting = set()
+    for conflict in sweep_conflicts(sessions):
+        conflicting.update((conflict.session, conflict.other))
+    
+    return render_template('classes.html', classes=page, page=page, sessions=sessions, conflicting=conflicting,
+                           week_start=week_start, describe_recurrence=recurrence.describe_recurrence,
+                           prev_week=(week_start - timedelta(days=7)).strftime('%Y-%m-%d'),
+                           next_week=(week_start + timedelta(days=7)).strftime('%Y-%m-%d'))
+
+def parse_recurrence(form):
+    # Returns (repeat_weekdays, repeat_interval, repeat_until) or raises ValueError
+    repeat_weekdays = recurrence.format_weekdays(form.getlist('repeat_days'))
+    repeat_interval = int(form.get('repeat_interval') or 1)
+    if repeat_interval < 1:
+        raise ValueError('Repeat interval must be at least 1 week')
+    repeat_until = None
+    if form.get('repeat_until'):
+        repeat_until = datetime.strptime(form['repeat_until'], '%Y-%m-%d').date()
+    return repeat_weekdays, repeat_interval, repeat_until
+
+def flash_conflicts(fitness_class):
+    # Flashes instructor/room double bookings of the class; True if there are any
+    with db.session.no_autoflush:
+        conflicts = find_conflicts(fitness_class, *save_window(fitness_class, gym_today()))
+    if not conflicts:
+        return False
+    messages = [describe_conflict(conflict) for conflict in conflicts[:5]]
+    if len(conflicts) > 5:
+        messages.append(f'and {len(conflicts) - 5} more')
+    flash('Schedule conflict: ' + '; '.join(messages), 'danger')
+    return True
+
+@bp.route('/add_class', methods=['GET', 'POST'])
+@login_required
+def add_class():
+    if request.method == 'POST':
+        name = request.form['name']
+        description = request.form['description']
+        instructor = request.form['instructor']
+        room = request.form.get('room', '').strip() or None
+        schedule_str = request.form['schedule']
+        duration = request.form['duration']
+        capacity = request.form['capacity']
+        
+        # Handle datetime conversion
+        try:
+            schedule = datetime.strptime(schedule_str, '%Y-%m-%dT%H:%M')
+        except ValueError:
+            flash('Invalid datetime format', 'danger')
+            return render_template('add_class.html')
+        
+        try:
+            repeat_weekdays, repeat_interval, repeat_until = parse_recurrence(request.form)
+        except ValueError as e:
+            flash('Invalid repeat settings: ' + str(e), 'danger')
+            return render_template('add_class.html')
+        
+        new_class = FitnessClass(
+            name=name,
+            description=description,
+            instructor=instructor,
+            room=room,
+            schedule=schedule,
+            duration=int(duration),
+            capacity=int(capacity),
+            repeat_weekdays=repeat_weekdays,
+            repeat_interval=repeat_interval,
+            repeat_until=repeat_until
+        )
+        
+        if flash_conflicts(new_class):
+            return render_template('add_class.html')
+        
+        try:
+            db.session.add(new_class)
+            db.session.commit()
+            flash('Class added successfully!', 'success')
+            return redirect(url_for('main.classes'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error adding class: ' + str(e), 'danger')
+    
+    return render_template('add_class.html')
+
+@bp.route('/edit_class/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_class(id):
+    fitness_class = FitnessClass.query.get_or_404(id)
+    
+    if request.method == 'POST':
+        fitness_class.name = request.form['name']
+        fitness_class.description = request.form['description']
+        fitness_class.instructor = request.form['instructor']
+        fitness_class.room = request.form.get('room', '').strip() or None
+        
+        # Handle datetime conversion
+        schedule_str = request.form['schedule']
+        try:
+            fitness_class.schedule = datetime.strptime(schedule_str, '%Y-%m-%dT%H:%M')
+        except ValueError:
+            flash('Invalid datetime format', 'danger')
+            return render_template('edit_class.html', fitness_class=fitness_class)
+        
+        try:
+            repeat_weekdays, repeat_interval, repeat_until = parse_recurrence(request.form)
+        except ValueError as e:
+            flash('Invalid repeat settings: ' + str(e), 'danger')
+            return render_template('edit_class.html', fitness_class=fitness_class)
+        
+        fitness_class.duration = int(request.form['duration'])
+        fitness_class.capacity = int(request.form['capacity'])
+        fitness_class.repeat_weekdays = repeat_weekdays
+        fitness_class.repeat_interval = repeat_interval
+        fitness_class.repeat_until = repeat_until
+        
+        if flash_conflicts(fitness_class):
+            return render_template('edit_class.html', fitness_class=fitness_class)
+        
+        try:
+            db.session.commit()
+            flash('Class updated successfully!', 'success')
+            # A raised capacity frees seats for waitlisted members
+            promoted = registration_engine.fill_from_waitlist(fitness_class.id)
+            if promoted:
+                flash(f'{len(promoted)} waitlisted member(s) moved into the class', 'info')
+            return redirect(url_for('main.classes'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error updating class: ' + str(e), 'danger')
+    
+    return render_template('edit_class.html', fitness_class=fitness_class)
+
+@bp.route('/delete_class/<int:id>')
+@login_required
+def delete_class(id):
+    fitness_class = FitnessClass.query.get_or_404(id)
+    
+    # Check if class has registrations
+    if fitness_class.registrations:
+        flash('Cannot delete class with registered members', 'danger')
+        return redirect(url_for('main.classes'))
+    
+    # Sessions that attendance records point at are kept
+    if ClassOccurrence.query.filter_by(class_id=fitness_class.id).first():
+        flash('Cannot delete class with recorded attendance', 'danger')
+        return redirect(url_for('main.classes'))
+    
+    try:
+        WaitlistEntry.query.filter_by(class_id=fitness_class.id).delete()
+        ClassException.query.filter_by(class_id=fitness_class.id).delete()
+        db.session.delete(fitness_class)
+        db.session.commit()
+        flash('Class deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error deleting class: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.classes'))
+
+@bp.route('/cancel_occurrence/<int:class_id>', methods=['POST'])
+@login_required
+def cancel_occurrence(class_id):
+    fitness_class = FitnessClass.query.get_or_404(class_id)
+    try:
+        starts_at = datetime.fromisoformat(request.form['start'])
+    except (KeyError, ValueError):
+        abort(400)
+    
+    # Only sessions the schedule actually produces can be cancelled
+    if not recurrence.is_occurrence(fitness_class, starts_at):
+        flash('No such session for this class', 'danger')
+        return redirect(url_for('main.classes', week=starts_at.strftime('%Y-%m-%d')))
+    
+    try:
+        recurrence.cancel_occurrence(class_id, starts_at)
+        db.session.commit()
+        flash(f"{fitness_class.name} on {starts_at.strftime('%Y-%m-%d %H:%M')} cancelled", 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error cancelling session: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.classes', week=starts_at.strftime('%Y-%m-%d')))
+
+# The member shown in a member picker: the one just posted or passed as
+# ?member_id=, else ``default``
+def picked_member(default=None):
+    member_id = request.values.get('member_id', type=int)
+    if member_id:
+        return db.session.get(Member, member_id) or default
+    return default
+
+# Payment management routes
+@bp.route('/payments')
+@login_required
+def payments():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.payments'))
+    query = filter_date_range(
+        Payment.query.options(joinedload(Payment.member)),
+        Payment.payment_date, start, end, utc=True
+    )
+    page = keyset_paginate(
+        query, [Payment.payment_date, Payment.id],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=current_app.config['LIST_PAGE_SIZE'], descending=True
+    )
+    filters = {key: request.args[key] for key in ('start', 'end') if request.args.get(key)}
+    return render_template('payments.html', payments=page, page=page, filters=filters)
+
+@bp.route('/add_payment', methods=['GET', 'POST'])
+@login_required
+def add_payment():
+    if request.method == 'POST':
+        member_id = request.form['member_id']
+        amount = request.form['amount']
+        payment_method = request.form['payment_method']
+        notes = request.form['notes']
+        
+        # Validate member exists
+        member = Member.query.get(member_id)
+        if not member:
+            flash('Invalid member selected', 'danger')
+            return redirect(url_for('main.add_payment'))
+        
+        new_payment = Payment(
+            member_id=member_id,
+            amount=float(amount),
+            payment_method=payment_method,
+            membership_type=member.membership_type,
+            notes=notes
+        )
+        
+        try:
+            db.session.add(new_payment)
+            db.session.commit()
+            flash('Payment recorded successfully!', 'success')
+            return redirect(url_for('main.payments'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error recording payment: ' + str(e), 'danger')
+    
+    return render_template('add_payment.html', selected_member=picked_member())
+
+@bp.route('/edit_payment/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_payment(id):
+    payment = Payment.query.get_or_404(id)
+    
+    if request.method == 'POST':
+        payment.member_id = request.form['member_id']
+        payment.amount = float(request.form['amount'])
+        payment.payment_method = request.form['payment_method']
+        payment.status = request.form['status']
+        payment.notes = request.form['notes']
+        
+        try:
+            db.session.commit()
+            flash('Payment updated successfully!', 'success')
+            return redirect(url_for('main.payments'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error updating payment: ' + str(e), 'danger')
+    
+    return render_template('edit_payment.html', payment=payment, selected_member=picked_member(payment.member))
+
+@bp.route('/delete_payment/<int:id>')
+@login_required
+def delete_payment(id):
+    payment = Payment.query.get_or_404(id)
+    
+    try:
+        db.session.delete(payment)
+        db.session.commit()
+        flash('Payment deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error deleting payment: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.payments'))
+
+# Class registration routes
+@bp.route('/class_registrations')
+@login_required
+def class_registrations():
+    page = keyset_paginate(
+        ClassRegistration.query.options(
+            joinedload(ClassRegistration.member),
+            joinedload(ClassRegistration.fitness_class)
+        ),
+        [ClassRegistration.id],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=current_app.config['LIST_PAGE_SIZE']
+    )
+    waitlist = WaitlistEntry.query.options(
+        joinedload(WaitlistEntry.member), joinedload(WaitlistEntry.fitness_class)
+    ).order_by(WaitlistEntry.class_id, WaitlistEntry.id).all()
+    return render_template('class_registrations.html', registrations=page, page=page, waitlist=waitlist)
+
+@bp.route('/register_member_class', methods=['GET', 'POST'])
+@login_required
+def register_member_class():
+    if request.method == 'POST':
+        try:
+            member_id = int(request.form['member_id'])
+            class_id = int(request.form['class_id'])
+        except ValueError:
+            flash('Invalid member or class selected', 'danger')
+            return redirect(url_for('main.register_member_class'))
+        
+        # Seats are claimed atomically, see registrations.py
+        try:
+            outcome = registration_engine.register_member(member_id, class_id)
+        except Exception as e:
+            flash('Error registering member for class: ' + str(e), 'danger')
+            return redirect(url_for('main.class_registrations'))
+        
+        messages = {
+            registration_engine.REGISTERED: ('Member registered for class successfully!', 'success'),
+            registration_engine.WAITLISTED: ('The class is full; member added to the waitlist', 'info'),
+            registration_engine.ALREADY_REGISTERED: ('This member is already registered for this class!', 'warning'),
+            registration_engine.ALREADY_WAITLISTED: ('This member is already on the waitlist for this class', 'warning'),
+            registration_engine.NOT_FOUND: ('Invalid member or class selected', 'danger'),
+        }
+        flash(*messages[outcome])
+        return redirect(url_for('main.class_registrations'))
+    
+    classes = FitnessClass.query.all()
+    return render_template('register_member_class.html', selected_member=picked_member(), classes=classes)
+
+@bp.route('/delete_registration/<int:id>')
+@login_required
+def delete_registration(id):
+    try:
+        deleted, promoted = registration_engine.cancel_registration(id)
+    except Exception as e:
+        flash('Error deleting registration: ' + str(e), 'danger')
+        return redirect(url_for('main.class_registrations'))
+    
+    if not deleted:
+        abort(404)
+    flash('Registration deleted successfully!', 'success')
+    if promoted:
+        flash(f'Member #{promoted} moved from the waitlist into the class', 'info')
+    return redirect(url_for('main.class_registrations'))
+
+@bp.route('/delete_waitlist_entry/<int:id>')
+@login_required
+def delete_waitlist_entry(id):
+    if registration_engine.remove_from_waitlist(id):
+        flash('Waitlist entry removed', 'success')
+    else:
+        flash('Waitlist entry not found', 'warning')
+    return redirect(url_for('main.class_registrations'))
+
+# Fee reminder routes
+@bp.route('/fee_reminders')
+@login_required
+def fee_reminders():
+    page = keyset_paginate(
+        FeeReminder.query.options(joinedload(FeeReminder.member)),
+        [FeeReminder.reminder_date, FeeReminder.id],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=current_app.config['LIST_PAGE_SIZE']
+    )
+    return render_template('fee_reminders.html', reminders=page, page=page)
+
+@bp.route('/mark_paid/<int:reminder_id>')
+@login_required
+def mark_paid(reminder_id):
+    reminder = FeeReminder.query.get_or_404(reminder_id)
+    reminder.status = 'Paid'
+    
+    try:
+        db.session.commit()
+        flash('Fee marked as paid successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error updating fee reminder: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.fee_reminders'))
+
+@bp.route('/add_fee_reminder/<int:member_id>', methods=['GET', 'POST'])
+@login_required
+def add_fee_reminder(member_id):
+    member = Member.query.get_or_404(member_id)
+    
+    if request.method == 'POST':
+        reminder_date = datetime.strptime(request.form['reminder_date'], '%Y-%m-%d').date()
+        amount = float(request.form['amount'])
+        notes = request.form['notes']
+        
+        new_reminder = FeeReminder(
+            member_id=member_id,
+            reminder_date=reminder_date,
+            amount=amount,
+            notes=notes,
+            status='Pending'
+        )
+        
+        try:
+            db.session.add(new_reminder)
+            db.session.commit()
+            flash('Fee reminder added successfully!', 'success')
+            return redirect(url_for('main.members'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error adding fee reminder: ' + str(e), 'danger')
+    
+    # Set default date to 30 days from now
+    default_date = (gym_now() + timedelta(days=30)).strftime('%Y-%m-%d')
+    default_amount = calculate_membership_fee(member.membership_type)
+    
+    return render_template('add_fee_reminder.html', member=member, default_date=default_date, default_amount=default_amount)
+
+@bp.route('/delete_reminder/<int:reminder_id>')
+@login_required
+def delete_reminder(reminder_id):
+    reminder = FeeReminder.query.get_or_404(reminder_id)
+    
+    try:
+        Notification.query.filter_by(fee_reminder_id=reminder.id).delete()
+        db.session.delete(reminder)
+        db.session.commit()
+        flash('Fee reminder deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error deleting fee reminder: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.fee_reminders'))
+
+# Attendance management routes
+@bp.route('/attendance')
+@login_required
+def attendance():
+    today = gym_today()
+    today_attendance = AttendanceRecord.query.options(joinedload(AttendanceRecord.member)).filter(
+        in_period(AttendanceRecord.check_in, today)
+    ).order_by(AttendanceRecord.check_in.desc()).all()
+    
+    return render_template('attendance.html', attendance_records=today_attendance, today=today)
+
+@bp.route('/attendance_history')
+@login_required
+def attendance_history():
+    # Seek pages over the live table and, further back, the monthly archives;
+    # ?date=YYYY-MM-DD jumps to that day
+    after = request.args.get('after')
+    jump_to = request.args.get('date')
+    if jump_to and not after and not request.args.get('before'):
+        try:
+            day = datetime.strptime(jump_to, '%Y-%m-%d').date()
+            after = encode_cursor([datetime.combine(day + timedelta(days=1), time.min), 0])
+        except ValueError:
+            flash('Dates must be YYYY-MM-DD', 'warning')
+    page = attendance_archive.history_page(
+        after=after, before=request.args.get('before'),
+        per_page=current_app.config['LIST_PAGE_SIZE']
+    )
+    return render_template('attendance_history.html', attendance_records=page, page=page, jump_to=jump_to)
+
+@bp.route('/check_in_biometric', methods=['POST'])
+def check_in_biometric():
+    if request.method == 'POST':
+        member_id = request.form.get('member_id')
+        
+        if not member_id:
+            return jsonify({'success': False, 'message': 'Member ID required'})
+        
+        try:
+            member = member_cache.get(int(member_id))
+        except ValueError:
+            member = None
+        if not member:
+            return jsonify({'success': False, 'message': 'Member not found'})
+        refusal = check_in_refusal(member)
+        if refusal:
+            return jsonify({'success': False, 'message': refusal})
+        device_id, refusal = check_in_device(request.form.get('device_id'))
+        if refusal:
+            return jsonify({'success': False, 'message': refusal})
+        
+        # Create attendance record
+        new_attendance = AttendanceRecord(
+            member_id=member_id,
+            device_id=device_id,
+            attendance_type='biometric',
+            check_in=gym_now()
+        )
+        
+        try:
+            db.session.add(new_attendance)
+            db.session.commit()
+            return jsonify({
+                'success': True, 
+                'message': f'Check-in recorded for {member.display_name}'
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+    
+    return jsonify({'success': False, 'message': 'Invalid request'})
+
+@bp.route('/check_in_code', methods=['POST'])
+def check_in_code():
+    if request.method == 'POST':
+        code = request.form.get('code')
+        
+        if not code:
+            return jsonify({'success': False, 'message': 'Code required'})
+        
+        # In a real system, you'd have a code-to-member mapping
+        # For demo purposes, let's assume code is the member ID
+        try:
+            member_id = int(code)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid code format'})
+        
+        member = member_cache.get(member_id)
+        refusal = check_in_refusal(member)
+        if refusal:
+            return jsonify({'success': False, 'message': refusal})
+        device_id, refusal = check_in_device(request.form.get('device_id'))
+        if refusal:
+            return jsonify({'success': False, 'message': refusal})
+        
+        # Create attendance record
+        new_attendance = AttendanceRecord(
+            member_id=member_id,
+            device_id=device_id,
+            attendance_type='code',
+            check_in=gym_now()
+        )
+        
+        try:
+            db.session.add(new_attendance)
+            db.session.commit()
+            return jsonify({
+                'success': True, 
+                'message': f'Check-in recorded for {member.display_name}'
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+    
+    return jsonify({'success': False, 'message': 'Invalid request'})
+
+def check_in_refusal(credential):
+    # Reason a check-in is refused, or None if the member may enter
+    if credential is None:
+        return 'Invalid code'
+    if credential.status != 'Active':
+        return f'Membership is {credential.status or "inactive"}'
+    return None
+
+def check_in_device(device_id):
+    # (device id, refusal) for the optional device_id of a terminal check-in;
+    # the device must send its sync key (Authorization: Bearer <key>)
+    if not device_id:
+        return None, None
+    try:
+        device = device_sync.authenticate_device(int(device_id), request.headers.get('Authorization'))
+    except ValueError:
+        return None, 'Unknown or inactive device'
+    except device_sync.SyncError as e:
+        return None, str(e)
+    return device.id, None
+
+def get_attendance_writer():
+    writer = current_app.extensions.get('attendance_writer')
+    if writer is None:
+        writer = AttendanceWriter(
+            current_app._get_current_object(),
+            batch_size=current_app.config['ATTENDANCE_WRITER_BATCH_SIZE'],
+            flush_interval=current_app.config['ATTENDANCE_WRITER_FLUSH_MS'] / 1000
+        )
+        current_app.extensions['attendance_writer'] = writer
+    return writer
+
+@bp.route('/api/attendance/batch', methods=['POST'])
+def attendance_batch():
+    # Body: {"events": [{"member_code": "42", "device_id": 1, "timestamp": "2024-05-01T07:00:03"}, ...]}
+    # Devices send their sync key (Authorization: Bearer <key>) and may only
+    # post their own events; without a key the caller must be logged in and
+    # events cannot name a device. A device's events may carry a "sequence"
+    # (numbered as for /api/devices/<id>/sync); those already stored are
+    # skipped, so a batch that timed out can be sent again.
+    device = None
+    if request.headers.get('Authorization'):
+        try:
+            device = device_sync.device_for_key(request.headers['Authorization'])
+        except device_sync.SyncError as e:
+            return jsonify({'success': False, 'message': str(e)}), e.status
+    elif not current_user.is_authenticated:
+        return jsonify({'success': False, 'message': 'Device key or login required'}), 401
+    
+    payload = request.get_json(silent=True)
+    events = payload.get('events') if isinstance(payload, dict) else payload
+    if not isinstance(events, list) or not events:
+        return jsonify({'success': False, 'message': 'events array required'}), 400
+    if len(events) > current_app.config['ATTENDANCE_BATCH_MAX_EVENTS']:
+        return jsonify({'success': False, 'message': 'Too many events in one batch'}), 413
+    
+    results = []
+    parsed = []
+    now = gym_now()
+    for index, device_event in enumerate(events):
+        try:
+            member_id = int(device_event['member_code'])
+            device_id = device_event.get('device_id')
+            device_id = int(device_id) if device_id is not None else None
+            check_in = parse_device_timestamp(device_event.get('timestamp'))
+            sequence = device_event.get('sequence')
+            sequence = int(sequence) if sequence is not None else None
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError, OSError):
+            results.append({'index': index, 'success': False, 'message': 'Invalid event'})
+            continue
+        if device is None and (device_id is not None or sequence is not None):
+            refusal = 'Device key required'
+        elif device is not None and device_id not in (None, device.id):
+            refusal = 'Event for another device'
+        else:
+            refusal = device_timestamp_refusal(check_in, now)
+        if refusal:
+            results.append({'index': index, 'success': False, 'message': refusal})
+            continue
+        results.append({'index': index, 'success': True})
+        parsed.append((index, member_id, check_in, sequence))
+    
+    # Members come from the credential cache
+    members = member_cache.get_many({member_id for _, member_id, _, _ in parsed})
+    device_id = device.id if device is not None else None
+    attendance_type = 'biometric' if device is not None and device.device_type == 'biometric' else 'code'
+    db.session.close()
+    
+    rows = []
+    for index, member_id, check_in, sequence in parsed:
+        refusal = check_in_refusal(members.get(member_id))
+        if refusal:
+            results[index] = {'index': index, 'success': False, 'message': refusal}
+        else:
+            rows.append({
+                'member_id': member_id,
+                'device_id': device_id,
+                'device_sequence': sequence,
+                'check_in': check_in,
+                'attendance_type': attendance_type
+            })
+    
+    try:
+        recorded = get_attendance_writer().submit(rows).result(timeout=30)
+    except Exception as e:
+        # After a timeout the rows may still be written; only sequenced
+        # events are safe to send again
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 503
+    
+    return jsonify({
+        'success': True,
+        'recorded': recorded,
+        'duplicates': len(rows) - recorded,
+        'rejected': len(events) - len(rows),
+        'results': results
+    })
+
+@bp.route('/api/devices/<int:device_id>/sync', methods=['POST'])
+def sync_device(device_id):
+    # Buffered check-ins up, allow-list changes down; see device_sync.py
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'message': 'JSON object required'}), 400
+    try:
+        device_sync.authenticate_device(device_id, request.headers.get('Authorization'))
+        events = device_sync.parse_events(payload.get('events'), current_app.config['DEVICE_SYNC_MAX_EVENTS'])
+        db.session.close()
+        applied = device_sync.apply_events(device_id, events)
+        delta = device_sync.member_delta(payload.get('since'), current_app.config['DEVICE_SYNC_PAGE_SIZE'])
+    except device_sync.SyncError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 503
+    return jsonify(dict(success=True, **applied, **delta))
+
+# Revenue report, read from the rollups only
+def percent_change(current, previous):
+    if not previous:
+        return None
+    return (current - previous) / previous * 100
+
+@bp.route('/reports/revenue')
+@login_required
+def revenue_report():
+    # ?month=YYYY-MM, default the current month
+    month = revenue.month_start(gym_today())
+    if request.args.get('month'):
+        try:
+            month = datetime.strptime(request.args['month'], '%Y-%m').date()
+        except ValueError:
+            flash('Invalid month, showing the current month', 'warning')
+    previous_month = revenue.add_months(month, -1)
+    
+    trend = revenue.monthly_totals(revenue.add_months(month, -12), month)
+    current, previous, last_year = trend[-1], trend[-2], trend[0]
+    breakdowns = {}
+    for dimension in revenue.DIMENSIONS:
+        this_month = revenue.breakdown(month, dimension)
+        last_month = revenue.breakdown(previous_month, dimension)
+        breakdowns[dimension] = [
+            (value or 'Unknown',) + this_month.get(value, (0, 0.0)) + (last_month.get(value, (0, 0.0))[1],)
+            for value in sorted(set(this_month) | set(last_month))
+        ]
+    
+    return render_template('revenue_report.html', month=month, trend=trend,
+                           current=current, previous=previous, last_year=last_year,
+                           month_change=percent_change(current[2], previous[2]),
+                           year_change=percent_change(current[2], last_year[2]),
+                           highest=max(row[2] for row in trend) or 1,
+                           breakdowns=breakdowns, days=revenue.daily_totals(month),
+                           prev_month=previous_month.strftime('%Y-%m'),
+                           next_month=revenue.add_months(month, 1).strftime('%Y-%m'))
+
+# Occupancy analytics, read from the pre-aggregated buckets only
+def occupancy_range(args, default_days):
+    start, end = parse_date_range(args)
+    if end is None:
+        end = datetime.combine(gym_today() + timedelta(days=1), time.min)
+    if start is None:
+        start = end - timedelta(days=default_days)
+    return start, end
+
+@bp.route('/analytics/occupancy')
+@login_required
+def occupancy_analytics():
+    try:
+        start, end = occupancy_range(request.args, 364)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.occupancy_analytics'))
+    now = gym_now()
+    grids = occupancy.heatmap(start, end)
+    busiest = sorted(
+        ((grids['average'][day][hour], day, hour) for day in range(7) for hour in range(24)),
+        reverse=True
+    )[:5]
+    today_start, today_end = period_bounds(now.date(), 'day')
+    today = [row for row in occupancy.occupancy_series(today_start, today_end) if row[0] <= now]
+    return render_template('occupancy.html', current=occupancy.current_occupancy(now), grids=grids,
+                           busiest=busiest, today=today, weekdays=recurrence.WEEKDAY_NAMES,
+                           start=start, end=end - timedelta(days=1))
+
+@bp.route('/api/analytics/occupancy')
+@login_required
+def occupancy_api():
+    # ?view=heatmap|series&start=YYYY-MM-DD&end=YYYY-MM-DD
+    view = request.args.get('view', 'heatmap')
+    try:
+        start, end = occupancy_range(request.args, 364 if view == 'heatmap' else 1)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if view == 'heatmap':
+        data = occupancy.heatmap(start, end)
+    elif view == 'series':
+        if end - start > timedelta(days=92):
+            return jsonify({'success': False, 'message': 'Series are limited to 92 days'}), 400
+        data = [
+            {'bucket_start': moment.isoformat(), 'check_ins': ins, 'check_outs': outs, 'occupancy': present}
+            for moment, ins, outs, present in occupancy.occupancy_series(start, end)
+        ]
+    else:
+        return jsonify({'success': False, 'message': 'Unknown view'}), 400
+    return jsonify({
+        'success': True,
+        'current': occupancy.current_occupancy(gym_now()),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        view: data
+    })
+
+@bp.route('/api/member_cache/stats')
+@login_required
+def member_cache_stats():
+    return jsonify(member_cache.stats())
+
+@bp.route('/check_out/<int:record_id>')
+@login_required
+def check_out(record_id):
+    attendance_record = AttendanceRecord.query.get_or_404(record_id)
+    
+    if attendance_record.check_out:
+        flash('Member already checked out', 'warning')
+    else:
+        attendance_record.check_out = gym_now()
+        db.session.commit()
+        flash('Check-out recorded successfully', 'success')
+    
+    return redirect(url_for('main.attendance'))
+
+@bp.route('/attendance_devices')
+@login_required
+def attendance_devices():
+    devices = AttendanceDevice.query.all()
+    return render_template('attendance_devices.html', devices=devices)
+
+@bp.route('/add_device', methods=['GET', 'POST'])
+@login_required
+def add_device():
+    if request.method == 'POST':
+        name = request.form['name']
+        device_type = request.form['device_type']
+        location = request.form['location']
+        
+        sync_key, sync_key_hash = device_sync.new_sync_key()
+        new_device = AttendanceDevice(
+            name=name,
+            device_type=device_type,
+            location=location,
+            sync_key_hash=sync_key_hash
+        )
+        
+        try:
+            db.session.add(new_device)
+            db.session.commit()
+            flash(f'Device added successfully! Its sync key, shown only this once: {sync_key}', 'success')
+            return redirect(url_for('main.attendance_devices'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error adding device: ' + str(e), 'danger')
+    
+    return render_template('add_device.html')
+
+@bp.route('/attendance_devices/<int:device_id>/sync_key', methods=['POST'])
+@login_required
+def reset_device_sync_key(device_id):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    device = AttendanceDevice.query.get_or_404(device_id)
+    sync_key, device.sync_key_hash = device_sync.new_sync_key()
+    db.session.commit()
+    flash(f'New sync key for {device.name}, shown only this once: {sync_key}', 'success')
+    return redirect(url_for('main.attendance_devices'))
+
+@bp.route('/manual_check_in', methods=['GET', 'POST'])
+@login_required
+def manual_check_in():
+    if request.method == 'POST':
+        member_id = request.form['member_id']
+        check_in_time = request.form['check_in_time']
+        notes = request.form['notes']
+        
+        try:
+            check_in_datetime = datetime.strptime(check_in_time, '%Y-%m-%dT%H:%M')
+        except ValueError:
+            flash('Invalid datetime format', 'danger')
+            return redirect(url_for('main.manual_check_in'))
+        
+        # Optional class session, as "<class_id>|<start isoformat>"
+        occurrence = None
+        if request.form.get('occurrence'):
+            try:
+                class_id, start = request.form['occurrence'].split('|', 1)
+                fitness_class = db.session.get(FitnessClass, int(class_id))
+                starts_at = datetime.fromisoformat(start)
+            except ValueError:
+                fitness_class = None
+            if fitness_class is None or not recurrence.is_occurrence(fitness_class, starts_at):
+                flash('Unknown class session', 'danger')
+                return redirect(url_for('main.manual_check_in'))
+            occurrence = recurrence.materialize_occurrence(fitness_class.id, starts_at)
+        
+        new_attendance = AttendanceRecord(
+            member_id=member_id,
+            attendance_type='manual',
+            check_in=check_in_datetime,
+            notes=notes,
+            occurrence=occurrence
+        )
+        
+        try:
+            db.session.add(new_attendance)
+            db.session.commit()
+            flash('Manual check-in recorded successfully!', 'success')
+            return redirect(url_for('main.attendance'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error recording check-in: ' + str(e), 'danger')
+    
+    sessions = list(recurrence.timetable(*period_bounds(gym_today(), 'day')))
+    return render_template('manual_check_in.html', selected_member=picked_member(), sessions=sessions)
+
+# Export routes
+@bp.route('/export/<any(payments, attendance):name>')
+@login_required
+def export(name):
+    # ?format=csv|ndjson&start=YYYY-MM-DD&end=YYYY-MM-DD&columns=id,amount,...
+    export_format = request.args.get('format', 'csv')
+    if export_format not in FORMATS:
+        return jsonify({'success': False, 'message': 'Unknown format'}), 400
+    try:
+        columns = select_columns(name, request.args.get('columns'))
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    statement = export_statement(name, columns, start, end)
+    
+    mimetype, extension = FORMATS[export_format]
+    filename = f"{name}-{gym_today().strftime('%Y%m%d')}.{extension}"
+    return Response(
+        stream_with_context(stream_export(
+            statement, columns, export_format, chunk_size=current_app.config['EXPORT_CHUNK_SIZE']
+        )),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Scheduled jobs (admin only)
+@bp.route('/admin/jobs')
+@login_required
+def admin_jobs():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    job = request.args.get('job')
+    runs = JobRun.query
+    if job:
+        runs = runs.filter_by(job=job)
+    scheduler = current_app.extensions.get('scheduler')
+    next_runs = {}
+    if scheduler is not None:
+        for scheduled in scheduler.get_jobs():
+            next_runs[scheduled.id] = scheduled.next_run_time
+    return render_template('admin_jobs.html', status=jobs.job_status(), next_runs=next_runs,
+                           runs=runs.order_by(JobRun.id.desc()).limit(50).all(), job=job,
+                           outbox=notifications.outbox_summary(), now=datetime.utcnow())
+
+@bp.route('/admin/jobs/<name>/run', methods=['POST'])
+@login_required
+def admin_run_job(name):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    if name not in jobs.JOBS:
+        abort(404)
+    
+    jobs.run_job_in_background(current_app._get_current_object(), name)
+    flash(f'{name} started; refresh to see the run', 'info')
+    return redirect(url_for('main.admin_jobs'))
+
+# User management routes (admin only)
+@bp.route('/users')
+@login_required
+def users():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    all_users = User.query.all()
+    return render_template('users.html', users=all_users)
+
+@bp.route('/add_user', methods=['GET', 'POST'])
+@login_required
+def add_user():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        role = request.form['role']
+        
+        # Check if username already exists
+        if User.query.filter_by(username=username).first():
+            flash('Username already exists', 'danger')
+            return render_template('add_user.html')
+        
+        new_user = User(username=username, role=role)
+        new_user.set_password(password)
+        
+        try:
+            db.session.add(new_user)
+            db.session.commit()
+            flash('User added successfully!', 'success')
+            return redirect(url_for('main.users'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error adding user: ' + str(e), 'danger')
+    
+    return render_template('add_user.html')
+
+@bp.route('/delete_user/<int:id>')
+@login_required
+def delete_user(id):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    
+    user = User.query.get_or_404(id)
+    
+    # Prevent deleting the current user
+    if user.id == current_user.id:
+        flash('Cannot delete your own account', 'danger')
+        return redirect(url_for('main.users'))
+    
+    try:
+        db.session.delete(user)
+        db.session.commit()
+        flash('User deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error deleting user: ' + str(e), 'danger')
+    
+    return redirect(url_for('main.users'))
+
+# Error handlers
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    return render_template('404.html'), 404
+
+@bp.app_errorhandler(500)
+def internal_error(error):
+    db.session.rollback()
+    return render_template('500.html'), 500